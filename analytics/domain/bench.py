@@ -0,0 +1,59 @@
+"""
+Memory benchmark for compact (slotted) domain models.
+
+Builds 100k View objects and reports the memory traced while they are
+alive, against an otherwise identical View model without compact=True.
+
+To run:
+
+	cd .../onboard_exercise/
+	python3 -m analytics.domain.bench
+"""
+import datetime
+import gc
+import tracemalloc
+
+from analytics.domain.models import View
+from auth.domain.models import User
+from blog.domain.models import Post
+from shared.domain.models import BaseDomainModel, DomainField
+
+
+class DictView(BaseDomainModel):
+	"""
+	View without compact=True, kept only as a baseline.
+	"""
+	pk = DomainField(dtype=int)
+	post = DomainField(dtype=Post, required=True)
+	user = DomainField(dtype=User, required=True)
+	viewed_at = DomainField(dtype=datetime.datetime)
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(self, *args, **kwargs)
+		self.viewed_at = datetime.datetime.now()
+
+
+def bench(model_cls, count: int = 100000) -> int:
+	"""
+	Returns bytes held by `count` instances of model_cls.
+	"""
+	user = User(username="reader", password="testpass", email="user@example.com",
+		first_name="First", last_name="Last", is_author=True)
+	post = Post(pk=1, title="Hello World", author=user, status='p')
+
+	gc.collect()
+	tracemalloc.start()
+	views = [model_cls(pk=pk, post=post, user=user) for pk in range(count)]
+	current, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del views
+	return current
+
+
+if __name__ == "__main__":
+	count = 100000
+	regular = bench(DictView, count)
+	compact = bench(View, count)
+	print("%d views, regular: %.1f MiB (%d bytes/view)" % (count, regular / 2**20, regular // count))
+	print("%d views, compact: %.1f MiB (%d bytes/view)" % (count, compact / 2**20, compact // count))
+	print("saved:             %.0f%%" % (100 - 100.0 * compact / regular))
@@ -0,0 +1,24 @@
+from typing import NamedTuple
+
+
+class ViewRecorded(NamedTuple):
+	"""
+	A view was recorded, pks only and packed as a struct in the event log
+	(see shared.infrastructure.event_log) as views are by far the most
+	frequent event.
+	"""
+	KIND = 3
+	FORMAT = '<qqd'
+
+	post_pk: int
+	user_pk: int
+	viewed_at: float  # unix seconds
+
+
+class ViewEvent(NamedTuple):
+	"""
+	A view waiting to be written, pks only so it costs one small tuple.
+	"""
+	post_pk: int
+	user_pk: int
+	viewed_at: float  # unix seconds
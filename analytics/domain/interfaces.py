@@ -0,0 +1,130 @@
+"""
+Interfaces of the analytics read structures, so application code can be
+handed any implementation (see analytics.infrastructure).
+"""
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Mapping, Tuple
+
+from analytics.domain.events import ViewEvent
+from analytics.domain.models import View
+
+
+class PopularPostsIndexInterface(ABC):
+	"""
+	View counts of posts, and the ranking of the eligible ones (eg.
+	published) by views.
+	"""
+
+	@abstractmethod
+	def __contains__(self, post_pk: int) -> bool:
+		"""
+		Whether post_pk is eligible for the ranking.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def view_count(self, post_pk: int) -> int:
+		raise NotImplementedError
+
+	@abstractmethod
+	def record_view(self, post_pk: int, count: int = 1):
+		raise NotImplementedError
+
+	@abstractmethod
+	def update_post(self, post):
+		"""
+		Tracks a created or updated Post's eligibility from its status.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def top(self, limit: int = 10) -> List[Tuple[int, int]]:
+		"""
+		Returns up to limit (post_pk, view count) pairs, most viewed first.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def rebuild(self, view_counts: Mapping[int, int], eligible_post_pks: Iterable[int]):
+		raise NotImplementedError
+
+
+class LastSeenIndexInterface(ABC):
+	"""
+	Filters repeat views of a post by the same user within a window.
+	"""
+
+	@abstractmethod
+	def should_record(self, user_pk: int, post_pk: int, now: float = None) -> bool:
+		"""
+		Returns True, marking the pair as seen now, unless it was seen
+		within the window.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def forget(self, user_pk: int, post_pk: int):
+		"""
+		Drops the pair, eg. when the view should_record allowed wasn't
+		stored.
+		"""
+		raise NotImplementedError
+
+
+class ViewPipelineInterface(ABC):
+	"""
+	Writes views in the background.
+	"""
+
+	@abstractmethod
+	def enqueue(self, post_pk: int, user_pk: int, viewed_at: float = None) -> bool:
+		"""
+		Queues a view, returning False if it was dropped.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def subscribe(self, callback: Callable[[List[ViewEvent]], None]):
+		"""
+		Calls callback with the events of every batch written from now on.
+		"""
+		raise NotImplementedError
+
+
+class ViewRollupsInterface(ABC):
+	"""
+	View counts of posts over time buckets.
+	"""
+
+	@abstractmethod
+	def update_post(self, post):
+		raise NotImplementedError
+
+	@abstractmethod
+	def record_view(self, post_pk: int, user_pk: int, viewed_at: float = None):
+		raise NotImplementedError
+
+	@abstractmethod
+	def top(self, days: int = 7, limit: int = 10) -> List[Tuple[int, int]]:
+		"""
+		Up to limit (post_pk, views) pairs of the eligible posts most
+		viewed over the last days.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def rebuild(self, posts: Iterable, views: Iterable[View]):
+		raise NotImplementedError
+
+
+class ViewArchiveInterface(ABC):
+	"""
+	Views moved out of the view repository.
+	"""
+
+	@abstractmethod
+	def count_by_posts(self, post_pks: Iterable[int]) -> Dict[int, int]:
+		"""
+		Returns {post_pk: archived view count} for each of post_pks.
+		"""
+		raise NotImplementedError
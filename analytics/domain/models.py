@@ -5,7 +5,7 @@ from auth.domain.models import User
 from blog.domain.models import Post
 
 
-class View(BaseDomainModel):
+class View(BaseDomainModel, compact=True):
 
 	pk = DomainField(dtype=int)
 	post = DomainField(dtype=Post, required=True)
@@ -13,5 +13,7 @@ class View(BaseDomainModel):
 	viewed_at = DomainField(dtype=datetime.datetime)
 
 	def __init__(self, *args, **kwargs):
+		# Defaulted before construction so it doesn't count as a change
+		if not kwargs.get('viewed_at'):
+			kwargs['viewed_at'] = datetime.datetime.now()
 		super().__init__(self, *args, **kwargs)
-		self.viewed_at = datetime.datetime.now()
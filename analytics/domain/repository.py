@@ -0,0 +1,86 @@
+import datetime
+from abc import abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from analytics.domain.models import View
+from shared.domain.repository import AsyncRepositoryInterface, RepositoryInterface
+
+
+class ViewRepositoryInterface(RepositoryInterface):
+
+	@abstractmethod
+	def add(self, view: View) -> View:
+		raise NotImplementedError
+
+	@abstractmethod
+	def get(self, pk: int) -> View:
+		raise NotImplementedError
+
+	@abstractmethod
+	def add_many(self, views: Iterable[View]) -> List[View]:
+		"""
+		Stores new views in one batch.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def list_by_post(self, post_pk: int) -> List[View]:
+		raise NotImplementedError
+
+	@abstractmethod
+	def count_by_post(self, post_pk: int) -> int:
+		raise NotImplementedError
+
+	@abstractmethod
+	def count_by_posts(self, post_pks: Iterable[int]) -> Dict[int, int]:
+		"""
+		Returns {post_pk: view count} for each of post_pks.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def get_last_viewed_at(self, user_pk: int, post_pk: int) -> Optional[datetime.datetime]:
+		"""
+		Returns when user_pk last viewed post_pk, None if they never have.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def list_rows_before(self, before: datetime.datetime,
+		limit: int) -> List[Tuple[int, int, int, datetime.datetime]]:
+		"""
+		Returns (pk, post_pk, user_pk, viewed_at) of up to limit of the
+		oldest views viewed before before, oldest first, without loading
+		posts or users. For archiving, see remove_many.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def remove_many(self, pks: Iterable[int]):
+		"""
+		Deletes the views with these pks. get_last_viewed_at still
+		accounts for them where it is cheap to.
+		"""
+		raise NotImplementedError
+
+
+class AsyncViewRepositoryInterface(AsyncRepositoryInterface):
+
+	@abstractmethod
+	async def add(self, view: View) -> View:
+		raise NotImplementedError
+
+	@abstractmethod
+	async def get(self, pk: int) -> View:
+		raise NotImplementedError
+
+	@abstractmethod
+	async def count_by_post(self, post_pk: int) -> int:
+		raise NotImplementedError
+
+	@abstractmethod
+	async def get_last_viewed_at(self, user_pk: int, post_pk: int) -> Optional[datetime.datetime]:
+		"""
+		Returns when user_pk last viewed post_pk, None if they never have.
+		"""
+		raise NotImplementedError
@@ -0,0 +1,357 @@
+"""
+Columnar archive of historical views.
+
+Views pile up much faster than posts, and a View row or object holding
+its post and user costs far more than the three numbers it records. Old
+views are moved out of the view repository (see compact_views) into a
+ViewArchive: a directory of segments, each holding one int64 column file
+per field, plus a manifest with per segment min/max indexes.
+
+	segments.json: {"byte_order": ..., "segments": [
+		{"name": ..., "views": ..., "post_pk": [min, max],
+		 "user_pk": [min, max], "viewed_at": [min, max]}, ...]}
+	<name>/post_pk.i64, user_pk.i64, viewed_at.i64: one value per view
+	<name>/run_post_pk.i64: the distinct post pks, ascending
+	<name>/run_start.i64: where each post's views start, plus the total
+
+viewed_at is stored in microseconds since the epoch. Within a segment
+views are sorted by (post_pk, viewed_at), so a post's views are one run
+of rows and its viewed_at values are sorted within it.
+
+Columns are memory-mapped and read as memoryviews cast to int64, which
+bisect searches in place: counting a post's views, over a time range or
+not, costs a few lookups per segment. Segments are skipped when their
+min/max index rules the query out, or counted whole when it covers
+them. Filtering on user_pk, the one unsorted column, searches the
+mapped file for the packed value (mmap.find), so only matches cost any
+Python work. No query turns rows into Python objects.
+"""
+import bisect
+import datetime
+import mmap
+import os
+import shutil
+import sys
+from array import array
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from analytics.domain.interfaces import ViewArchiveInterface
+from analytics.domain.repository import ViewRepositoryInterface
+from shared.domain.models import json_dumps, json_loads
+from shared.infrastructure.files import sync_directory
+
+MANIFEST_NAME = 'segments.json'
+COLUMN_SUFFIX = '.i64'
+COLUMNS = ('post_pk', 'user_pk', 'viewed_at')
+RUN_COLUMNS = ('run_post_pk', 'run_start')
+ITEM_SIZE = 8
+
+
+def to_microseconds(value: datetime.datetime) -> int:
+	return round(value.timestamp() * 1000000)
+
+
+def _count_value(mapped: mmap.mmap, value: int, start: int, stop: int) -> int:
+	"""
+	Occurrences of value in rows [start, stop) of a mapped int64 column.
+	Matches of its bytes that straddle two values are skipped.
+	"""
+	needle = value.to_bytes(ITEM_SIZE, sys.byteorder, signed=True)
+	count, position, end = 0, start * ITEM_SIZE, stop * ITEM_SIZE
+	while True:
+		position = mapped.find(needle, position, end)
+		if position < 0:
+			return count
+		if position % ITEM_SIZE:
+			position += 1
+		else:
+			count += 1
+			position += ITEM_SIZE
+
+
+class _Segment:
+	"""
+	The memory-mapped columns of one archive segment.
+	"""
+	def __init__(self, directory: str, entry: dict):
+		self.entry = entry
+		self.views = entry["views"]
+		# column name -> mmap
+		self.mapped = {}
+		self._views = []
+		try:
+			for name in COLUMNS + RUN_COLUMNS:
+				setattr(self, name, self._map(name, os.path.join(directory, name + COLUMN_SUFFIX)))
+		except Exception:
+			self.close()
+			raise
+
+	def _map(self, name: str, path: str) -> memoryview:
+		with open(path, 'rb') as column_file:
+			mapped = self.mapped[name] = mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ)
+		view = memoryview(mapped)
+		self._views.append(view)
+		view = view.cast('q')
+		self._views.append(view)
+		return view
+
+	def excludes(self, field: str, low: Optional[int], high: Optional[int]) -> bool:
+		"""
+		Whether no value of field is within [low, high] by the min/max index.
+		"""
+		minimum, maximum = self.entry[field]
+		return (low is not None and maximum < low) or (high is not None and minimum > high)
+
+	def within(self, field: str, low: Optional[int], high: Optional[int]) -> bool:
+		"""
+		Whether every value of field is within [low, high].
+		"""
+		minimum, maximum = self.entry[field]
+		return (low is None or minimum >= low) and (high is None or maximum <= high)
+
+	def post_run(self, post_pk: int) -> Tuple[int, int]:
+		"""
+		(start, stop) rows of post_pk's views, empty if it has none.
+		"""
+		run_post_pks = self.run_post_pk
+		index = bisect.bisect_left(run_post_pks, post_pk)
+		if index == len(run_post_pks) or run_post_pks[index] != post_pk:
+			return 0, 0
+		return self.run_start[index], self.run_start[index + 1]
+
+	def time_range(self, start: int, stop: int, low: Optional[int], high: Optional[int]) -> Tuple[int, int]:
+		"""
+		Narrows rows [start, stop) of one post to the views with viewed_at
+		in [low, high].
+		"""
+		viewed_at = self.viewed_at
+		if low is not None:
+			start = bisect.bisect_left(viewed_at, low, start, stop)
+		if high is not None:
+			stop = bisect.bisect_right(viewed_at, high, start, stop)
+		return start, stop
+
+	def runs(self) -> Iterator[Tuple[int, int, int]]:
+		"""
+		(post_pk, start, stop) of every post's views.
+		"""
+		run_start = self.run_start
+		for index, post_pk in enumerate(self.run_post_pk):
+			yield post_pk, run_start[index], run_start[index + 1]
+
+	def close(self):
+		for view in reversed(self._views):
+			view.release()
+		self._views = []
+		for mapped in self.mapped.values():
+			mapped.close()
+		self.mapped = {}
+
+
+class ViewArchive(ViewArchiveInterface):
+	"""
+	Append-only columnar store of (post_pk, user_pk, viewed_at) views, see
+	the module docstring for the layout.
+
+	- append writes a batch of views as a new segment
+	- count, count_by_posts and scan query them in place
+
+	Every append writes one segment, and queries cost a little per
+	segment, so views are best archived in large batches (compact_views
+	writes one segment per batch_size views).
+
+	Parameters
+	----------
+	directory: str
+		Where the manifest and segments are kept, created if missing
+	"""
+	def __init__(self, directory: str):
+		self.directory = directory
+		os.makedirs(directory, exist_ok=True)
+		manifest_path = os.path.join(directory, MANIFEST_NAME)
+		entries = []
+		if os.path.exists(manifest_path):
+			with open(manifest_path, 'rb') as manifest_file:
+				manifest = json_loads(manifest_file.read())
+			if manifest["byte_order"] != sys.byteorder:
+				raise ValueError("%s was written on a machine of another byte order" % directory)
+			entries = manifest["segments"]
+		self._segments = []
+		try:
+			for entry in entries:
+				self._segments.append(_Segment(os.path.join(directory, entry["name"]), entry))
+		except Exception:
+			self.close()
+			raise
+
+	def __enter__(self) -> 'ViewArchive':
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def __len__(self):
+		return sum(segment.views for segment in self._segments)
+
+	@property
+	def segment_count(self) -> int:
+		return len(self._segments)
+
+	def append(self, views: Iterable[Tuple[int, int, datetime.datetime]]) -> int:
+		"""
+		Archives (post_pk, user_pk, viewed_at) views as a new segment,
+		returning how many were written. The segment is written aside and
+		the manifest replaced after it, so a crash leaves the archive as
+		it was.
+		"""
+		rows = sorted((post_pk, to_microseconds(viewed_at), user_pk)
+			for post_pk, user_pk, viewed_at in views)
+		if not rows:
+			return 0
+		post_pks, viewed_at, user_pks = (array('q', column) for column in zip(*rows))
+		run_post_pks, run_starts = array('q'), array('q')
+		start = 0
+		for post_pk, run in groupby(post_pks):
+			run_post_pks.append(post_pk)
+			run_starts.append(start)
+			start += sum(1 for _ in run)
+		run_starts.append(start)
+		columns = {'post_pk': post_pks, 'user_pk': user_pks, 'viewed_at': viewed_at,
+			'run_post_pk': run_post_pks, 'run_start': run_starts}
+
+		name = "%020d" % (int(self._segments[-1].entry["name"]) + 1 if self._segments else 1)
+		path = os.path.join(self.directory, name)
+		temporary_path = path + '.tmp'
+		os.makedirs(temporary_path, exist_ok=True)
+		for column_name, values in columns.items():
+			with open(os.path.join(temporary_path, column_name + COLUMN_SUFFIX), 'wb') as column_file:
+				values.tofile(column_file)
+				column_file.flush()
+				os.fsync(column_file.fileno())
+		if os.path.exists(path):
+			# Left by an append that crashed before the manifest listed it
+			shutil.rmtree(path)
+		os.replace(temporary_path, path)
+
+		entry = {"name": name, "views": len(rows)}
+		entry.update((field, [min(columns[field]), max(columns[field])]) for field in COLUMNS)
+		segment = _Segment(path, entry)
+		self._write_manifest([existing.entry for existing in self._segments] + [entry])
+		self._segments.append(segment)
+		return len(rows)
+
+	def count(self, post_pk: int = None, user_pk: int = None,
+		start: datetime.datetime = None, end: datetime.datetime = None) -> int:
+		"""
+		Number of archived views matching every filter given: of post_pk,
+		by user_pk, viewed at start or later and before end.
+		"""
+		low, high = self._bounds(start, end)
+		total = 0
+		for segment in self._segments:
+			if segment.excludes('viewed_at', low, high) \
+					or (post_pk is not None and segment.excludes('post_pk', post_pk, post_pk)) \
+					or (user_pk is not None and segment.excludes('user_pk', user_pk, user_pk)):
+				continue
+			if post_pk is not None:
+				ranges = [segment.time_range(*segment.post_run(post_pk), low, high)]
+			elif segment.within('viewed_at', low, high):
+				ranges = [(0, segment.views)]
+			else:
+				ranges = [segment.time_range(run_start, run_stop, low, high)
+					for _, run_start, run_stop in segment.runs()]
+			if user_pk is None:
+				total += sum(stop - start for start, stop in ranges)
+			elif segment.within('user_pk', user_pk, user_pk):
+				total += sum(stop - start for start, stop in ranges)
+			else:
+				total += sum(_count_value(segment.mapped['user_pk'], user_pk, start, stop)
+					for start, stop in ranges if stop > start)
+		return total
+
+	def count_by_posts(self, post_pks: Iterable[int],
+		start: datetime.datetime = None, end: datetime.datetime = None) -> Dict[int, int]:
+		"""
+		Returns {post_pk: archived view count} for each of post_pks, like
+		ViewRepositoryInterface.count_by_posts.
+		"""
+		low, high = self._bounds(start, end)
+		counts = dict.fromkeys(post_pks, 0)
+		wanted = sorted(counts)
+		for segment in self._segments:
+			if segment.excludes('viewed_at', low, high) or not wanted:
+				continue
+			minimum, maximum = segment.entry['post_pk']
+			within = segment.within('viewed_at', low, high)
+			for post_pk in wanted[bisect.bisect_left(wanted, minimum):bisect.bisect_right(wanted, maximum)]:
+				run_start, run_stop = segment.post_run(post_pk)
+				if not within:
+					run_start, run_stop = segment.time_range(run_start, run_stop, low, high)
+				counts[post_pk] += run_stop - run_start
+		return counts
+
+	def scan(self, post_pk: int, start: datetime.datetime = None,
+		end: datetime.datetime = None) -> Iterator[Tuple[memoryview, memoryview]]:
+		"""
+		Yields (user_pk, viewed_at) column slices of post_pk's archived
+		views in the time range, one pair per segment holding some. The
+		slices are zero copy views of the mapped files: drop (or release)
+		them before closing the archive.
+		"""
+		low, high = self._bounds(start, end)
+		for segment in self._segments:
+			if segment.excludes('viewed_at', low, high) or segment.excludes('post_pk', post_pk, post_pk):
+				continue
+			run_start, run_stop = segment.time_range(*segment.post_run(post_pk), low, high)
+			if run_stop > run_start:
+				yield segment.user_pk[run_start:run_stop], segment.viewed_at[run_start:run_stop]
+
+	def close(self):
+		for segment in self._segments:
+			segment.close()
+		self._segments = []
+
+	#########
+	# Helpers
+	@staticmethod
+	def _bounds(start: Optional[datetime.datetime], end: Optional[datetime.datetime]
+		) -> Tuple[Optional[int], Optional[int]]:
+		"""
+		[start, end) as inclusive microsecond bounds.
+		"""
+		return (to_microseconds(start) if start is not None else None,
+			to_microseconds(end) - 1 if end is not None else None)
+
+	def _write_manifest(self, entries: List[dict]):
+		path = os.path.join(self.directory, MANIFEST_NAME)
+		temporary_path = path + '.tmp'
+		with open(temporary_path, 'w') as manifest_file:
+			manifest_file.write(json_dumps({"byte_order": sys.byteorder, "segments": entries}))
+			manifest_file.flush()
+			os.fsync(manifest_file.fileno())
+		os.replace(temporary_path, path)
+		sync_directory(self.directory)
+
+
+def compact_views(view_repository: ViewRepositoryInterface, archive: ViewArchive,
+	before: datetime.datetime, batch_size: int = 1000000) -> int:
+	"""
+	Moves the views older than before out of view_repository into
+	archive, oldest first, one archive segment per batch_size views.
+	Returns how many were moved.
+
+	Each batch is removed from the repository only once its segment is
+	written: a crash in between leaves the batch in both, to be counted
+	twice rather than lost.
+	"""
+	moved = 0
+	while True:
+		rows = view_repository.list_rows_before(before, batch_size)
+		if not rows:
+			return moved
+		archive.append((post_pk, user_pk, viewed_at) for _, post_pk, user_pk, viewed_at in rows)
+		view_repository.remove_many([pk for pk, _, _, _ in rows])
+		moved += len(rows)
+		if len(rows) < batch_size:
+			return moved
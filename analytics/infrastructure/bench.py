@@ -0,0 +1,232 @@
+"""
+Stress test for LastSeenIndex: millions of simulated reads from 100k
+users. Checks every decision against an unbounded reference dict and
+reports throughput and how many entries stay in memory.
+
+Also compares get_post_by_pk latency with a slow view store, writing
+views synchronously against queueing them on a ViewIngestionPipeline.
+
+With the `rollups` argument, instead feeds 2M views of 10k posts over
+8 days into ViewRollups and times range queries and "popular this
+week" against counting the raw views.
+
+With the `archive` argument, instead archives 20M views in 10 segments
+of a ViewArchive, times count queries over them and compares the space
+taken per view with the sqlite views table.
+
+To run:
+
+	cd .../onboard_exercise/
+	python3 -m analytics.infrastructure.bench [rollups|archive]
+"""
+import datetime
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from analytics.infrastructure import sqlite as analytics_sqlite
+from analytics.infrastructure.archive import ViewArchive
+from analytics.infrastructure.ingestion import ViewIngestionPipeline
+from analytics.infrastructure.last_seen import LastSeenIndex
+from analytics.infrastructure.memory import InMemoryViewRepository
+from analytics.infrastructure.rollups import DAY, HOUR, ViewRollups
+from auth.domain.models import User
+from auth.infrastructure.memory import InMemoryUserRepository
+from blog.domain.models import Category, Post
+from blog.infrastructure.memory import (InMemoryCategoryRepository,
+	InMemoryCommentRepository, InMemoryPostRepository)
+from blog.infrastructure.wiring import build_blog_service
+from shared.infrastructure.sqlite import connect
+
+READS = 3000000
+USERS = 100000
+POSTS = 10000
+# Simulated reads per second, so the run covers several view windows
+READS_PER_SECOND = 2000
+
+
+def simulate(reads: int = READS, users: int = USERS, posts: int = POSTS):
+	rng = random.Random(0)
+	window = datetime.timedelta(minutes=5)
+	index = LastSeenIndex(window, max_entries=2 * READS_PER_SECOND * int(window.total_seconds()))
+	reference = {}
+	window_seconds = window.total_seconds()
+
+	# Popular posts get most of the traffic
+	post_pks = [int(rng.paretovariate(1.2)) % posts for _ in range(reads)]
+	user_pks = [rng.randrange(users) for _ in range(reads)]
+
+	recorded = mismatches = max_entries = 0
+	start = time.perf_counter()
+	for i in range(reads):
+		now = i / READS_PER_SECOND
+		user_pk, post_pk = user_pks[i], post_pks[i]
+		record = index.should_record(user_pk, post_pk, now)
+		recorded += record
+		if i % 1000 == 0:
+			max_entries = max(max_entries, len(index))
+
+		last = reference.get((user_pk, post_pk))
+		expected = last is None or now - last > window_seconds
+		if expected:
+			reference[(user_pk, post_pk)] = now
+		mismatches += record != expected
+	elapsed = time.perf_counter() - start
+	return index, recorded, mismatches, max_entries, elapsed
+
+
+class SlowViewRepository(InMemoryViewRepository):
+	"""
+	A view store where every write round trip takes `delay` seconds.
+	"""
+	delay = 0.002
+
+	def add(self, view):
+		time.sleep(self.delay)
+		return super().add(view)
+
+	def add_many(self, views):
+		time.sleep(self.delay)
+		return [super(SlowViewRepository, self).add(view) for view in views]
+
+
+def read_latency(use_pipeline: bool, reads: int = 1000) -> float:
+	"""
+	Returns mean get_post_by_pk latency in ms, every read records a view.
+	"""
+	users, posts, views = InMemoryUserRepository(), InMemoryPostRepository(), SlowViewRepository()
+	for pk in range(reads + 1):
+		users.add(User(username="user%d" % pk, password="testpass", email="user@example.com",
+			first_name="First", last_name="Last", is_author=True))
+	post = posts.add(Post(title="Hello World", author=users.get(1)))
+
+	pipeline = ViewIngestionPipeline(views, posts, users) if use_pipeline else None
+	service = build_blog_service(InMemoryCommentRepository(), posts, views, users,
+		InMemoryCategoryRepository(), view_pipeline=pipeline)
+	start = time.perf_counter()
+	for user_pk in range(2, reads + 2):
+		service.get_post_by_pk(post.pk, user_pk=user_pk)
+	elapsed = time.perf_counter() - start
+	if pipeline is not None:
+		pipeline.close()
+		assert views.count_by_post(post.pk) == reads
+	return elapsed / reads * 1000
+
+
+def bench_rollups(views: int = 2000000, posts: int = POSTS, users: int = USERS):
+	rng = random.Random(0)
+	now = 1000 * DAY + 12 * HOUR
+	author = User(pk=1, username="author", password="testpass", email="user@example.com",
+		first_name="First", last_name="Last", is_author=True)
+	categories = [Category(pk=pk, name="Category %d" % pk) for pk in range(20)]
+	rollups = ViewRollups(clock=lambda: now)
+	for pk in range(1, posts + 1):
+		rollups.update_post(Post(pk=pk, title="Post", author=author, status='p',
+			category=categories[pk % len(categories)]))
+	records = sorted(((int(rng.paretovariate(1.2)) % posts + 1, rng.randrange(users),
+		now - rng.random() * 8 * DAY) for _ in range(views)), key=lambda record: record[2])
+
+	start = time.perf_counter()
+	rollups.record_views(records)
+	elapsed = time.perf_counter() - start
+	print("ingest: %.2f us per view, %d views" % (elapsed / views * 1e6, views))
+
+	def timed(label, func, *args, **kwargs):
+		gc.collect()
+		start = time.perf_counter()
+		result = func(*args, **kwargs)
+		print("%-38s %9.3f ms" % (label, (time.perf_counter() - start) * 1000))
+		return result
+
+	week = now - 6 * DAY - now % DAY
+	top = timed("popular this week, rollups:", rollups.top, 7)
+	counted = timed("popular this week, raw views:", lambda: Counter(
+		post_pk for post_pk, _, viewed_at in records if viewed_at >= week).most_common(10))
+	assert [views for _, views in top] == [views for _, views in counted]
+	timed("post views last 24h, hourly buckets:", rollups.views, top[0][0], now - DAY)
+	timed("category views this week:", rollups.category_views, 3, week, granularity=DAY)
+	timed("category unique viewers this week:", rollups.category_unique_viewers, 3, week)
+	timed("post views last 24h, raw views:", lambda: sum(1 for post_pk, _, viewed_at in records
+		if post_pk == top[0][0] and viewed_at >= now - DAY))
+	exact = len({user_pk for post_pk, user_pk, viewed_at in records
+		if post_pk % len(categories) == 3 and viewed_at >= week})
+	print("category unique viewers: estimate %d, exact %d" % (
+		rollups.category_unique_viewers(3, week), exact))
+
+
+def bench_archive(segments: int = 10, segment_views: int = 2000000, posts: int = POSTS,
+	users: int = USERS):
+	rng = random.Random(0)
+	start_time = datetime.datetime(2024, 1, 1)
+	with tempfile.TemporaryDirectory() as directory:
+		archive = ViewArchive(os.path.join(directory, "archive"))
+		elapsed = 0
+		for segment in range(segments):
+			# One segment a day
+			day = start_time + datetime.timedelta(days=segment)
+			views = [(int(rng.paretovariate(1.2)) % posts + 1, rng.randrange(users),
+				day + datetime.timedelta(seconds=rng.random() * 86400)) for _ in range(segment_views)]
+			start = time.perf_counter()
+			archive.append(views)
+			elapsed += time.perf_counter() - start
+		del views
+		total = len(archive)
+		print("archived %d views in %d segments: %.2f us per view" % (
+			total, archive.segment_count, elapsed / total * 1e6))
+
+		def timed(label, func, *args, **kwargs):
+			gc.collect()
+			start = time.perf_counter()
+			result = func(*args, **kwargs)
+			print("%-40s %9.3f ms  (%d)" % (label, (time.perf_counter() - start) * 1000, result))
+
+		middle = start_time + datetime.timedelta(days=segments // 2, hours=12)
+		timed("count, all:", archive.count)
+		# The most viewed post
+		timed("count, one post:", archive.count, post_pk=2)
+		timed("count, one post over 36 hours:", archive.count, post_pk=2,
+			start=middle - datetime.timedelta(hours=12), end=middle + datetime.timedelta(hours=24))
+		timed("count, all posts over 36 hours:", archive.count,
+			start=middle - datetime.timedelta(hours=12), end=middle + datetime.timedelta(hours=24))
+		timed("count, one user (scan):", archive.count, user_pk=7)
+		timed("count, one post and user:", archive.count, post_pk=2, user_pk=7)
+		timed("count_by_posts, every post:", lambda: sum(
+			archive.count_by_posts(range(1, posts + 1)).values()))
+		archive_size = sum(os.path.getsize(os.path.join(root, name))
+			for root, _, names in os.walk(archive.directory) for name in names)
+		archive.close()
+
+		path = os.path.join(directory, "views.db")
+		connection = connect(path)
+		# Only the views table is filled
+		connection.execute("PRAGMA foreign_keys = OFF")
+		analytics_sqlite.create_tables(connection)
+		with connection:
+			connection.executemany(analytics_sqlite.INSERT_VIEW, ((pk, rng.randrange(posts),
+				rng.randrange(users), (start_time + datetime.timedelta(seconds=pk)).isoformat())
+				for pk in range(1, segment_views + 1)))
+		connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+		connection.close()
+		print("bytes per view: archive %.1f, sqlite views table %.1f" % (
+			archive_size / total, os.path.getsize(path) / segment_views))
+
+
+if __name__ == "__main__" and sys.argv[1:] == ["rollups"]:
+	bench_rollups()
+elif __name__ == "__main__" and sys.argv[1:] == ["archive"]:
+	bench_archive()
+elif __name__ == "__main__":
+	print("get_post_by_pk with a %.0fms view store:" % (SlowViewRepository.delay * 1000))
+	print("  synchronous view writes: %.3f ms/read" % read_latency(False))
+	print("  ViewIngestionPipeline:   %.3f ms/read" % read_latency(True))
+
+	start = time.perf_counter()
+	index, recorded, mismatches, max_entries, elapsed = simulate()
+	print("%d reads, %d users: %d views recorded, %d mismatches against reference" % (
+		READS, USERS, recorded, mismatches))
+	print("entries held: max %d, final %d, evictions %d" % (max_entries, len(index), index.evictions))
+	print("%.2f us per read including the reference check" % (elapsed / READS * 1e6))
@@ -0,0 +1,175 @@
+import datetime
+import queue
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from analytics.domain.events import ViewEvent
+from analytics.domain.interfaces import ViewPipelineInterface
+from analytics.domain.models import View
+from analytics.domain.repository import ViewRepositoryInterface
+from auth.domain.repository import UserRepositoryInterface
+from blog.domain.repository import PostRepositoryInterface
+
+
+_STOP = object()
+
+
+class ViewIngestionPipeline(ViewPipelineInterface):
+	"""
+	Takes View writes off the read path: enqueue() returns at once and a
+	background thread writes views to the repository in batches.
+
+	- A batch is flushed when it reaches batch_size events or when
+	  flush_interval seconds have passed since its first event.
+	- The queue holds at most max_queue_size events. When it is full
+	  enqueue() waits up to enqueue_timeout seconds, then drops the event
+	  (counted in `dropped`) rather than stall the reader.
+	- close() stops accepting events and returns once everything queued
+	  has been written.
+	- Events whose post or user doesn't exist are left out of their batch
+	  (counted in `skipped`), the rest of it is still written.
+	- Callbacks passed to subscribe() get the events of every batch
+	  written, from the worker thread, eg. to count views only once they
+	  are stored.
+
+	The repositories are used from the worker thread, so they must allow
+	that (eg. a sqlite connection opened with check_same_thread=False).
+
+	Parameters
+	----------
+	view_repository: ViewRepositoryInterface
+		Where views are written, through add_many
+	post_repository: PostRepositoryInterface
+	user_repository: UserRepositoryInterface
+		Used to resolve event pks into the View's post and user
+	batch_size: int, default to 500
+	flush_interval: float, default to 0.5
+	max_queue_size: int, default to 100,000
+	enqueue_timeout: float, default to 0.01
+	"""
+	def __init__(self,
+		view_repository: ViewRepositoryInterface,
+		post_repository: PostRepositoryInterface,
+		user_repository: UserRepositoryInterface,
+		batch_size: int = 500,
+		flush_interval: float = 0.5,
+		max_queue_size: int = 100000,
+		enqueue_timeout: float = 0.01
+	):
+		self._view_repository = view_repository
+		self._post_repository = post_repository
+		self._user_repository = user_repository
+		self.batch_size = batch_size
+		self.flush_interval = flush_interval
+		self.enqueue_timeout = enqueue_timeout
+
+		self._queue = queue.Queue(maxsize=max_queue_size)
+		self._closed = False
+		self.written = 0
+		self.dropped = 0
+		self.skipped = 0
+		self.failed = 0
+		self.last_error = None
+		self._subscribers = []
+
+		self._worker = threading.Thread(target=self._run, name="view-ingestion", daemon=True)
+		self._worker.start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def enqueue(self, post_pk: int, user_pk: int, viewed_at: float = None) -> bool:
+		"""
+		Queues a view, returning False if it was dropped.
+		"""
+		if self._closed:
+			raise RuntimeError("Cannot enqueue views on a closed ViewIngestionPipeline.")
+		event = ViewEvent(post_pk, user_pk, time.time() if viewed_at is None else viewed_at)
+		try:
+			self._queue.put(event, timeout=self.enqueue_timeout)
+		except queue.Full:
+			self.dropped += 1
+			return False
+		return True
+
+	def subscribe(self, callback: Callable[[List[ViewEvent]], None]):
+		"""
+		Calls callback with the events of every batch written from now on.
+		"""
+		self._subscribers.append(callback)
+
+	def close(self, timeout: float = None):
+		"""
+		Drains all queued views to the repository, then stops the worker.
+		"""
+		if not self._closed:
+			self._closed = True
+			self._queue.put(_STOP)
+		self._worker.join(timeout)
+
+	def _run(self):
+		stopping = False
+		while not stopping:
+			event = self._queue.get()
+			if event is _STOP:
+				break
+			batch = [event]
+			deadline = time.monotonic() + self.flush_interval
+			while len(batch) < self.batch_size:
+				remaining = deadline - time.monotonic()
+				try:
+					event = self._queue.get(timeout=remaining) if remaining > 0 \
+						else self._queue.get_nowait()
+				except queue.Empty:
+					break
+				if event is _STOP:
+					stopping = True
+					break
+				batch.append(event)
+			self._flush(batch)
+
+		# Anything enqueued while stopping is still written
+		leftovers = []
+		while True:
+			try:
+				event = self._queue.get_nowait()
+			except queue.Empty:
+				break
+			if event is not _STOP:
+				leftovers.append(event)
+		for start in range(0, len(leftovers), self.batch_size):
+			self._flush(leftovers[start:start + self.batch_size])
+
+	def _flush(self, events: List[ViewEvent]):
+		try:
+			events, views = self._build_views(events)
+			self._view_repository.add_many(views)
+		except Exception as error:
+			self.failed += len(events)
+			self.last_error = error
+			return
+		self.written += len(events)
+		for callback in self._subscribers:
+			try:
+				callback(events)
+			except Exception as error:
+				self.last_error = error
+
+	def _build_views(self, events: List[ViewEvent]) -> Tuple[List[ViewEvent], List[View]]:
+		"""
+		Returns the events whose post and user exist, and their Views.
+		"""
+		posts = {post.pk: post for post in
+			self._post_repository.get_many({event.post_pk for event in events})}
+		users = {user.pk: user for user in
+			self._user_repository.get_many({event.user_pk for event in events})}
+		known = [event for event in events if event.post_pk in posts and event.user_pk in users]
+		self.skipped += len(events) - len(known)
+		return known, View.hydrate_many([
+			(None, posts[event.post_pk], users[event.user_pk],
+				datetime.datetime.fromtimestamp(event.viewed_at))
+			for event in known])
@@ -0,0 +1,151 @@
+import datetime
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+from analytics.domain.interfaces import LastSeenIndexInterface
+from analytics.domain.repository import ViewRepositoryInterface
+from shared.application.locks import StripedLock
+
+
+class LastSeenStoreInterface(ABC):
+	"""
+	Optional persistent backing for LastSeenIndex, consulted on a miss.
+	Timestamps are unix seconds.
+	"""
+
+	@abstractmethod
+	def get(self, user_pk: int, post_pk: int) -> Optional[float]:
+		raise NotImplementedError
+
+	@abstractmethod
+	def set(self, user_pk: int, post_pk: int, seen_at: float):
+		raise NotImplementedError
+
+	@abstractmethod
+	def delete(self, user_pk: int, post_pk: int):
+		raise NotImplementedError
+
+
+class ViewRepositoryLastSeenStore(LastSeenStoreInterface):
+	"""
+	Backs a LastSeenIndex with the view repository's own last view
+	lookup. Nothing needs writing, the recorded View is the record.
+	"""
+	def __init__(self, view_repository: ViewRepositoryInterface):
+		self._view_repository = view_repository
+
+	def get(self, user_pk: int, post_pk: int) -> Optional[float]:
+		viewed_at = self._view_repository.get_last_viewed_at(user_pk, post_pk)
+		return viewed_at.timestamp() if viewed_at is not None else None
+
+	def set(self, user_pk: int, post_pk: int, seen_at: float):
+		pass
+
+	def delete(self, user_pk: int, post_pk: int):
+		pass
+
+
+class LastSeenIndex(LastSeenIndexInterface):
+	"""
+	When each (user pk, post pk) pair last recorded a view, for the
+	"count a view at most once per window" rule in constant time.
+
+	Entries are kept in an OrderedDict in the order they were recorded,
+	which is also timestamp order, so:
+
+	- expired entries (older than the window) sit at the front and are
+	  dropped from there as new ones are recorded
+	- when max_entries is reached the least recently recorded entry is
+	  evicted (LRU)
+
+	On a miss the optional backing store is consulted, so evicted or
+	pre-restart entries are still honoured.
+
+	Thread safe: should_record checks and marks a pair under that pair's
+	stripe of a StripedLock, so two threads can't both record the same
+	view. The OrderedDict itself is changed under one short lock, the
+	backing store is called outside it.
+
+	Parameters
+	----------
+	window: datetime.timedelta
+		Repeat views inside this window are not recorded
+	max_entries: int, default to 1,000,000
+		Upper bound on entries held in memory
+	backing: LastSeenStoreInterface, optional
+		Persistent store read on misses and written on records
+	"""
+	def __init__(self, window: datetime.timedelta, max_entries: int = 1000000,
+		backing: LastSeenStoreInterface = None):
+		self.window = window.total_seconds()
+		self.max_entries = max_entries
+		self._backing = backing
+		self._seen = OrderedDict()
+		self.evictions = 0
+		self._lock = threading.Lock()
+		self._stripes = StripedLock()
+
+	def __len__(self):
+		return len(self._seen)
+
+	def last_seen(self, user_pk: int, post_pk: int, now: float = None) -> Optional[float]:
+		"""
+		Returns when the pair last recorded a view if that is still inside
+		the window, otherwise None.
+		"""
+		if now is None:
+			now = time.time()
+		seen_at = self._seen.get((user_pk, post_pk))
+		if seen_at is None and self._backing is not None:
+			seen_at = self._backing.get(user_pk, post_pk)
+		if seen_at is None or now - seen_at > self.window:
+			return None
+		return seen_at
+
+	def should_record(self, user_pk: int, post_pk: int, now: float = None) -> bool:
+		"""
+		Returns True, marking the pair as seen now, unless it was
+		already seen inside the window.
+		"""
+		if now is None:
+			now = time.time()
+		with self._stripes.lock_for((user_pk, post_pk)):
+			if self.last_seen(user_pk, post_pk, now) is not None:
+				return False
+			self.mark(user_pk, post_pk, now)
+		return True
+
+	def forget(self, user_pk: int, post_pk: int):
+		"""
+		Drops the pair, eg. when should_record returned True but the view
+		could not be stored after all, so the next view isn't suppressed.
+		"""
+		with self._stripes.lock_for((user_pk, post_pk)):
+			if self._backing is not None:
+				self._backing.delete(user_pk, post_pk)
+			with self._lock:
+				self._seen.pop((user_pk, post_pk), None)
+
+	def mark(self, user_pk: int, post_pk: int, seen_at: float):
+		if self._backing is not None:
+			self._backing.set(user_pk, post_pk, seen_at)
+
+		key = (user_pk, post_pk)
+		seen = self._seen
+		with self._lock:
+			seen.pop(key, None)
+			seen[key] = seen_at
+
+			# Expire from the front, then enforce the size bound
+			expires_before = seen_at - self.window
+			while seen:
+				oldest_key = next(iter(seen))
+				if seen[oldest_key] >= expires_before:
+					break
+				del seen[oldest_key]
+			while len(seen) > self.max_entries:
+				seen.popitem(last=False)
+				self.evictions += 1
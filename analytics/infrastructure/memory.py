@@ -0,0 +1,121 @@
+import datetime
+import heapq
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from analytics.domain.models import View
+from analytics.domain.repository import AsyncViewRepositoryInterface, ViewRepositoryInterface
+from shared.infrastructure.memory import (AsyncInMemoryRepository, ConcurrentInMemoryRepository,
+	InMemoryRepository)
+
+
+class InMemoryViewRepository(InMemoryRepository, ViewRepositoryInterface):
+	"""
+	Indexes views by post pk and keeps the latest viewed_at per
+	(user pk, post pk), so counts and last view lookups never scan.
+	"""
+	model = View
+
+	def __init__(self):
+		super().__init__()
+		self._by_post = {}
+		self._last_viewed_at = {}
+
+	def add(self, view: View) -> View:
+		super().add(view)
+		post_pk = view.post.pk
+		self._by_post.setdefault(post_pk, []).append(view)
+		key = (view.user.pk, post_pk)
+		last_viewed_at = self._last_viewed_at.get(key)
+		if last_viewed_at is None or view.viewed_at > last_viewed_at:
+			self._last_viewed_at[key] = view.viewed_at
+		return view
+
+	def add_many(self, views: Iterable[View]) -> List[View]:
+		return [self.add(view) for view in views]
+
+	def list_by_post(self, post_pk: int) -> List[View]:
+		return list(self._by_post.get(post_pk, ()))
+
+	def count_by_post(self, post_pk: int) -> int:
+		return len(self._by_post.get(post_pk, ()))
+
+	def count_by_posts(self, post_pks: Iterable[int]) -> Dict[int, int]:
+		by_post = self._by_post
+		return {post_pk: len(by_post.get(post_pk, ())) for post_pk in post_pks}
+
+	def get_last_viewed_at(self, user_pk: int, post_pk: int) -> Optional[datetime.datetime]:
+		return self._last_viewed_at.get((user_pk, post_pk))
+
+	def list_rows_before(self, before: datetime.datetime,
+		limit: int) -> List[Tuple[int, int, int, datetime.datetime]]:
+		rows = ((view.viewed_at, view.pk, view.post.pk, view.user.pk)
+			for view in list(self._objects.values()) if view.viewed_at < before)
+		return [(pk, post_pk, user_pk, viewed_at)
+			for viewed_at, pk, post_pk, user_pk in heapq.nsmallest(limit, rows)]
+
+	def remove_many(self, pks: Iterable[int]):
+		removed = {}
+		for pk in pks:
+			view = self._objects.pop(pk, None)
+			if view is not None:
+				removed[view.pk] = view.post.pk
+		# Latest view times are kept, the window they serve is short
+		for post_pk in set(removed.values()):
+			views = [view for view in self._by_post[post_pk] if view.pk not in removed]
+			if views:
+				self._by_post[post_pk] = views
+			else:
+				del self._by_post[post_pk]
+
+
+class ConcurrentInMemoryViewRepository(InMemoryViewRepository, ConcurrentInMemoryRepository):
+	"""
+	InMemoryViewRepository safe to share between threads.
+
+	Recording a view is the hot write path and takes no shared lock: the
+	pk and the store are lock-free (see ConcurrentInMemoryRepository) and
+	the view is appended to its post's list, atomic in CPython. Only the
+	latest view time of a (user pk, post pk) is a read then a write, it
+	locks that pair's stripe so a late older view can't overwrite it.
+
+	remove_many is serialized by its own lock and rewrites just the part
+	of each post's list it read, so views appended meanwhile are kept.
+	"""
+	def __init__(self):
+		super().__init__()
+		self._remove_lock = threading.Lock()
+
+	def add(self, view: View) -> View:
+		ConcurrentInMemoryRepository.add(self, view)
+		post_pk = view.post.pk
+		self._by_post.setdefault(post_pk, []).append(view)
+		key = (view.user.pk, post_pk)
+		with self._stripes.lock_for(key):
+			last_viewed_at = self._last_viewed_at.get(key)
+			if last_viewed_at is None or view.viewed_at > last_viewed_at:
+				self._last_viewed_at[key] = view.viewed_at
+		return view
+
+	def remove_many(self, pks: Iterable[int]):
+		with self._remove_lock:
+			removed = {}
+			for pk in pks:
+				view = self._objects.pop(pk, None)
+				if view is not None:
+					removed[view.pk] = view.post.pk
+			for post_pk in set(removed.values()):
+				views = self._by_post[post_pk]
+				read = len(views)
+				# Emptied lists are left in place, views may still be appended to them
+				views[:read] = [view for view in views[:read] if view.pk not in removed]
+
+
+class AsyncInMemoryViewRepository(AsyncInMemoryRepository, AsyncViewRepositoryInterface):
+	repository_class = InMemoryViewRepository
+
+	async def count_by_post(self, post_pk: int) -> int:
+		return await self._call(self.repository.count_by_post, post_pk)
+
+	async def get_last_viewed_at(self, user_pk: int, post_pk: int) -> Optional[datetime.datetime]:
+		return await self._call(self.repository.get_last_viewed_at, user_pk, post_pk)
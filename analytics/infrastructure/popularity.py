@@ -0,0 +1,111 @@
+import bisect
+import threading
+from collections import Counter
+from typing import Iterable, List, Mapping, Tuple
+
+from analytics.domain.interfaces import PopularPostsIndexInterface
+from analytics.domain.models import View
+
+
+class PopularPostsIndex(PopularPostsIndexInterface):
+	"""
+	Maintained per-post view counters plus a sorted index of the posts
+	eligible for popular lists (published ones), so the most viewed
+	posts are a slice instead of a count over every View.
+
+	- record_view is called whenever a View is stored
+	- set_eligible / update_post when a post changes status, a post that
+	  is archived drops out of the index but keeps its count
+	- rebuild resets everything from the raw View history
+
+	Counts are kept for every post, eligible or not, so a draft that is
+	published later enters the index with the views it already has.
+
+	Thread safe: changes to the ranking and top() hold a lock, they are
+	short. view_count is a dict lookup and doesn't.
+
+	Parameters
+	----------
+	eligible_status: str, default to 'p'
+		Posts in this status are listed by top()
+	"""
+	def __init__(self, eligible_status: str = 'p'):
+		self.eligible_status = eligible_status
+		self._counts = {}
+		self._eligible = set()
+		# Ascending (-count, post_pk): most viewed first, ties by lowest pk
+		self._ranking = []
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._eligible)
+
+	def __contains__(self, post_pk: int) -> bool:
+		return post_pk in self._eligible
+
+	def view_count(self, post_pk: int) -> int:
+		return self._counts.get(post_pk, 0)
+
+	def record_view(self, post_pk: int, count: int = 1):
+		with self._lock:
+			old_count = self._counts.get(post_pk, 0)
+			self._counts[post_pk] = old_count + count
+			if post_pk in self._eligible:
+				self._remove((-old_count, post_pk))
+				bisect.insort(self._ranking, (-old_count - count, post_pk))
+
+	def set_eligible(self, post_pk: int, eligible: bool):
+		with self._lock:
+			if eligible == (post_pk in self._eligible):
+				return
+			key = (-self._counts.get(post_pk, 0), post_pk)
+			if eligible:
+				self._eligible.add(post_pk)
+				bisect.insort(self._ranking, key)
+			else:
+				self._eligible.discard(post_pk)
+				self._remove(key)
+
+	def update_post(self, post):
+		"""
+		Tracks a created or updated Post's eligibility from its status.
+		"""
+		self.set_eligible(post.pk, post.status == self.eligible_status)
+
+	def top(self, limit: int = 10) -> List[Tuple[int, int]]:
+		"""
+		Returns up to limit (post_pk, view count) pairs, most viewed first.
+		Costs O(limit).
+		"""
+		with self._lock:
+			top = self._ranking[:limit]
+		return [(post_pk, -negative_count) for negative_count, post_pk in top]
+
+	def rebuild(self, view_counts: Mapping[int, int], eligible_post_pks: Iterable[int]):
+		"""
+		Replaces all counters and the ranking.
+
+		Parameters
+		----------
+		view_counts: Mapping[int, int]
+			post_pk -> number of views, eg. from count_views
+		eligible_post_pks: Iterable[int]
+			pks of the posts currently eligible (published)
+		"""
+		counts = {post_pk: count for post_pk, count in view_counts.items() if count}
+		eligible = set(eligible_post_pks)
+		ranking = sorted((-counts.get(post_pk, 0), post_pk) for post_pk in eligible)
+		with self._lock:
+			self._counts, self._eligible, self._ranking = counts, eligible, ranking
+
+	def _remove(self, key: tuple):
+		index = bisect.bisect_left(self._ranking, key)
+		if index < len(self._ranking) and self._ranking[index] == key:
+			del self._ranking[index]
+
+
+def count_views(views: Iterable[View]) -> Counter:
+	"""
+	Counts raw View history per post pk, for PopularPostsIndex.rebuild.
+	"""
+	return Counter(view.post.pk for view in views)
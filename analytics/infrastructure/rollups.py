@@ -0,0 +1,448 @@
+"""
+Time-bucketed rollups of the view stream.
+
+ViewRollups counts views per post and per category in minute, hour and
+day buckets, and estimates unique viewers per day with HyperLogLog
+sketches, so range queries ("views of post 7 over the last 6 hours",
+"unique readers of category 2 this week") merge a handful of buckets
+instead of scanning View rows.
+
+Counts live in fixed size ring buffers (array('I'), 4 bytes a bucket)
+allocated the first time a post or category is viewed, each holding the
+latest `retention[granularity]` buckets. With the default retention that
+is about 1.6KB per post or category. Older buckets are overwritten as
+time moves on, so queries only see the retained ones.
+
+Rollups are built incrementally: record_view for every view as it is
+stored (BlogService does so when passed view_rollups), record_views for
+runs of (post_pk, user_pk, viewed_at) records, eg. ViewRecorded frames
+replayed from an event log, and rebuild from the stored View history.
+
+Timestamps are seconds since the epoch (time.time()), buckets are
+aligned on multiples of their granularity.
+"""
+import math
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from analytics.domain.interfaces import ViewRollupsInterface
+from analytics.domain.models import View
+from analytics.infrastructure.popularity import PopularPostsIndex
+
+MINUTE, HOUR, DAY = 60, 3600, 86400
+# granularity -> number of buckets kept: 2 hours, 8 days, 90 days
+DEFAULT_RETENTION = {MINUTE: 120, HOUR: 24 * 8, DAY: 90}
+
+_MASK64 = 2 ** 64 - 1
+# 2 ** -rank for every possible register value
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
+
+
+def _hash64(value: int) -> int:
+	"""
+	splitmix64 finalizer: spreads pks (small, sequential ints) over 64 bits.
+	"""
+	value = (value + 0x9E3779B97F4A7C15) & _MASK64
+	value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+	value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+	return value ^ (value >> 31)
+
+
+class HyperLogLog:
+	"""
+	Estimates the number of distinct ints added, within about
+	1.04 / sqrt(2 ** precision) (3.2% at the default precision of 10).
+
+	Registers start out sparse (a dict of the non zero ones), which is
+	what most per post and per day sketches stay at, and are switched to
+	one bytearray of 2 ** precision registers once that is smaller.
+	Sketches of the same precision merge losslessly, see update.
+
+	Parameters
+	----------
+	precision: int, default to 10
+		log2 of the number of registers, 4 to 16
+	"""
+	__slots__ = ('precision', '_sparse', '_registers')
+
+	def __init__(self, precision: int = 10):
+		if not 4 <= precision <= 16:
+			raise ValueError("HyperLogLog precision must be between 4 and 16, got %s" % precision)
+		self.precision = precision
+		self._sparse = {}
+		self._registers = None
+
+	def add(self, value: int):
+		self.add_hash(_hash64(value))
+
+	def add_hash(self, hashed: int):
+		"""
+		add for a value already hashed with _hash64, to hash a value once
+		for several sketches.
+		"""
+		precision = self.precision
+		index = hashed >> (64 - precision)
+		rest = hashed & ((1 << (64 - precision)) - 1)
+		# Position of the first 1 bit in the remaining 64 - precision bits
+		rank = 64 - precision - rest.bit_length() + 1
+		if self._registers is not None:
+			if rank > self._registers[index]:
+				self._registers[index] = rank
+			return
+		if rank > self._sparse.get(index, 0):
+			self._sparse[index] = rank
+			# A dict entry costs ~100 bytes against 1 byte per register
+			if len(self._sparse) > (1 << precision) // 64:
+				self._densify()
+
+	def update(self, other: 'HyperLogLog'):
+		"""
+		Merges other into this sketch: it then estimates the union.
+		"""
+		if other.precision != self.precision:
+			raise ValueError("Cannot merge HyperLogLog sketches of precision %s and %s" % (
+				self.precision, other.precision))
+		if other._registers is None:
+			registers, sparse = self._registers, self._sparse
+			for index, rank in other._sparse.items():
+				if registers is not None:
+					if rank > registers[index]:
+						registers[index] = rank
+				elif rank > sparse.get(index, 0):
+					sparse[index] = rank
+			if registers is None and len(sparse) > (1 << self.precision) // 64:
+				self._densify()
+			return
+		if self._registers is None:
+			self._densify()
+		self._registers = bytearray(map(max, self._registers, other._registers))
+
+	def count(self) -> int:
+		size = 1 << self.precision
+		if self._registers is not None:
+			zeros = self._registers.count(0)
+			total = sum(map(_INVERSE_POWERS.__getitem__, self._registers))
+		else:
+			zeros = size - len(self._sparse)
+			total = zeros + sum(map(_INVERSE_POWERS.__getitem__, self._sparse.values()))
+		if zeros == size:
+			return 0
+		alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(size, 0.7213 / (1 + 1.079 / size))
+		estimate = alpha * size * size / total
+		if estimate <= 2.5 * size and zeros:
+			# Linear counting is more accurate for small cardinalities
+			estimate = size * math.log(size / zeros)
+		return int(round(estimate))
+
+	def _densify(self):
+		registers = bytearray(1 << self.precision)
+		for index, rank in self._sparse.items():
+			registers[index] = rank
+		self._registers = registers
+		self._sparse = {}
+
+
+class _Series:
+	"""
+	Counts for the latest len(counts) buckets of one key and granularity,
+	in a ring buffer indexed by bucket number modulo its size.
+	"""
+	__slots__ = ('counts', 'last')
+
+	def __init__(self, size: int):
+		self.counts = array('I', bytes(4 * size))
+		# Latest bucket number counted
+		self.last = None
+
+	def add(self, bucket: int, count: int = 1):
+		counts, last = self.counts, self.last
+		size = len(counts)
+		if bucket == last:
+			counts[bucket % size] += count
+			return
+		if last is None or bucket - last >= size:
+			if last is not None:
+				self.counts = counts = array('I', bytes(4 * size))
+			self.last = bucket
+		elif bucket > last:
+			# Buckets skipped since the last view had no views
+			for skipped in range(last + 1, bucket + 1):
+				counts[skipped % size] = 0
+			self.last = bucket
+		elif bucket <= last - size:
+			return
+		counts[bucket % size] += count
+
+	def buckets(self, first: int, last: int) -> List[int]:
+		"""
+		Count of every bucket from first to last included, 0 for the ones
+		not retained.
+		"""
+		counts, size = self.counts, len(self.counts)
+		if self.last is None:
+			return [0] * (last - first + 1)
+		oldest = self.last - size + 1
+		return [counts[bucket % size] if oldest <= bucket <= self.last else 0
+			for bucket in range(first, last + 1)]
+
+	def total(self, first: int, last: int) -> int:
+		if self.last is None:
+			return 0
+		counts, size = self.counts, len(self.counts)
+		first, last = max(first, self.last - size + 1), min(last, self.last)
+		if first > last:
+			return 0
+		start, stop = first % size, last % size + 1
+		if start < stop:
+			return sum(counts[start:stop])
+		return sum(counts[start:]) + sum(counts[:stop])
+
+
+class ViewRollups(ViewRollupsInterface):
+	"""
+	Per post and per category view counts in time buckets, unique viewer
+	sketches per day, and rolling popular posts rankings over the last
+	few days, see the module docstring.
+
+	- record_view is called whenever a View is stored
+	- update_post when a post is saved, to follow its category and
+	  whether it is listed by top() (published)
+	- rebuild resets everything from the posts and the raw View history
+
+	A view is counted in the category the post is in when it is recorded.
+
+	Thread safe: changes and queries hold a lock, eg. views recorded by
+	an ingestion worker while requests call top().
+
+	Parameters
+	----------
+	retention: Mapping[int, int], default to DEFAULT_RETENTION
+		granularity in seconds -> number of buckets kept. DAY must be
+		included, it is the granularity of unique viewer sketches and
+		the upper bound for windows.
+	windows: Iterable[int], default to (7,)
+		Lengths in days of the rolling rankings kept for top(), eg.
+		7 for "popular this week"
+	precision: int, default to 10
+		HyperLogLog precision of the unique viewer sketches
+	eligible_status: str, default to 'p'
+		Posts in this status are listed by top()
+	clock: Callable[[], float], default to time.time
+		The current time, which queries default to
+	"""
+	def __init__(self, retention: Mapping[int, int] = None, windows: Iterable[int] = (7,),
+		precision: int = 10, eligible_status: str = 'p', clock=time.time):
+		self.retention = dict(DEFAULT_RETENTION if retention is None else retention)
+		if DAY not in self.retention:
+			raise ValueError("ViewRollups retention must include DAY buckets.")
+		self.windows = tuple(sorted(set(windows)))
+		if self.windows and not 0 < self.windows[-1] <= self.retention[DAY]:
+			raise ValueError("Windows must be between 1 and %d days." % self.retention[DAY])
+		self.precision = precision
+		self.eligible_status = eligible_status
+		self.clock = clock
+		self._lock = threading.Lock()
+		self._reset()
+
+	def update_post(self, post):
+		with self._lock:
+			self._update_post(post)
+
+	def record_view(self, post_pk: int, user_pk: int, viewed_at: float = None):
+		if viewed_at is None:
+			viewed_at = self.clock()
+		with self._lock:
+			self._record_view(post_pk, user_pk, viewed_at)
+
+	def record_views(self, records: Iterable[Tuple[int, int, float]]):
+		"""
+		record_view for every (post_pk, user_pk, viewed_at), eg. the
+		records of a ViewRecorded Frame replayed from an EventLog.
+		"""
+		record_view = self._record_view
+		with self._lock:
+			for post_pk, user_pk, viewed_at in records:
+				record_view(post_pk, user_pk, viewed_at)
+
+	def rebuild(self, posts: Iterable, views: Iterable[View]):
+		"""
+		Replaces all rollups with the ones of posts and their views, in
+		any order. Views older than the retention are skipped.
+		"""
+		with self._lock:
+			self._reset()
+			for post in posts:
+				self._update_post(post)
+			for view in views:
+				self._record_view(view.post.pk, view.user.pk, view.viewed_at.timestamp())
+
+	#########
+	# Queries
+	def views(self, post_pk: int, start: float, end: float = None, granularity: int = HOUR) -> int:
+		"""
+		Number of views of post_pk in the granularity buckets overlapping
+		[start, end), end defaulting to now.
+		"""
+		return self._total(self._post_series, post_pk, start, end, granularity)
+
+	def category_views(self, category_pk: int, start: float, end: float = None,
+		granularity: int = HOUR) -> int:
+		return self._total(self._category_series, category_pk, start, end, granularity)
+
+	def series(self, post_pk: int, start: float, end: float = None,
+		granularity: int = HOUR) -> List[Tuple[int, int]]:
+		"""
+		(bucket start timestamp, views) for every granularity bucket
+		overlapping [start, end), oldest first, eg. to plot.
+		"""
+		return self._series(self._post_series, post_pk, start, end, granularity)
+
+	def category_series(self, category_pk: int, start: float, end: float = None,
+		granularity: int = HOUR) -> List[Tuple[int, int]]:
+		return self._series(self._category_series, category_pk, start, end, granularity)
+
+	def unique_viewers(self, post_pk: int, start: float, end: float = None) -> int:
+		"""
+		Estimated number of distinct users who viewed post_pk on the days
+		overlapping [start, end).
+		"""
+		return self._unique(self._post_sketches, post_pk, start, end)
+
+	def category_unique_viewers(self, category_pk: int, start: float, end: float = None) -> int:
+		return self._unique(self._category_sketches, category_pk, start, end)
+
+	def top(self, days: int = 7, limit: int = 10) -> List[Tuple[int, int]]:
+		"""
+		Up to limit (post_pk, views) pairs of eligible posts viewed today
+		or on the previous days - 1 days, most viewed first. days must be
+		one of the windows. Costs O(limit), the ranking is maintained as
+		views come in and days go by.
+		"""
+		if days not in self.windows:
+			raise ValueError("No %d day window, ViewRollups keeps %s." % (days, list(self.windows)))
+		today = int(self.clock() // DAY)
+		with self._lock:
+			self._advance(today)
+			top = self._rankings[days].top(limit)
+		return [(post_pk, views) for post_pk, views in top if views > 0]
+
+	#########
+	# Helpers
+	# The following expect the lock to be held
+	def _update_post(self, post):
+		self._categories[post.pk] = post.category.pk if post.category else None
+		for ranking in self._rankings.values():
+			ranking.update_post(post)
+
+	def _record_view(self, post_pk: int, user_pk: int, viewed_at: float):
+		category_pk = self._categories.get(post_pk)
+		for granularity, size in self.retention.items():
+			bucket = int(viewed_at // granularity)
+			post_series = self._post_series[granularity]
+			series = post_series.get(post_pk)
+			if series is None:
+				series = post_series[post_pk] = _Series(size)
+			series.add(bucket)
+			if category_pk is not None:
+				category_series = self._category_series[granularity]
+				series = category_series.get(category_pk)
+				if series is None:
+					series = category_series[category_pk] = _Series(size)
+				series.add(bucket)
+
+		day = int(viewed_at // DAY)
+		hashed = _hash64(user_pk)
+		self._sketch(self._post_sketches, post_pk, day).add_hash(hashed)
+		if category_pk is not None:
+			self._sketch(self._category_sketches, category_pk, day).add_hash(hashed)
+
+		if self.windows:
+			self._advance(day)
+			if day > self._today - self.windows[-1]:
+				self._day_counts.setdefault(day, Counter())[post_pk] += 1
+				for days, ranking in self._rankings.items():
+					if day > self._today - days:
+						ranking.record_view(post_pk)
+
+	def _reset(self):
+		self._categories = {}
+		# granularity -> key -> _Series
+		self._post_series = {granularity: {} for granularity in self.retention}
+		self._category_series = {granularity: {} for granularity in self.retention}
+		# key -> day -> HyperLogLog
+		self._post_sketches = {}
+		self._category_sketches = {}
+		# days -> ranking of the views in the last days days
+		self._rankings = {days: PopularPostsIndex(self.eligible_status) for days in self.windows}
+		# day -> views per post that day, for the days still in a window
+		self._day_counts = {}
+		self._today = None
+
+	def _sketch(self, sketches: Dict[int, Dict[int, HyperLogLog]], key: int, day: int) -> HyperLogLog:
+		days = sketches.get(key)
+		if days is None:
+			days = sketches[key] = {}
+		sketch = days.get(day)
+		if sketch is None:
+			# First view of key that day, drop the days past the retention
+			sketch = days[day] = HyperLogLog(self.precision)
+			oldest = day - self.retention[DAY]
+			for expired in [expired for expired in days if expired <= oldest]:
+				del days[expired]
+		return sketch
+
+	def _advance(self, today: int):
+		"""
+		Moves the rolling windows on to today, taking the views of the
+		days that left each window out of its ranking.
+		"""
+		if self._today is None:
+			self._today = today
+			return
+		if today <= self._today:
+			return
+		for days, ranking in self._rankings.items():
+			for day, counts in self._day_counts.items():
+				if self._today - days < day <= today - days:
+					for post_pk, count in counts.items():
+						ranking.record_view(post_pk, -count)
+		self._today = today
+		oldest = today - self.windows[-1]
+		for day in [day for day in self._day_counts if day <= oldest]:
+			del self._day_counts[day]
+
+	# The following take the lock
+	def _bucket_range(self, start: float, end: Optional[float], granularity: int) -> Tuple[int, int]:
+		if granularity not in self.retention:
+			raise ValueError("No %ds buckets, ViewRollups keeps %s." % (
+				granularity, sorted(self.retention)))
+		if end is None:
+			end = self.clock()
+		return int(start // granularity), math.ceil(end / granularity) - 1
+
+	def _total(self, series_by_granularity: dict, key: int, start: float, end: Optional[float],
+		granularity: int) -> int:
+		first, last = self._bucket_range(start, end, granularity)
+		with self._lock:
+			series = series_by_granularity[granularity].get(key)
+			return series.total(first, last) if series is not None else 0
+
+	def _series(self, series_by_granularity: dict, key: int, start: float, end: Optional[float],
+		granularity: int) -> List[Tuple[int, int]]:
+		first, last = self._bucket_range(start, end, granularity)
+		with self._lock:
+			series = series_by_granularity[granularity].get(key)
+			counts = series.buckets(first, last) if series is not None else [0] * (last - first + 1)
+		return [(bucket * granularity, count) for bucket, count in zip(range(first, last + 1), counts)]
+
+	def _unique(self, sketches: dict, key: int, start: float, end: Optional[float]) -> int:
+		first, last = self._bucket_range(start, end, DAY)
+		union = HyperLogLog(self.precision)
+		with self._lock:
+			for day, sketch in sketches.get(key, {}).items():
+				if first <= day <= last:
+					union.update(sketch)
+		return union.count()
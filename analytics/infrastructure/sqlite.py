@@ -0,0 +1,149 @@
+import datetime
+import json
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from analytics.domain.models import View
+from auth.domain.models import User
+from analytics.domain.repository import ViewRepositoryInterface
+from analytics.infrastructure.last_seen import LastSeenStoreInterface
+from auth.infrastructure.sqlite import USER_COLUMNS, user_from_row
+from blog.infrastructure.sqlite import SqlitePostRepository, post_references
+from shared.infrastructure.identity import identities
+from shared.infrastructure.sqlite import SqliteRepository, from_datetime, hydrate_rows, to_datetime
+
+CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS views (
+	pk INTEGER PRIMARY KEY,
+	post_pk INTEGER NOT NULL REFERENCES posts (pk),
+	user_pk INTEGER NOT NULL REFERENCES users (pk),
+	viewed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS views_post ON views (post_pk);
+CREATE INDEX IF NOT EXISTS views_user_post ON views (user_pk, post_pk, viewed_at);
+CREATE INDEX IF NOT EXISTS views_viewed_at ON views (viewed_at);
+CREATE TABLE IF NOT EXISTS last_seen (
+	user_pk INTEGER NOT NULL,
+	post_pk INTEGER NOT NULL,
+	seen_at REAL NOT NULL,
+	PRIMARY KEY (user_pk, post_pk)
+) WITHOUT ROWID;
+"""
+
+INSERT_VIEW = "INSERT INTO views VALUES (?, ?, ?, ?)"
+SELECT_VIEWS = """
+SELECT v.pk, v.post_pk, v.viewed_at, %s
+FROM views v
+JOIN users u ON u.pk = v.user_pk
+""" % USER_COLUMNS.format('u')
+SELECT_VIEW = SELECT_VIEWS + "WHERE v.pk = ?"
+SELECT_VIEWS_BY_POST = SELECT_VIEWS + "WHERE v.post_pk = ? ORDER BY v.pk"
+COUNT_VIEWS_BY_POST = "SELECT COUNT(*) FROM views WHERE post_pk = ?"
+# The pks are passed as one json array, so this stays a single prepared
+# statement however many posts are counted.
+COUNT_VIEWS_BY_POSTS = """
+SELECT post_pk, COUNT(*) FROM views
+WHERE post_pk IN (SELECT value FROM json_each(?))
+GROUP BY post_pk
+"""
+SELECT_LAST_VIEWED_AT = "SELECT MAX(viewed_at) FROM views WHERE user_pk = ? AND post_pk = ?"
+SELECT_ROWS_BEFORE = """
+SELECT pk, post_pk, user_pk, viewed_at FROM views
+WHERE viewed_at < ?
+ORDER BY viewed_at, pk
+LIMIT ?
+"""
+DELETE_VIEWS = "DELETE FROM views WHERE pk IN (SELECT value FROM json_each(?))"
+
+SELECT_LAST_SEEN = "SELECT seen_at FROM last_seen WHERE user_pk = ? AND post_pk = ?"
+UPSERT_LAST_SEEN = "INSERT OR REPLACE INTO last_seen VALUES (?, ?, ?)"
+DELETE_LAST_SEEN = "DELETE FROM last_seen WHERE user_pk = ? AND post_pk = ?"
+
+
+def create_tables(connection: sqlite3.Connection):
+	connection.executescript(CREATE_TABLES)
+
+
+class SqliteViewRepository(SqliteRepository, ViewRepositoryInterface):
+	"""
+	Views are loaded with their users through one joined query, their
+	posts are lazy references (see post_references).
+	"""
+	table = "views"
+	model = View
+
+	def __init__(self, connection: sqlite3.Connection):
+		super().__init__(connection)
+		self._posts = SqlitePostRepository(connection)
+
+	def add(self, view: View) -> View:
+		return self.add_many([view])[0]
+
+	def add_many(self, views: Iterable[View]) -> List[View]:
+		views = list(views)
+		with self._inserting():
+			self._assign_pks(views)
+			self._connection.executemany(INSERT_VIEW, [
+				(view.pk, view.post.pk, view.user.pk, from_datetime(view.viewed_at))
+				for view in views])
+		for view in views:
+			view.mark_clean()
+		return views
+
+	def get(self, pk: int) -> View:
+		return self._one(self._select(SELECT_VIEW, pk), pk)
+
+	def list_by_post(self, post_pk: int) -> List[View]:
+		return self._select(SELECT_VIEWS_BY_POST, post_pk)
+
+	def count_by_post(self, post_pk: int) -> int:
+		return self._connection.execute(COUNT_VIEWS_BY_POST, (post_pk,)).fetchone()[0]
+
+	def count_by_posts(self, post_pks: Iterable[int]) -> Dict[int, int]:
+		counts = dict.fromkeys(post_pks, 0)
+		if counts:
+			counts.update(self._connection.execute(
+				COUNT_VIEWS_BY_POSTS, (json.dumps(list(counts)),)))
+		return counts
+
+	def get_last_viewed_at(self, user_pk: int, post_pk: int) -> Optional[datetime.datetime]:
+		row = self._connection.execute(SELECT_LAST_VIEWED_AT, (user_pk, post_pk)).fetchone()
+		return to_datetime(row[0])
+
+	def list_rows_before(self, before: datetime.datetime,
+		limit: int) -> List[Tuple[int, int, int, datetime.datetime]]:
+		return [(pk, post_pk, user_pk, to_datetime(viewed_at)) for pk, post_pk, user_pk, viewed_at
+			in self._connection.execute(SELECT_ROWS_BEFORE, (from_datetime(before), limit))]
+
+	def remove_many(self, pks: Iterable[int]):
+		with self._connection:
+			self._connection.execute(DELETE_VIEWS, (json.dumps(list(pks)),))
+
+	def _select(self, query: str, *params) -> List[View]:
+		rows = self._connection.execute(query, params).fetchall()
+		posts = post_references(self._posts, {row[1] for row in rows})
+		users = identities(User)
+		return hydrate_rows(View, [
+			(row[0], posts[row[1]], user_from_row(row[3:], users), to_datetime(row[2]))
+			for row in rows])
+
+
+class SqliteLastSeenStore(LastSeenStoreInterface):
+	"""
+	Persistent backing for LastSeenIndex: one row per (user, post) in a
+	WITHOUT ROWID table, so lookups are a single primary key probe.
+	"""
+	def __init__(self, connection: sqlite3.Connection):
+		self._connection = connection
+
+	def get(self, user_pk: int, post_pk: int) -> Optional[float]:
+		row = self._connection.execute(SELECT_LAST_SEEN, (user_pk, post_pk)).fetchone()
+		return row[0] if row else None
+
+	def set(self, user_pk: int, post_pk: int, seen_at: float):
+		with self._connection:
+			self._connection.execute(UPSERT_LAST_SEEN, (user_pk, post_pk, seen_at))
+
+	def delete(self, user_pk: int, post_pk: int):
+		with self._connection:
+			self._connection.execute(DELETE_LAST_SEEN, (user_pk, post_pk))
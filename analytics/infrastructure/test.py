@@ -0,0 +1,331 @@
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+from analytics.infrastructure import sqlite as analytics_sqlite
+from analytics.infrastructure.archive import ViewArchive
+from analytics.infrastructure.ingestion import ViewIngestionPipeline
+from analytics.infrastructure.memory import InMemoryViewRepository
+from analytics.infrastructure.last_seen import LastSeenIndex
+from analytics.infrastructure.popularity import PopularPostsIndex
+from analytics.infrastructure.rollups import DAY, HOUR, MINUTE, HyperLogLog, ViewRollups
+from auth.domain.models import User
+from auth.infrastructure.memory import InMemoryUserRepository
+from blog.domain.models import Category, Post
+from blog.infrastructure.memory import InMemoryPostRepository
+from shared.infrastructure.sqlite import connect
+
+WINDOW = datetime.timedelta(minutes=5)
+
+
+class LastSeenIndexTests(unittest.TestCase):
+
+	def test_window(self):
+		index = LastSeenIndex(WINDOW)
+		self.assertTrue(index.should_record(1, 1, now=0))
+		self.assertFalse(index.should_record(1, 1, now=300))
+		self.assertTrue(index.should_record(2, 1, now=300))
+		self.assertTrue(index.should_record(1, 1, now=301))
+		self.assertEqual(index.last_seen(1, 1, now=302), 301)
+
+	def test_expiry_and_eviction(self):
+		index = LastSeenIndex(WINDOW, max_entries=3)
+		for user_pk in range(3):
+			index.should_record(user_pk, 1, now=0)
+		# Expired entries are dropped as new ones come in
+		index.should_record(10, 1, now=301)
+		self.assertEqual(len(index), 1)
+
+		# Past max_entries the least recently recorded pair is evicted
+		for user_pk in range(4):
+			index.should_record(user_pk, 1, now=302 + user_pk)
+		self.assertEqual(len(index), 3)
+		self.assertEqual(index.evictions, 2)
+		self.assertTrue(index.should_record(10, 1, now=310))
+
+	def test_persistent_backing(self):
+		connection = connect()
+		analytics_sqlite.create_tables(connection)
+		store = analytics_sqlite.SqliteLastSeenStore(connection)
+
+		LastSeenIndex(WINDOW, backing=store).should_record(1, 1, now=0)
+		# A fresh index (eg. after a restart) still honours the window
+		index = LastSeenIndex(WINDOW, backing=store)
+		self.assertFalse(index.should_record(1, 1, now=10))
+		self.assertTrue(index.should_record(1, 1, now=400))
+		self.assertEqual(store.get(1, 1), 400)
+
+		index.forget(1, 1)
+		self.assertIsNone(store.get(1, 1))
+		self.assertTrue(index.should_record(1, 1, now=410))
+
+
+class PopularPostsIndexTests(unittest.TestCase):
+
+	def test_ranking(self):
+		index = PopularPostsIndex()
+		index.rebuild({1: 5, 2: 3, 3: 8, 4: 1}, eligible_post_pks=[1, 2, 4])
+		self.assertEqual(index.top(2), [(1, 5), (2, 3)])
+
+		# Counting continues for posts that aren't published
+		index.record_view(3)
+		index.set_eligible(3, True)
+		self.assertEqual(index.top(2), [(3, 9), (1, 5)])
+
+		for _ in range(3):
+			index.record_view(2)
+		self.assertEqual(index.top(3), [(3, 9), (2, 6), (1, 5)])
+
+		index.set_eligible(3, False)
+		self.assertEqual(index.top(), [(2, 6), (1, 5), (4, 1)])
+		self.assertEqual(index.view_count(3), 9)
+
+
+class ViewRollupsTests(unittest.TestCase):
+
+	def setUp(self):
+		self.now = 100 * DAY
+		self.rollups = ViewRollups(retention={MINUTE: 60, HOUR: 48, DAY: 10},
+			windows=(1, 7), clock=lambda: self.now)
+		author = User(pk=1, username="author", password="testpass", email="user@example.com",
+			first_name="First", last_name="Last", is_author=True)
+		self.category = Category(pk=1, name="Cats")
+		self.posts = [Post(pk=pk, title="Post %d" % pk, author=author, status='p',
+			category=self.category if pk < 3 else None) for pk in (1, 2, 3)]
+		for post in self.posts:
+			self.rollups.update_post(post)
+
+	def test_buckets(self):
+		rollups = self.rollups
+		start = self.now
+		for offset in (0, 30, 90):
+			rollups.record_view(1, 1, start + offset)
+		rollups.record_view(2, 1, start + 10)
+		rollups.record_view(3, 1, start + 10)
+		self.now += HOUR
+
+		self.assertEqual(rollups.views(1, start, granularity=MINUTE), 3)
+		self.assertEqual(rollups.views(1, start, start + 60, granularity=MINUTE), 2)
+		self.assertEqual(rollups.series(1, start, start + 3 * 60, granularity=MINUTE),
+			[(start, 2), (start + 60, 1), (start + 120, 0)])
+		self.assertEqual(rollups.views(1, start - DAY), 3)
+		self.assertEqual(rollups.category_views(self.category.pk, 0, granularity=DAY), 4)
+		self.assertEqual(rollups.unique_viewers(1, 0), 1)
+		with self.assertRaises(ValueError):
+			rollups.views(1, 0, granularity=7)
+
+		# Buckets older than the retention are overwritten
+		rollups.record_view(1, 2, start + 3 * HOUR)
+		self.now += 3 * HOUR
+		self.assertEqual(rollups.views(1, 0, granularity=MINUTE), 1)
+		self.assertEqual(rollups.views(1, 0, granularity=HOUR), 4)
+
+	def test_unique_viewers(self):
+		for user_pk in range(1000):
+			self.rollups.record_view(1, user_pk, self.now)
+			self.rollups.record_view(2, user_pk + 500, self.now + DAY)
+		self.now += DAY + HOUR
+		self.assertAlmostEqual(self.rollups.unique_viewers(1, 0), 1000, delta=50)
+		self.assertAlmostEqual(self.rollups.category_unique_viewers(self.category.pk, 0), 1500, delta=75)
+		self.assertAlmostEqual(self.rollups.category_unique_viewers(
+			self.category.pk, self.now - HOUR), 1000, delta=50)
+
+		small = HyperLogLog()
+		for value in (1, 2, 3, 2):
+			small.add(value)
+		self.assertEqual(small.count(), 3)
+		with self.assertRaises(ValueError):
+			small.update(HyperLogLog(precision=12))
+
+	def test_windows(self):
+		rollups = self.rollups
+		for _ in range(3):
+			rollups.record_view(1, 1, self.now - 6 * DAY)
+		rollups.record_view(2, 1, self.now - DAY)
+		rollups.record_view(2, 1, self.now)
+		rollups.record_view(3, 1, self.now)
+		# Too old for any window
+		rollups.record_view(3, 1, self.now - 8 * DAY)
+		self.assertEqual(rollups.top(7), [(1, 3), (2, 2), (3, 1)])
+		self.assertEqual(rollups.top(1), [(2, 1), (3, 1)])
+
+		self.posts[2].status = 'a'
+		rollups.update_post(self.posts[2])
+		self.assertEqual(rollups.top(1), [(2, 1)])
+
+		# Views leave the windows as days go by
+		self.now += DAY
+		self.assertEqual(rollups.top(7), [(2, 2)])
+		self.assertEqual(rollups.top(1), [])
+		with self.assertRaises(ValueError):
+			rollups.top(30)
+
+	def test_concurrent_views_and_top(self):
+		start, errors = self.now, []
+
+		def work(number: int):
+			try:
+				for index in range(1000):
+					if number % 2:
+						self.rollups.top(7)
+					else:
+						# Writers move the clock on, views come in on new days
+						self.now = max(self.now, start + index * HOUR)
+						self.rollups.record_view(1 + number // 2 % 3, number, start + index * HOUR)
+			except Exception as error:
+				errors.append(error)
+
+		interval = sys.getswitchinterval()
+		# Switch threads often, so views and queries interleave
+		sys.setswitchinterval(1e-6)
+		try:
+			threads = [threading.Thread(target=work, args=(number,)) for number in range(8)]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+		finally:
+			sys.setswitchinterval(interval)
+		self.assertEqual(errors, [])
+		# 4 writers each viewed a post every hour, the last 7 days are in the window
+		today = int(self.now // DAY)
+		in_window = sum(1 for index in range(1000)
+			if int((start + index * HOUR) // DAY) > today - 7)
+		self.assertEqual(sum(views for _, views in self.rollups.top(7)), 4 * in_window)
+
+
+class ViewArchiveTests(unittest.TestCase):
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.directory = directory.name
+		self.start = datetime.datetime(2024, 1, 1)
+
+	def at(self, hours: int) -> datetime.datetime:
+		return self.start + datetime.timedelta(hours=hours)
+
+	def test_counts(self):
+		with ViewArchive(self.directory) as archive:
+			# (post_pk, user_pk, viewed_at), in any order
+			self.assertEqual(archive.append([(2, 1, self.at(3)), (1, 1, self.at(1)),
+				(1, 2, self.at(0)), (2, 2, self.at(2))]), 4)
+			self.assertEqual(archive.append([(1, 1, self.at(5)), (3, 3, self.at(6))]), 2)
+			self.assertEqual(archive.append([]), 0)
+
+		with ViewArchive(self.directory) as archive:
+			self.assertEqual((len(archive), archive.segment_count), (6, 2))
+			self.assertEqual(archive.count(), 6)
+			self.assertEqual(archive.count(post_pk=1), 3)
+			self.assertEqual(archive.count(post_pk=1, start=self.at(1)), 2)
+			self.assertEqual(archive.count(post_pk=1, start=self.at(1), end=self.at(5)), 1)
+			self.assertEqual(archive.count(start=self.at(2), end=self.at(6)), 3)
+			self.assertEqual(archive.count(user_pk=1), 3)
+			self.assertEqual(archive.count(user_pk=1, start=self.at(2)), 2)
+			self.assertEqual(archive.count(post_pk=2, user_pk=2), 1)
+			self.assertEqual(archive.count(post_pk=4), 0)
+			self.assertEqual(archive.count_by_posts([1, 2, 4], end=self.at(3)), {1: 2, 2: 1, 4: 0})
+
+			runs = [(list(user_pks), list(viewed_at)) for user_pks, viewed_at in archive.scan(1)]
+			self.assertEqual([user_pks for user_pks, _ in runs], [[2, 1], [1]])
+			self.assertLess(*runs[0][1])
+
+	def test_user_scan_is_aligned(self):
+		# Two user pks whose bytes, side by side, hold the bytes of 1
+		needle = (1).to_bytes(8, sys.byteorder, signed=True)
+		first = int.from_bytes(b'\0' + needle[:7], sys.byteorder, signed=True)
+		second = int.from_bytes(needle[7:] + b'\0' * 7, sys.byteorder, signed=True)
+		with ViewArchive(self.directory) as archive:
+			archive.append([(1, first, self.at(0)), (1, second, self.at(1)), (2, 1, self.at(0))])
+			self.assertEqual(archive.count(user_pk=1), 1)
+			self.assertEqual(archive.count(post_pk=1, user_pk=1), 0)
+
+	def test_unlisted_segment_is_ignored(self):
+		with ViewArchive(self.directory) as archive:
+			archive.append([(1, 1, self.at(0))])
+		# As left by a crash before the manifest was written
+		os.makedirs(os.path.join(self.directory, "%020d" % 2))
+		with ViewArchive(self.directory) as archive:
+			self.assertEqual(archive.count(), 1)
+			archive.append([(1, 1, self.at(1))])
+			self.assertEqual(archive.count(post_pk=1), 2)
+
+
+class BlockingViewRepository(InMemoryViewRepository):
+	"""
+	A view store that stalls writes until released.
+	"""
+	def __init__(self):
+		super().__init__()
+		self.release = threading.Event()
+		self.batches = []
+
+	def add_many(self, views):
+		self.release.wait()
+		self.batches.append(len(views))
+		return super().add_many(views)
+
+
+class ViewIngestionPipelineTests(unittest.TestCase):
+
+	def setUp(self):
+		self.users = InMemoryUserRepository()
+		self.posts = InMemoryPostRepository()
+		self.user = self.users.add(User(username="user1", password="testpass",
+			email="user@example.com", first_name="First", last_name="Last", is_author=True))
+		self.post = self.posts.add(Post(title="Hello World", author=self.user))
+		self.views = BlockingViewRepository()
+
+	def pipeline(self, **kwargs) -> ViewIngestionPipeline:
+		return ViewIngestionPipeline(self.views, self.posts, self.users, **kwargs)
+
+	def test_batches_and_drains_on_close(self):
+		self.views.release.set()
+		with self.pipeline(batch_size=10, flush_interval=60) as pipeline:
+			for _ in range(25):
+				self.assertTrue(pipeline.enqueue(self.post.pk, self.user.pk))
+		self.assertEqual(sum(self.views.batches), 25)
+		self.assertLessEqual(max(self.views.batches), 10)
+		self.assertEqual(pipeline.written, 25)
+		self.assertEqual(self.views.count_by_post(self.post.pk), 25)
+		with self.assertRaises(RuntimeError):
+			pipeline.enqueue(self.post.pk, self.user.pk)
+
+	def test_flushes_on_interval(self):
+		self.views.release.set()
+		pipeline = self.pipeline(batch_size=1000, flush_interval=0.01)
+		pipeline.enqueue(self.post.pk, self.user.pk, viewed_at=0)
+		for _ in range(200):
+			if self.views.batches:
+				break
+			threading.Event().wait(0.01)
+		self.assertEqual(self.views.batches, [1])
+		self.assertEqual(self.views.get(1).viewed_at, datetime.datetime.fromtimestamp(0))
+		pipeline.close()
+
+	def test_skips_unknown_posts_and_users(self):
+		self.views.release.set()
+		written = []
+		with self.pipeline(flush_interval=60) as pipeline:
+			pipeline.subscribe(written.extend)
+			pipeline.enqueue(self.post.pk, self.user.pk)
+			pipeline.enqueue(self.post.pk, 999)
+			pipeline.enqueue(999, self.user.pk)
+		self.assertEqual((pipeline.written, pipeline.skipped, pipeline.failed), (1, 2, 0))
+		self.assertEqual(self.views.count_by_post(self.post.pk), 1)
+		self.assertEqual([(event.post_pk, event.user_pk) for event in written],
+			[(self.post.pk, self.user.pk)])
+
+	def test_backpressure_drops_when_full(self):
+		pipeline = self.pipeline(batch_size=1, max_queue_size=2, enqueue_timeout=0)
+		results = [pipeline.enqueue(self.post.pk, self.user.pk) for _ in range(10)]
+		# The worker holds one event, the queue two more
+		self.assertGreaterEqual(results.count(False), 7)
+		self.assertEqual(pipeline.dropped, results.count(False))
+
+		self.views.release.set()
+		pipeline.close()
+		self.assertEqual(pipeline.written, results.count(True))
@@ -0,0 +1,16 @@
+from abc import ABC, abstractmethod
+
+from auth.domain.models import UserRoles
+
+
+class PermissionCacheInterface(ABC):
+	"""
+	User pk -> UserRoles for permission checks, without loading a User.
+	"""
+
+	@abstractmethod
+	def get(self, user_pk: int) -> UserRoles:
+		"""
+		Raises DomainModelNotFoundException for unknown users.
+		"""
+		raise NotImplementedError
@@ -1,11 +1,58 @@
+import enum
+from typing import Dict, List, NamedTuple
+
 from shared.domain.models import BaseDomainModel, DomainField
 
 
+class Role(enum.IntFlag):
+	"""
+	User roles as a bitmask, see User.roles.
+	"""
+	ACTIVE = 1
+	AUTHOR = 2
+	MODERATOR = 4
+
+
+# Any of these roles may create and update posts
+WRITE_ROLES = Role.AUTHOR | Role.MODERATOR
+
+
+def roles_from_flags(is_active: bool, is_author: bool, is_moderator: bool) -> Role:
+	return Role((Role.ACTIVE if is_active else 0)
+		| (Role.AUTHOR if is_author else 0)
+		| (Role.MODERATOR if is_moderator else 0))
+
+
+class UserRoles(NamedTuple):
+	"""
+	Just what permission checks need to know about a user, so they can
+	run without loading (and hydrating) the full User record. Exposes
+	the same is_* flags as User.
+	"""
+	pk: int
+	roles: Role
+
+	def __str__(self):
+		return "<User pk=%s>" % self.pk
+
+	@property
+	def is_active(self) -> bool:
+		return bool(self.roles & Role.ACTIVE)
+
+	@property
+	def is_author(self) -> bool:
+		return bool(self.roles & Role.AUTHOR)
+
+	@property
+	def is_moderator(self) -> bool:
+		return bool(self.roles & Role.MODERATOR)
+
+
 class User(BaseDomainModel):
 
 	pk = DomainField(dtype=int)
 	username = DomainField(dtype=str, required=True)
-	password = DomainField(dtype=str, required=True)
+	password = DomainField(dtype=str, required=True, secret=True)
 	email = DomainField(dtype=str)
 	first_name = DomainField(dtype=str, required=True)
 	last_name = DomainField(dtype=str, required=True)
@@ -13,15 +60,42 @@ class User(BaseDomainModel):
 	is_moderator = DomainField(dtype=bool)
 	is_author = DomainField(dtype=bool)
 
+	NON_EMPTY_FIELDS = ('username', 'password', 'email')
+
 	def __init__(self, *args, **kwargs):
 		"""
 		Enforce creation constraints.
 		"""
 		super().__init__(self, *args, **kwargs)
 		# Check non empty string constraints explicitly.
-		for field in ['username', 'password', 'email']:
+		for field in self.NON_EMPTY_FIELDS:
 			if not getattr(self, field):
 				raise ValueError("Field %s cannot be empty string" % field)
 
+	@classmethod
+	def _validate_columns(cls, columns: Dict[str, list], rows: List[int]) -> Dict[int, Exception]:
+		"""
+		__init__'s non empty string rule for a batch.
+		"""
+		errors = {}
+		for field in cls.NON_EMPTY_FIELDS:
+			column = columns[field]
+			for i in rows:
+				if i not in errors and not column[i]:
+					errors[i] = ValueError("Field %s cannot be empty string" % field)
+		return errors
+
 	def __str__(self):
-		return "<User: %s>" % self.username
\ No newline at end of file
+		return "<User: %s>" % self.username
+
+	@property
+	def roles(self) -> Role:
+		return roles_from_flags(self.is_active, self.is_author, self.is_moderator)
+
+	@property
+	def user_roles(self) -> UserRoles:
+		return UserRoles(self.pk, self.roles)
+
+	@property
+	def full_name(self) -> str:
+		return "%s %s" % (self.first_name, self.last_name)
@@ -0,0 +1,51 @@
+from abc import abstractmethod
+from typing import Iterable, List
+
+from auth.domain.models import User, UserRoles
+from shared.domain.repository import AsyncRepositoryInterface, RepositoryInterface
+
+
+class UserRepositoryInterface(RepositoryInterface):
+
+	@abstractmethod
+	def add(self, user: User) -> User:
+		raise NotImplementedError
+
+	@abstractmethod
+	def get(self, pk: int) -> User:
+		raise NotImplementedError
+
+	@abstractmethod
+	def get_many(self, pks: Iterable[int]) -> List[User]:
+		"""
+		Loads the users with these pks in one go. Missing pks are left
+		out, the order is not defined.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def update(self, user: User) -> User:
+		"""
+		Persists changes made to a stored user, see changed_fields. Callers
+		changing roles should also invalidate any PermissionCache holding
+		the user, which otherwise sees the change once its entry expires.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def get_roles(self, pk: int) -> UserRoles:
+		"""
+		Returns a user's roles without loading the rest of the record.
+		"""
+		raise NotImplementedError
+
+
+class AsyncUserRepositoryInterface(AsyncRepositoryInterface):
+
+	@abstractmethod
+	async def add(self, user: User) -> User:
+		raise NotImplementedError
+
+	@abstractmethod
+	async def get(self, pk: int) -> User:
+		raise NotImplementedError
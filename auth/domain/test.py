@@ -1,6 +1,7 @@
 import unittest
 
-from auth.domain.models import User
+from auth.domain.models import WRITE_ROLES, Role, User
+from shared.domain.columnar import validate_columns
 
 class AuthDomainTests(unittest.TestCase):
 
@@ -51,4 +52,41 @@ class AuthDomainTests(unittest.TestCase):
 				is_active=True,
 				is_author=False,
 				is_moderator=True
-			)
\ No newline at end of file
+			)
+
+	def test_roles(self):
+		user = User(pk=1, username="user1", password="testpass", email="user@example.com",
+			first_name="First", last_name="Last", is_active=True, is_moderator=True)
+		self.assertEqual(user.roles, Role.ACTIVE | Role.MODERATOR)
+		self.assertTrue(user.roles & WRITE_ROLES)
+
+		roles = user.user_roles
+		self.assertEqual(roles.pk, 1)
+		self.assertEqual((roles.is_active, roles.is_author, roles.is_moderator),
+			(True, False, True))
+
+	def test_validate_columns(self):
+		columns = {
+			'username': ['user1', '', 'user3', 'user4'],
+			'password': ['testpass', 'testpass', 'testpass', ''],
+			'first_name': ['First'] * 4,
+			'last_name': ['Last'] * 4,
+			'email': ['user@example.com', 'user@example.com', None, ''],
+		}
+		result = validate_columns(User, columns)
+		self.assertEqual(result.valid, [True, False, False, False])
+
+		# Exactly the failures constructing row by row gives
+		for i, valid in enumerate(result.valid):
+			try:
+				User(**{field_name: column[i] for field_name, column in columns.items()})
+			except Exception as error:
+				self.assertEqual((type(result.errors[i]), str(result.errors[i])),
+					(type(error), str(error)))
+			else:
+				self.assertTrue(valid)
+
+		# Missing columns fail on their defaults, as in __init__
+		result = validate_columns(User, {field_name: column[:1]
+			for field_name, column in columns.items() if field_name != 'email'})
+		self.assertEqual(str(result.errors[0]), "Field email cannot be empty string")
@@ -0,0 +1,33 @@
+from auth.domain.models import User, UserRoles
+from auth.domain.repository import AsyncUserRepositoryInterface, UserRepositoryInterface
+from shared.infrastructure.memory import (AsyncInMemoryRepository, ConcurrentInMemoryRepository,
+	InMemoryRepository)
+
+
+class InMemoryUserRepository(InMemoryRepository, UserRepositoryInterface):
+	model = User
+
+	def update(self, user: User) -> User:
+		self.get(user.pk)
+		if user.changed_fields():
+			self._objects[user.pk] = user
+			user.mark_clean()
+		return user
+
+	def get_roles(self, pk: int) -> UserRoles:
+		return self.get(pk).user_roles
+
+
+class ConcurrentInMemoryUserRepository(InMemoryUserRepository, ConcurrentInMemoryRepository):
+	"""
+	InMemoryUserRepository safe to share between threads, updates lock
+	their user's stripe.
+	"""
+
+	def update(self, user: User) -> User:
+		with self._stripes.lock_for(user.pk):
+			return super().update(user)
+
+
+class AsyncInMemoryUserRepository(AsyncInMemoryRepository, AsyncUserRepositoryInterface):
+	repository_class = InMemoryUserRepository
@@ -0,0 +1,51 @@
+import time
+from typing import Callable
+
+from auth.domain.interfaces import PermissionCacheInterface
+from auth.domain.models import UserRoles
+from auth.domain.repository import UserRepositoryInterface
+from shared.infrastructure.cache import ResponseCache
+
+
+class PermissionCache(PermissionCacheInterface):
+	"""
+	User pk -> UserRoles, loaded through the repository's get_roles and
+	kept for up to ttl seconds, so permission checks on the write paths
+	need neither a query nor a full User.
+
+	Meant to be shared process wide by everything checking permissions
+	against the same user repository. Roles are not versioned: code
+	changing a user's roles should call invalidate(user_pk), and changes
+	made without it (eg. by another process) are seen once the entry
+	expires, so a demoted user keeps their roles for ttl seconds at most.
+
+	Parameters
+	----------
+	user_repository: UserRepositoryInterface
+	max_entries: int, default to 100,000
+		Least recently used users are dropped past this
+	ttl: float, default to 60
+		Seconds roles are trusted before being loaded again
+	clock: Callable[[], float], default to time.monotonic
+	"""
+	def __init__(self, user_repository: UserRepositoryInterface, max_entries: int = 100000,
+		ttl: float = 60, clock: Callable[[], float] = time.monotonic):
+		self._user_repository = user_repository
+		self._cache = ResponseCache(max_entries=max_entries, ttl=ttl, clock=clock)
+
+	def get(self, user_pk: int) -> UserRoles:
+		"""
+		Raises DomainModelNotFoundException for unknown users, which are
+		not cached.
+		"""
+		return self._cache.get_or_compute(user_pk,
+			lambda: self._user_repository.get_roles(user_pk))
+
+	def invalidate(self, user_pk: int):
+		self._cache.invalidate(user_pk)
+
+	def clear(self):
+		self._cache.clear()
+
+	def stats(self) -> dict:
+		return self._cache.stats()
@@ -0,0 +1,116 @@
+import json
+import sqlite3
+from typing import Iterable, List
+
+from auth.domain.models import User, UserRoles, roles_from_flags
+from auth.domain.repository import UserRepositoryInterface
+from shared.domain.models import DomainModelNotFoundException
+from shared.infrastructure.identity import identities
+from shared.infrastructure.sqlite import SqliteRepository, to_bool
+
+CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS users (
+	pk INTEGER PRIMARY KEY,
+	username TEXT NOT NULL UNIQUE,
+	password TEXT NOT NULL,
+	email TEXT,
+	first_name TEXT NOT NULL,
+	last_name TEXT NOT NULL,
+	is_active INTEGER,
+	is_moderator INTEGER,
+	is_author INTEGER
+);
+"""
+
+# Column order matches User.schema.field_names, and is reused by other
+# repositories joining users in.
+USER_COLUMNS = "{0}.pk, {0}.username, {0}.password, {0}.email, {0}.first_name," \
+	" {0}.last_name, {0}.is_active, {0}.is_moderator, {0}.is_author"
+USER_COLUMN_COUNT = 9
+
+INSERT_USER = "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+UPDATE_USER = """
+UPDATE users SET username = ?, password = ?, email = ?, first_name = ?, last_name = ?,
+	is_active = ?, is_moderator = ?, is_author = ?
+WHERE pk = ?
+"""
+SELECT_USER = "SELECT %s FROM users u WHERE u.pk = ?" % USER_COLUMNS.format('u')
+SELECT_USERS_BY_PKS = "SELECT %s FROM users u WHERE u.pk IN (SELECT value FROM json_each(?))" \
+	% USER_COLUMNS.format('u')
+SELECT_USER_ROLES = "SELECT is_active, is_author, is_moderator FROM users WHERE pk = ?"
+
+
+def create_tables(connection: sqlite3.Connection):
+	connection.executescript(CREATE_TABLES)
+
+
+def user_from_row(row: tuple, users: dict = None) -> User:
+	"""
+	Hydrates a User from USER_COLUMNS, sharing one instance per pk
+	through the optional users dict.
+	"""
+	if users is not None and row[0] in users:
+		return users[row[0]]
+	pk, username, password, email, first_name, last_name, is_active, is_moderator, is_author = row
+	user = User.hydrate((pk, username, password, email, first_name, last_name,
+		to_bool(is_active), to_bool(is_moderator), to_bool(is_author)))
+	if users is not None:
+		users[pk] = user
+	return user
+
+
+def user_to_row(user: User) -> tuple:
+	return tuple(getattr(user, field_name) for field_name in User.schema.field_names)
+
+
+class SqliteUserRepository(SqliteRepository, UserRepositoryInterface):
+
+	table = "users"
+	model = User
+
+	def add(self, user: User) -> User:
+		return self.add_many([user])[0]
+
+	def add_many(self, users: Iterable[User]) -> List[User]:
+		users = list(users)
+		with self._inserting():
+			self._assign_pks(users)
+			self._connection.executemany(INSERT_USER, map(user_to_row, users))
+		for user in users:
+			user.mark_clean()
+		return users
+
+	def get(self, pk: int) -> User:
+		rows = self._connection.execute(SELECT_USER, (pk,)).fetchall()
+		users = identities(User)
+		return self._one([user_from_row(row, users) for row in rows], pk)
+
+	def get_many(self, pks: Iterable[int]) -> List[User]:
+		users = identities(User)
+		mapped, missing = [], []
+		for pk in dict.fromkeys(pks):
+			user = users.get(pk)
+			if user is None:
+				missing.append(pk)
+			else:
+				mapped.append(user)
+		if missing:
+			rows = self._connection.execute(SELECT_USERS_BY_PKS, (json.dumps(missing),)).fetchall()
+			mapped.extend(user_from_row(row, users) for row in rows)
+		return mapped
+
+	def update(self, user: User) -> User:
+		if not user.changed_fields():
+			return user
+		with self._connection:
+			cursor = self._connection.execute(UPDATE_USER, user_to_row(user)[1:] + (user.pk,))
+		if not cursor.rowcount:
+			self.get(user.pk)
+		user.mark_clean()
+		return user
+
+	def get_roles(self, pk: int) -> UserRoles:
+		row = self._connection.execute(SELECT_USER_ROLES, (pk,)).fetchone()
+		if row is None:
+			raise DomainModelNotFoundException("User with pk %s does not exist." % pk)
+		return UserRoles(pk, roles_from_flags(*row))
@@ -0,0 +1,168 @@
+import asyncio
+import datetime
+from typing import Awaitable, List
+
+from analytics.domain.interfaces import LastSeenIndexInterface
+from analytics.domain.models import View
+from analytics.domain.repository import AsyncViewRepositoryInterface
+from auth.domain.repository import AsyncUserRepositoryInterface
+from blog.application.blog_service import VIEW_WINDOW, comment_dict, post_dict, post_summary
+from blog.domain.models import Comment, Post
+from blog.domain.repository import (AsyncCategoryRepositoryInterface,
+	AsyncCommentRepositoryInterface, AsyncPostRepositoryInterface)
+
+
+class AsyncBlogService:
+	"""
+	asyncio version of BlogService's post reads and comment writes, over
+	async repositories, returning the same dicts.
+
+	get_post_by_pk needs the post (with its author and category), its
+	comments (with their users) and its view count, and records a view.
+	The three reads only depend on post_pk, so they are made concurrently
+	and a call waits for the slowest round trip rather than their sum.
+	The view is written by a background task once the post is known: it
+	never delays the response, which counts the views stored so far.
+	close() waits for the writes still running. A failed view write is
+	counted in failed_views (the error kept in last_view_error) rather
+	than raised, like ViewIngestionPipeline does.
+
+	Every repository call is bounded by timeout seconds, raising
+	TimeoutError past it. When one of the concurrent reads fails the
+	others are cancelled.
+
+	There are no read caches or indexes here, unlike BlogService: view
+	counts come from the view repository.
+
+	Usage:
+
+		async with build_async_blog_service(comments, posts, views, users, categories) as service:
+			post = await service.get_post_by_pk(post_pk, user_pk=user_pk)
+
+	Parameters
+	----------
+	comment_repository: AsyncCommentRepositoryInterface
+	post_repository: AsyncPostRepositoryInterface
+	view_repository: AsyncViewRepositoryInterface
+	user_repository: AsyncUserRepositoryInterface
+	category_repository: AsyncCategoryRepositoryInterface
+	last_seen_index: LastSeenIndexInterface
+		Filters repeat views before any round trip (the view repository
+		is still checked before writing), see
+		blog.infrastructure.wiring.build_async_blog_service
+	timeout: float, default to 1.0
+		Seconds allowed per repository call, None for no limit
+	"""
+	def __init__(self,
+		comment_repository: AsyncCommentRepositoryInterface,
+		post_repository: AsyncPostRepositoryInterface,
+		view_repository: AsyncViewRepositoryInterface,
+		user_repository: AsyncUserRepositoryInterface,
+		category_repository: AsyncCategoryRepositoryInterface,
+		last_seen_index: LastSeenIndexInterface,
+		timeout: float = 1.0
+	):
+		self._comment_repository = comment_repository
+		self._post_repository = post_repository
+		self._view_repository = view_repository
+		self._user_repository = user_repository
+		self._category_repository = category_repository
+		self._last_seen_index = last_seen_index
+		self.timeout = timeout
+
+		# Running view writes, referenced so they aren't garbage collected
+		self._view_tasks = set()
+		self.written_views = 0
+		self.failed_views = 0
+		self.last_view_error = None
+
+	async def __aenter__(self) -> 'AsyncBlogService':
+		return self
+
+	async def __aexit__(self, *exc_info):
+		await self.close()
+
+	async def list_posts(self) -> List[dict]:
+		"""
+		Returns all published posts, as BlogService.list_posts does.
+		"""
+		posts = await self._call(self._post_repository.list_by_status('p'))
+		return [post_summary(post) for post in posts]
+
+	async def get_post_by_pk(self, post_pk: int, user_pk: int = None) -> dict:
+		"""
+		Returns a post, as BlogService.get_post_by_pk does, and records a
+		view by user_pk in the background (see the class docstring).
+		"""
+		post, comments, views = await self._gather(
+			self._post_repository.get(post_pk),
+			self._comment_repository.list_by_post(post_pk),
+			self._view_repository.count_by_post(post_pk))
+		if user_pk is not None:
+			self._record_view(post, user_pk)
+		return dict(post_dict(post),
+			comments=[comment_dict(comment) for comment in comments],
+			views=views,
+		)
+
+	async def create_comment(self, post_pk: int, user_id: int, body: str) -> dict:
+		"""
+		Creates a comment, as BlogService.create_comment does. The post
+		and the user are loaded concurrently.
+		"""
+		post, user = await self._gather(
+			self._post_repository.get(post_pk),
+			self._user_repository.get(user_id))
+		comment = await self._call(self._comment_repository.add(
+			Comment(post=post, user=user, body=body)))
+		return comment_dict(comment)
+
+	async def close(self):
+		"""
+		Waits for the view writes still running.
+		"""
+		while self._view_tasks:
+			await asyncio.gather(*self._view_tasks)
+
+	#########
+	# Helpers
+	async def _call(self, awaitable: Awaitable):
+		return await asyncio.wait_for(awaitable, self.timeout)
+
+	async def _gather(self, *awaitables: Awaitable) -> list:
+		"""
+		Awaits repository calls concurrently, cancelling the rest when one
+		fails.
+		"""
+		tasks = [asyncio.ensure_future(self._call(awaitable)) for awaitable in awaitables]
+		try:
+			return await asyncio.gather(*tasks)
+		except BaseException:
+			for task in tasks:
+				task.cancel()
+			raise
+
+	def _record_view(self, post: Post, user_pk: int):
+		if user_pk == post.author.pk or not self._last_seen_index.should_record(user_pk, post.pk):
+			return
+		task = asyncio.get_running_loop().create_task(self._write_view(post, user_pk))
+		self._view_tasks.add(task)
+		task.add_done_callback(self._view_tasks.discard)
+
+	async def _write_view(self, post: Post, user_pk: int):
+		viewed_at = datetime.datetime.now()
+		try:
+			last_viewed_at, user = await self._gather(
+				self._view_repository.get_last_viewed_at(user_pk, post.pk),
+				self._user_repository.get(user_pk))
+			if last_viewed_at is not None and viewed_at - last_viewed_at <= VIEW_WINDOW:
+				return
+			await self._call(self._view_repository.add(
+				View(post=post, user=user, viewed_at=viewed_at)))
+		except Exception as error:
+			# Lets the next read record it again
+			self._last_seen_index.forget(user_pk, post.pk)
+			self.failed_views += 1
+			self.last_view_error = error
+		else:
+			self.written_views += 1
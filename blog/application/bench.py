@@ -0,0 +1,85 @@
+"""
+Benchmark for AsyncBlogService: times get_post_by_pk over in-memory
+async repositories with 2ms of latency per call, against awaiting the
+same round trips one after the other.
+
+To run:
+
+	cd .../onboard_exercise/
+	python3 -m blog.application.bench
+"""
+import asyncio
+import time
+
+from analytics.domain.models import View
+from analytics.infrastructure.memory import AsyncInMemoryViewRepository, InMemoryViewRepository
+from auth.domain.models import User
+from auth.infrastructure.memory import AsyncInMemoryUserRepository, InMemoryUserRepository
+from blog.application.async_blog_service import AsyncBlogService
+from blog.domain.models import Comment, Post
+from blog.infrastructure.memory import (AsyncInMemoryCategoryRepository,
+	AsyncInMemoryCommentRepository, AsyncInMemoryPostRepository, InMemoryCommentRepository,
+	InMemoryPostRepository)
+from blog.infrastructure.wiring import build_async_blog_service
+
+
+def bench_async(reads: int = 500, concurrency: int = 50, latency: float = 0.002):
+	users, posts, comments = InMemoryUserRepository(), InMemoryPostRepository(), InMemoryCommentRepository()
+	for user in User.hydrate_many([(pk, "user%d" % pk, "testpass", "user@example.com",
+			"First", "Last %d" % pk, True, False, True) for pk in range(1, reads + 2)]):
+		users.add(user)
+	post = posts.add(Post(title="Hello World", author=users.get(1), body="Body"))
+	comments.add_many([Comment(post=post, user=users.get(pk), body="Nice!") for pk in range(2, 22)])
+
+	def build() -> AsyncBlogService:
+		return build_async_blog_service(
+			AsyncInMemoryCommentRepository(comments, latency=latency),
+			AsyncInMemoryPostRepository(posts, latency=latency),
+			AsyncInMemoryViewRepository(InMemoryViewRepository(), latency=latency),
+			AsyncInMemoryUserRepository(users, latency=latency),
+			AsyncInMemoryCategoryRepository(latency=latency))
+
+	async def sequential(service: AsyncBlogService, user_pk: int):
+		"""
+		The round trips of get_post_by_pk, awaited one at a time.
+		"""
+		loaded = await service._post_repository.get(post.pk)
+		await service._comment_repository.list_by_post(post.pk)
+		await service._view_repository.count_by_post(post.pk)
+		await service._view_repository.get_last_viewed_at(user_pk, post.pk)
+		user = await service._user_repository.get(user_pk)
+		await service._view_repository.add(View(post=loaded, user=user))
+
+	async def one_at_a_time(read) -> float:
+		service = build()
+		start = time.perf_counter()
+		for user_pk in range(2, reads + 2):
+			await read(service, user_pk)
+		elapsed = time.perf_counter() - start
+		await service.close()
+		return elapsed / reads * 1000
+
+	async def concurrently() -> float:
+		service = build()
+		semaphore = asyncio.Semaphore(concurrency)
+
+		async def read(user_pk: int):
+			async with semaphore:
+				await service.get_post_by_pk(post.pk, user_pk=user_pk)
+
+		start = time.perf_counter()
+		await asyncio.gather(*(read(user_pk) for user_pk in range(2, reads + 2)))
+		await service.close()
+		elapsed = time.perf_counter() - start
+		assert service.written_views == reads
+		return reads / elapsed
+
+	print("get_post_by_pk, %.0fms per repository call:" % (latency * 1000))
+	print("  sequential round trips: %6.2f ms/read" % asyncio.run(one_at_a_time(sequential)))
+	print("  AsyncBlogService:       %6.2f ms/read" % asyncio.run(one_at_a_time(
+		lambda service, user_pk: service.get_post_by_pk(post.pk, user_pk=user_pk))))
+	print("  %d reads in flight:     %6.0f reads/s" % (concurrency, asyncio.run(concurrently())))
+
+
+if __name__ == "__main__":
+	bench_async()
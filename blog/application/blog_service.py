@@ -1,12 +1,52 @@
-from typing import List
+import base64
+import binascii
+import datetime
+import threading
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 # Import for typehinting
+from analytics.domain.events import ViewRecorded
 from analytics.domain.models import View
+from blog.domain.events import CommentAdded, PostSaved
 from blog.domain.models import Category, Comment, Post
 
 # Import for queries
-from analytics.domain.repository import ViewRepositoryInteface
-from blog.domain.models import CommentRepositoryInterface, PostRepositoryInterface
+from analytics.domain.events import ViewEvent
+from analytics.domain.interfaces import (LastSeenIndexInterface, PopularPostsIndexInterface,
+	ViewArchiveInterface, ViewPipelineInterface, ViewRollupsInterface)
+from analytics.domain.repository import ViewRepositoryInterface
+from auth.domain.interfaces import PermissionCacheInterface
+from auth.domain.repository import UserRepositoryInterface
+from blog.domain.interfaces import PostProjectionInterface, SearchIndexInterface
+from blog.domain.repository import (CategoryRepositoryInterface,
+	CommentRepositoryInterface, PostRepositoryInterface)
+from shared.application.locks import StripedLock
+from shared.domain.interfaces import EventLogInterface, ResponseCacheInterface
+from shared.domain.models import DomainModelNotFoundException
+
+
+# A viewer's repeat views of a post within this window count once
+VIEW_WINDOW = datetime.timedelta(minutes=5)
+POPULAR_POSTS_LIMIT = 10
+
+
+def encode_cursor(published_at: Optional[datetime.datetime], pk: int) -> str:
+	"""
+	Opaque list_posts_page cursor for the keyset (published_at, pk).
+	"""
+	published_at = published_at or datetime.datetime.min
+	raw = ("%s|%d" % (published_at.isoformat(), pk)).encode()
+	return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+	try:
+		published_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+		return datetime.datetime.fromisoformat(published_at), int(pk)
+	except (binascii.Error, UnicodeDecodeError, ValueError):
+		raise ValueError("Invalid cursor %r." % cursor) from None
 
 
 class BlogService:
@@ -45,23 +85,113 @@ class BlogService:
 	def __init__(self,
 		comment_repository: CommentRepositoryInterface,
 		post_repository: PostRepositoryInterface,
-		view_repository: ViewRepositoryInteface
+		view_repository: ViewRepositoryInterface,
+		user_repository: UserRepositoryInterface,
+		category_repository: CategoryRepositoryInterface,
+		popular_posts_index: PopularPostsIndexInterface,
+		last_seen_index: LastSeenIndexInterface,
+		permission_cache: PermissionCacheInterface,
+		view_pipeline: ViewPipelineInterface = None,
+		post_projection: PostProjectionInterface = None,
+		response_cache: ResponseCacheInterface = None,
+		event_log: EventLogInterface = None,
+		search_index: SearchIndexInterface = None,
+		view_rollups: ViewRollupsInterface = None,
+		view_archive: ViewArchiveInterface = None
 	):
-	"""
-	Notes: I imported comment, post and view repositories because
-	there are definitely writing to those tables.
-
-	As mentioned above, I'd probably move reads to infrastructure
-	layer for ease of future caching, but even if I didn't, it
-	would probably make sense to define quieries at the RepositoryInterface
-	level to get nested objects so we can avoid multiple queries and
-	instead rely on joins to improve query performance.
-	"""
-	# Define as private class variables and use public interface
-	# to access them.
-	self._comment_repository = comment_repository
-	self._post_repository = post_repository
-	self._view_repository = view_repository
+		"""
+		Notes: I imported comment, post and view repositories because
+		there are definitely writing to those tables.
+
+		As mentioned above, I'd probably move reads to infrastructure
+		layer for ease of future caching, but even if I didn't, it
+		would probably make sense to define quieries at the RepositoryInterface
+		level to get nested objects so we can avoid multiple queries and
+		instead rely on joins to improve query performance.
+
+		The user and category repositories are needed to look up
+		authors, commenters, viewers and categories.
+
+		Collaborators are taken through their interfaces only, the
+		implementations are assembled by
+		blog.infrastructure.wiring.build_blog_service, which also makes
+		the required ones when not passed.
+
+		View counts are kept in popular_posts_index. It only sees views
+		and status changes made through this service, see
+		rebuild_popular_posts.
+
+		Repeat views are filtered through last_seen_index.
+
+		When a view_pipeline is passed, new views are queued on it and
+		written in the background instead of on the read path. They are
+		counted (and logged, rolled up...) once written, from the
+		pipeline's worker thread.
+
+		When a post_projection is passed, list_posts, list_popular_posts
+		and get_post_by_pk are served from its precomputed rows without
+		loading domain objects. An empty one is built from the
+		repositories. It only sees writes made through this service, see
+		rebuild_read_models.
+
+		When a response_cache is passed, list_posts, list_posts_page,
+		list_popular_posts and get_post_by_pk responses are cached under
+		per-post versions and a lists version, which this service bumps
+		on every post save, status change and new comment. View counts
+		are always read live.
+
+		Update permissions are checked against user roles from
+		permission_cache, which should be shared by everything in the
+		process using the same user repository.
+
+		When an event_log is passed, every post save (with the fields that
+		changed), new comment and recorded view is appended to it as a
+		domain event (see blog.domain.events), eg. to recover caches from
+		with blog.infrastructure.history.PostHistory.
+
+		search_posts needs a search_index, which is kept up to date with
+		every post saved through this service, see rebuild_read_models.
+
+		When view_rollups are passed, every recorded view is also counted
+		in its time buckets, and list_popular_posts can rank posts by the
+		views of the last few days (one of view_rollups' windows).
+
+		When old views are moved out of view_repository into a
+		view_archive (see analytics.infrastructure.archive.compact_views),
+		pass it too so rebuilt view counts include them.
+		"""
+		# Define as private class variables and use public interface
+		# to access them.
+		self._comment_repository = comment_repository
+		self._post_repository = post_repository
+		self._view_repository = view_repository
+		self._user_repository = user_repository
+		self._category_repository = category_repository
+		self._view_archive = view_archive
+
+		self._popular_posts_index = popular_posts_index
+		self._last_seen_index = last_seen_index
+		self._permission_cache = permission_cache
+
+		self._view_pipeline = view_pipeline
+		if view_pipeline is not None:
+			view_pipeline.subscribe(self._views_written)
+		self._post_projection = post_projection
+		if post_projection is not None and not len(post_projection):
+			self._rebuild_projection()
+
+		self._response_cache = response_cache
+		self._event_log = event_log
+		self._search_index = search_index
+		self._view_rollups = view_rollups
+		# Bumped by writes, part of every cache key so stale entries
+		# are never read again
+		self._post_versions = {}
+		self._lists_version = 0
+		self._versions_lock = threading.Lock()
+		# Held from loading a post to saving it, so concurrent updates of
+		# one post are applied one after the other instead of one being lost
+		self._post_locks = StripedLock()
 
 	def list_posts(self) -> List[dict]:
 		"""
@@ -78,9 +208,49 @@ class BlogService:
 			...
 		]
 		"""
-		raise NotImplementedError
+		return self._cached(("list_posts", self._lists_version),
+			self._list_posts, _copy_rows)
+
+	def list_posts_page(self, cursor: str = None, limit: int = 20,
+		category_pk: int = None, author_pk: int = None) -> dict:
+		"""
+		Returns one page of published posts, newest first, in the format:
+
+		{
+			"posts": [<post as returned by list_posts>, ...],
+			"next_cursor": <cursor for the next page, None on the last page>
+		}
+
+		Pages are found by keyset (published_at, pk) rather than offset,
+		so every page costs the same however deep it is.
+
+		Parameters
+		----------
+		cursor: str, optional
+			next_cursor from the previous page, omitted for the first page
+		limit: int, default to 20
+			Page size
+		category_pk: int, optional
+		author_pk: int, optional
+			Only list posts in this category / by this author
+		"""
+		before = decode_cursor(cursor) if cursor else None
+		return self._cached(
+			("list_posts_page", before, limit, category_pk, author_pk, self._lists_version),
+			lambda: self._list_posts_page(before, limit, category_pk, author_pk),
+			lambda page: dict(page, posts=_copy_rows(page["posts"])))
 
-	def list_popular_posts(self) -> List[dict]:
+	def iter_posts(self, category_pk: int = None, author_pk: int = None) -> Iterator[dict]:
+		"""
+		Lazily yields every published post, newest first, in the list_posts
+		format. Posts are read from the repository a chunk at a time, so
+		memory stays flat however many posts there are.
+		"""
+		for post in self._post_repository.iter_published(
+				category_pk=category_pk, author_pk=author_pk):
+			yield post_summary(post)
+
+	def list_popular_posts(self, days: int = None) -> List[dict]:
 		"""
 		Returns a list of 10 published posts in the format:
 
@@ -96,9 +266,26 @@ class BlogService:
 			...
 		]
 		This list is sorted, decending by <view count>.
+
+		Parameters
+		----------
+		days: int, optional
+			Only count the views of today and the previous days - 1 days,
+			eg. 7 for popular this week. Needs view_rollups keeping a
+			window of that many days, posts without views in it are left
+			out.
 		"""
+		if days is None:
+			top = self._popular_posts_index.top(POPULAR_POSTS_LIMIT)
+		elif self._view_rollups is None:
+			raise RuntimeError("list_popular_posts(days=...) needs BlogService view_rollups.")
+		else:
+			top = self._view_rollups.top(days, POPULAR_POSTS_LIMIT)
+		return [dict(self._cached(("summary", post_pk, self._post_versions.get(post_pk, 0)),
+				lambda: self._load_summary(post_pk), dict), views=views)
+			for post_pk, views in top]
 
-	def get_post_by_pk(self, post_pk: int) -> dict:
+	def get_post_by_pk(self, post_pk: int, user_pk: int = None) -> dict:
 		"""
 		Returns a blog object based on it's primary key.
 
@@ -110,6 +297,9 @@ class BlogService:
 		----------
 		post_pk: int
 			The primary key of the post to be retreived
+		user_pk: int, optional
+			The primary key of the viewing user, views are only
+			recorded for known users
 
 		returns
 			{
@@ -134,7 +324,166 @@ class BlogService:
 				"updated_at": <updated at datetime>
 			},
 		"""
-		raise NotImplementedError
+		if self._response_cache is not None:
+			author_pk, post = self._response_cache.get_or_compute(
+				("post", post_pk, self._post_versions.get(post_pk, 0)),
+				lambda: self._load_post(post_pk))
+			if user_pk is not None:
+				self._record_view(post_pk, author_pk, user_pk)
+			return dict(post, comments=_copy_rows(post["comments"]),
+				views=self._popular_posts_index.view_count(post_pk))
+
+		if self._post_projection is not None:
+			author_pk, post = self._load_post(post_pk)
+			if user_pk is not None:
+				self._record_view(post_pk, author_pk, user_pk)
+			return dict(post, views=self._popular_posts_index.view_count(post_pk))
+
+		post = self._post_repository.get(post_pk)
+		if user_pk is not None:
+			self._record_view(post.pk, post.author.pk, user_pk, post=post)
+
+		return dict(post_dict(post),
+			comments=[comment_dict(comment)
+				for comment in self._comment_repository.list_by_post(post_pk)],
+			views=self._popular_posts_index.view_count(post_pk),
+		)
+
+	def search_posts(self, query: str, limit: int = 20,
+		category_pk: int = None, author_pk: int = None) -> List[dict]:
+		"""
+		Returns the published posts best matching query, by title and
+		body, in the format:
+
+		[
+			{<post as returned by list_posts>, "score": <relevance>},
+			...
+		]
+
+		This list is sorted, decending by <relevance>.
+
+		Parameters
+		----------
+		query: str
+			The words to look for
+		limit: int, default to 20
+		category_pk: int, optional
+		author_pk: int, optional
+			Only return posts in this category / by this author
+		"""
+		if self._search_index is None:
+			raise RuntimeError("search_posts needs a BlogService built with a search_index.")
+		return [dict(self._cached(("summary", hit.post_pk, self._post_versions.get(hit.post_pk, 0)),
+				lambda: self._load_summary(hit.post_pk), dict), score=hit.score)
+			for hit in self._search_index.search(query, limit, status='p',
+				category_pk=category_pk, author_pk=author_pk)]
+
+	def create_post(self, author_pk: int, title: str, body: str = '',
+		category_pk: int = None) -> dict:
+		"""
+		Create a draft post
+
+		Parameters
+		----------
+		author_pk: int
+			The primary key of the writing user, an author or moderator
+		title: str
+			The title of the post
+		body: str, optional
+			The body of the post
+		category_pk: int, optional
+			The primary key of the post's category
+
+		returns
+			The post as returned by get_post_by_pk, without
+			"comments" and "views".
+		"""
+		post = Post(
+			title=title,
+			author=self._user_repository.get(author_pk),
+			body=body,
+			category=self._category_repository.get(category_pk) if category_pk is not None else None
+		)
+		post = self._post_repository.add(post)
+		self._post_saved(post)
+		return post_dict(post)
+
+	def update_post(self, post_pk: int, user_pk: int, **changes) -> dict:
+		"""
+		Update a post, enforcing Post.update rules
+
+		Parameters
+		----------
+		post_pk: int
+			The primary key of the post to be updated
+		user_pk: int
+			The primary key of the user making the update
+		**changes: field_name=value
+			As accepted by Post.update, a category may also be
+			passed as category_pk=<category pk>
+
+		returns
+			The post, as returned by create_post
+		"""
+		self._resolve_category(changes)
+		updated_by = self._permission_cache.get(user_pk)
+		with self._post_locks.lock_for(post_pk):
+			post = self._post_repository.get(post_pk)
+			post.update(updated_by=updated_by, **changes)
+			# Updates that change nothing are not written
+			changed_fields = post.changed_fields()
+			if changed_fields:
+				post = self._post_repository.update(post)
+				self._post_saved(post, changed_fields)
+		return post_dict(post)
+
+	def update_posts_bulk(self, post_pks: Iterable[int], user_pk: int, **changes) -> dict:
+		"""
+		Apply the same update to many posts, eg. a moderation sweep
+		archiving posts, enforcing Post.bulk_update rules. Posts that
+		can't be updated are reported without stopping the others, which
+		are saved in one batch.
+
+		Parameters
+		----------
+		post_pks: Iterable[int]
+			The primary keys of the posts to be updated
+		user_pk: int
+			The primary key of the user making the update
+		**changes: field_name=value
+			As accepted by update_post
+
+		returns
+		{
+			"posts": [<post as returned by update_post>, ...],
+			"errors": {<post pk>: <error message>, ...}
+		}
+		"""
+		self._resolve_category(changes)
+		updated_by = self._permission_cache.get(user_pk)
+
+		post_pks = list(dict.fromkeys(post_pks))
+		posts, errors = [], {}
+		with self._post_locks.locks_for(post_pks):
+			for post_pk in post_pks:
+				try:
+					posts.append(self._post_repository.get(post_pk))
+				except DomainModelNotFoundException as error:
+					errors[post_pk] = str(error)
+
+			result = Post.bulk_update(posts, updated_by=updated_by, **changes)
+			for index, error in result.errors.items():
+				errors[posts[index].pk] = str(error)
+
+			changed = [(post, post.changed_fields()) for post in result.objects]
+			changed = [(post, fields) for post, fields in changed if fields]
+			self._post_repository.update_many([post for post, _ in changed])
+			for post, fields in changed:
+				self._post_saved(post, fields)
+		return {
+			"posts": [post_dict(post) for post in result.objects],
+			"errors": errors,
+		}
 
 	def create_comment(self, post_pk: int, user_id: int, body: str) -> dict:
 		"""
@@ -157,5 +506,295 @@ class BlogService:
 			"body": <comment body>
 		}
 		"""
-		raise NotImplementedError
+		comment = Comment(
+			post=self._post_repository.get(post_pk),
+			user=self._user_repository.get(user_id),
+			body=body
+		)
+		comment = self._comment_repository.add(comment)
+		self._comment_added(comment)
+		return comment_dict(comment)
+
+	def create_comments_bulk(self, comments: Iterable[dict]) -> dict:
+		"""
+		Create many comments, eg. for a content migration. Each post and
+		user is loaded once however many comments refer to it. Comments
+		that can't be created are reported without stopping the others,
+		which are saved in one batch.
+
+		Parameters
+		----------
+		comments: Iterable[dict]
+			{"post_pk": <post pk>, "user_id": <user id>, "body": <comment body>}
+			for each comment, as passed to create_comment
+
+		returns
+		{
+			"comments": [<comment as returned by create_comment>, ...],
+			"errors": {<index in comments>: <error message>, ...}
+		}
+		"""
+		posts, users = {}, {}
+		rows, row_indexes, errors = [], [], {}
+		for index, data in enumerate(comments):
+			try:
+				post_pk, user_id = data['post_pk'], data['user_id']
+				post = posts.get(post_pk)
+				if post is None:
+					post = posts[post_pk] = self._post_repository.get(post_pk)
+				user = users.get(user_id)
+				if user is None:
+					user = users[user_id] = self._user_repository.get(user_id)
+			except (KeyError, DomainModelNotFoundException) as error:
+				errors[index] = str(error)
+				continue
+			rows.append({'post': post, 'user': user, 'body': data.get('body')})
+			row_indexes.append(index)
+
+		result = Comment.bulk_create(rows)
+		for row_index, error in result.errors.items():
+			errors[row_indexes[row_index]] = str(error)
+
+		created = self._comment_repository.add_many(result.objects)
+		for comment in created:
+			self._comment_added(comment)
+		return {
+			"comments": [comment_dict(comment) for comment in created],
+			"errors": dict(sorted(errors.items())),
+		}
+
+	def rebuild_popular_posts(self):
+		"""
+		Recomputes view counters and the popular posts ranking from the
+		stored posts and View history.
+		"""
+		posts = self._all_posts()
+		self._popular_posts_index.rebuild(
+			self._count_views([post.pk for post in posts]),
+			[post.pk for post in posts if post.status == 'p'])
+
+	def rebuild_read_models(self):
+		"""
+		Full rebuild of every derived read structure (popular posts and,
+		when used, the post projection, search index and view rollups)
+		from the repositories. Run after
+		writes that bypassed this service, eg. data migrations.
+		"""
+		self.rebuild_popular_posts()
+		if self._search_index is not None:
+			self._search_index.rebuild(self._all_posts())
+		if self._view_rollups is not None:
+			posts = self._all_posts()
+			self._view_rollups.rebuild(posts,
+				(view for post in posts for view in self._view_repository.list_by_post(post.pk)))
+		if self._post_projection is not None:
+			self._rebuild_projection()
+		if self._response_cache is not None:
+			self._response_cache.clear()
+
+	#########
+	# Helpers
+	def _all_posts(self) -> List[Post]:
+		return [post for status, _ in Post.STATUS
+			for post in self._post_repository.list_by_status(status)]
+
+	def _rebuild_projection(self):
+		posts = self._all_posts()
+		self._post_projection.rebuild(posts,
+			[comment for post in posts
+				for comment in self._comment_repository.list_by_post(post.pk)],
+			self._count_views([post.pk for post in posts]))
+
+	def _count_views(self, post_pks: List[int]) -> Dict[int, int]:
+		"""
+		View counts per post, stored and archived.
+		"""
+		counts = self._view_repository.count_by_posts(post_pks)
+		if self._view_archive is not None:
+			for post_pk, count in self._view_archive.count_by_posts(post_pks).items():
+				counts[post_pk] = counts.get(post_pk, 0) + count
+		return counts
+
+	def _cached(self, key: tuple, compute, copy):
+		"""
+		compute() through the response cache when there is one. Cached
+		values are shared, so callers get copy(value).
+		"""
+		if self._response_cache is None:
+			return compute()
+		return copy(self._response_cache.get_or_compute(key, compute))
+
+	def _list_posts(self) -> List[dict]:
+		if self._post_projection is not None:
+			return self._post_projection.list_published()
+		return [post_summary(post)
+			for post in self._post_repository.list_by_status('p')]
+
+	def _list_posts_page(self, before: Optional[Tuple[datetime.datetime, int]],
+		limit: int, category_pk: Optional[int], author_pk: Optional[int]) -> dict:
+		posts = list(islice(self._post_repository.iter_published(
+			before=before,
+			category_pk=category_pk,
+			author_pk=author_pk,
+			chunk_size=limit + 1
+		), limit + 1))
+
+		next_cursor = None
+		if len(posts) > limit:
+			posts = posts[:limit]
+			next_cursor = encode_cursor(posts[-1].published_at, posts[-1].pk)
+		return {
+			"posts": [post_summary(post) for post in posts],
+			"next_cursor": next_cursor,
+		}
+
+	def _load_summary(self, post_pk: int) -> dict:
+		if self._post_projection is not None:
+			return self._post_projection.get_summary(post_pk)
+		return post_summary(self._post_repository.get(post_pk))
+
+	def _load_post(self, post_pk: int) -> Tuple[int, dict]:
+		"""
+		Returns (author pk, post as returned by get_post_by_pk).
+		"""
+		if self._post_projection is not None:
+			try:
+				author_pk = self._post_projection.get_author_pk(post_pk)
+			except KeyError:
+				raise DomainModelNotFoundException(
+					"Post with pk %s does not exist." % post_pk) from None
+			return author_pk, self._post_projection.get_detail(post_pk)
+
+		post = self._post_repository.get(post_pk)
+		return post.author.pk, dict(post_dict(post),
+			comments=[comment_dict(comment)
+				for comment in self._comment_repository.list_by_post(post_pk)],
+			views=self._popular_posts_index.view_count(post_pk),
+		)
+
+	def _resolve_category(self, changes: dict):
+		"""
+		Swaps a category_pk in update changes for the Category.
+		"""
+		if 'category_pk' in changes:
+			category_pk = changes.pop('category_pk')
+			changes['category'] = (self._category_repository.get(category_pk)
+				if category_pk is not None else None)
+
+	def _post_saved(self, post: Post, changed_fields: List[str] = None):
+		"""
+		changed_fields is None for a new post.
+		"""
+		if self._event_log is not None:
+			self._event_log.append(PostSaved.from_post(post, changed_fields))
+		if self._response_cache is not None:
+			# Lists hold published posts, so a post entering, leaving or
+			# changing within them changes the lists
+			lists_changed = post.status == 'p' or post.pk in self._popular_posts_index
+			with self._versions_lock:
+				self._post_versions[post.pk] = self._post_versions.get(post.pk, 0) + 1
+				if lists_changed:
+					self._lists_version += 1
+		self._popular_posts_index.update_post(post)
+		if self._post_projection is not None:
+			self._post_projection.post_saved(post)
+		if self._search_index is not None:
+			self._search_index.update_post(post)
+		if self._view_rollups is not None:
+			self._view_rollups.update_post(post)
+
+	def _comment_added(self, comment: Comment):
+		if self._event_log is not None:
+			self._event_log.append(CommentAdded.from_comment(comment))
+		if self._response_cache is not None:
+			post_pk = comment.post.pk
+			with self._versions_lock:
+				self._post_versions[post_pk] = self._post_versions.get(post_pk, 0) + 1
+		if self._post_projection is not None:
+			self._post_projection.comment_added(comment)
+
+	def _views_written(self, events: List[ViewEvent]):
+		for event in events:
+			self._view_recorded(event.post_pk, event.user_pk, event.viewed_at)
+
+	def _view_recorded(self, post_pk: int, user_pk: int, viewed_at: float = None):
+		if viewed_at is None:
+			viewed_at = time.time()
+		if self._event_log is not None:
+			self._event_log.append(ViewRecorded(post_pk, user_pk, viewed_at))
+		self._popular_posts_index.record_view(post_pk)
+		if self._view_rollups is not None:
+			self._view_rollups.record_view(post_pk, user_pk, viewed_at)
+		if self._post_projection is not None:
+			self._post_projection.view_recorded(post_pk)
+
+	def _record_view(self, post_pk: int, author_pk: int, user_pk: int, post: Post = None):
+		if user_pk == author_pk:
+			return
+
+		# Marks the pair seen up front, so concurrent reads can't both
+		# record it, and forgets it again when no view was stored
+		if not self._last_seen_index.should_record(user_pk, post_pk):
+			return
+		try:
+			stored = self._store_view(post_pk, user_pk, post)
+		except BaseException:
+			self._last_seen_index.forget(user_pk, post_pk)
+			raise
+		if not stored:
+			self._last_seen_index.forget(user_pk, post_pk)
+		elif self._view_pipeline is None:
+			# Pipeline views are counted once written, see _views_written
+			self._view_recorded(post_pk, user_pk)
+
+	def _store_view(self, post_pk: int, user_pk: int, post: Post = None) -> bool:
+		"""
+		Writes or queues a view, returning False when it wasn't.
+		"""
+		if self._view_pipeline is not None:
+			return self._view_pipeline.enqueue(post_pk, user_pk)
+		try:
+			user = self._user_repository.get(user_pk)
+		except DomainModelNotFoundException:
+			# Views are only recorded for known users
+			return False
+		self._view_repository.add(View(post=post or self._post_repository.get(post_pk), user=user))
+		return True
+
+
+def post_summary(post: Post) -> dict:
+	"""
+	A post as listed, without its body.
+	"""
+	return {
+		"pk": post.pk,
+		"title": post.title,
+		"author": post.author.full_name,
+		"published_at": post.published_at,
+		"category": post.category.name if post.category else None,
+	}
+
+
+def post_dict(post: Post) -> dict:
+	"""
+	A post as returned on its own, without comments or views.
+	"""
+	return dict(post_summary(post),
+		status=post.status,
+		body=post.body,
+		created_at=post.created_at,
+		updated_at=post.updated_at,
+	)
+
+
+def comment_dict(comment: Comment) -> dict:
+	return {
+		"pk": comment.pk,
+		"post_pk": comment.post.pk,
+		"user_name": comment.user.full_name,
+		"body": comment.body,
+	}
+
 
+def _copy_rows(rows: List[dict]) -> List[dict]:
+	return [dict(row) for row in rows]
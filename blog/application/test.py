@@ -0,0 +1,433 @@
+import asyncio
+import datetime
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from analytics.domain.models import View
+from analytics.infrastructure.archive import ViewArchive, compact_views
+from analytics.infrastructure.ingestion import ViewIngestionPipeline
+from analytics.infrastructure.memory import AsyncInMemoryViewRepository, InMemoryViewRepository
+from auth.domain.models import User
+from auth.domain.repository import UserRepositoryInterface
+from auth.infrastructure.memory import AsyncInMemoryUserRepository, InMemoryUserRepository
+from auth.infrastructure.permissions import PermissionCache
+from blog.application.blog_service import BlogService
+from blog.domain.models import Category, Post
+from blog.domain.repository import CategoryRepositoryInterface
+from blog.infrastructure.memory import (AsyncInMemoryCategoryRepository,
+	AsyncInMemoryCommentRepository, AsyncInMemoryPostRepository, InMemoryCategoryRepository,
+	InMemoryCommentRepository, InMemoryPostRepository)
+from blog.infrastructure.wiring import build_async_blog_service, build_blog_service
+from shared.domain.models import DomainModelNotFoundException
+
+
+class BlogData:
+	"""
+	The users and category the blog tests start from, added to the
+	repositories passed. Shared by the BlogService and AsyncBlogService
+	tests.
+	"""
+	def __init__(self, users: UserRepositoryInterface, categories: CategoryRepositoryInterface):
+		self.reader = users.add(User(
+			username="user1",
+			password="testpass",
+			email="user@example.com",
+			first_name="First",
+			last_name="Reader",
+			is_active=True,
+			is_author=False,
+			is_moderator=False
+		))
+		self.author = users.add(User(
+			username="user2",
+			password="testpass",
+			email="user@example.com",
+			first_name="First",
+			last_name="Author",
+			is_active=True,
+			is_author=True,
+			is_moderator=False
+		))
+		self.moderator = users.add(User(
+			username="user3",
+			password="testpass",
+			email="user@example.com",
+			first_name="First",
+			last_name="Moderator",
+			is_active=True,
+			is_author=False,
+			is_moderator=True
+		))
+		self.category = categories.add(Category(name="For Fun!"))
+
+	def publish_post(self, service: BlogService, title="Hello World", category=None) -> int:
+		"""
+		Creates a post by author, published by moderator, returning its pk.
+		"""
+		post = service.create_post(self.author.pk, title, body="This is my cool article.",
+			category_pk=category.pk if category else None)
+		service.update_post(post['pk'], self.author.pk, status='r')
+		service.update_post(post['pk'], self.moderator.pk, status='p')
+		return post['pk']
+
+
+class BlogServiceTests(unittest.TestCase):
+
+	def build_repositories(self):
+		"""
+		Overridden to run these tests against other repository implementations.
+		"""
+		self.users = InMemoryUserRepository()
+		self.categories = InMemoryCategoryRepository()
+		self.posts = InMemoryPostRepository()
+		self.comments = InMemoryCommentRepository()
+		self.views = InMemoryViewRepository()
+
+	def service_options(self) -> dict:
+		"""
+		Overridden to run these tests against other BlogService setups.
+		"""
+		return {}
+
+	def setUp(self):
+		self.build_repositories()
+		self.service = build_blog_service(
+			comment_repository=self.comments,
+			post_repository=self.posts,
+			view_repository=self.views,
+			user_repository=self.users,
+			category_repository=self.categories,
+			**self.service_options()
+		)
+
+		self.data = BlogData(self.users, self.categories)
+		self.reader, self.author = self.data.reader, self.data.author
+		self.moderator, self.category = self.data.moderator, self.data.category
+
+	def publish_post(self, title="Hello World", category=None) -> Post:
+		return self.posts.get(self.data.publish_post(self.service, title, category))
+
+	def test_list_posts(self):
+		published = self.publish_post(category=self.category)
+		self.posts.add(Post(title="Draft", author=self.author))
+		archived = self.publish_post(title="Old news")
+		self.service.update_post(archived.pk, self.author.pk, status='a')
+
+		self.assertEqual(self.service.list_posts(), [{
+			"pk": published.pk,
+			"title": "Hello World",
+			"author": "First Author",
+			"published_at": published.published_at,
+			"category": "For Fun!",
+		}])
+		self.assertEqual([post.pk for post in self.posts.list_by_status('a')], [archived.pk])
+		self.assertEqual(len(self.posts.list_by_author(self.author.pk)), 3)
+		self.assertEqual(self.posts.list_by_category(self.category.pk), [published])
+
+	def test_list_posts_page(self):
+		other_category = self.categories.add(Category(name="Serious"))
+		posts = [self.publish_post(title="Post %d" % i,
+			category=self.category if i % 2 else other_category) for i in range(5)]
+		self.posts.add(Post(title="Draft", author=self.author))
+		newest_first = [post.pk for post in reversed(posts)]
+
+		pages, cursor = [], None
+		while True:
+			page = self.service.list_posts_page(cursor=cursor, limit=2)
+			pages.append([post['pk'] for post in page['posts']])
+			cursor = page['next_cursor']
+			if cursor is None:
+				break
+		self.assertEqual(pages, [newest_first[:2], newest_first[2:4], newest_first[4:]])
+
+		page = self.service.list_posts_page(limit=10, category_pk=self.category.pk)
+		self.assertEqual([post['pk'] for post in page['posts']], [posts[3].pk, posts[1].pk])
+		self.assertIsNone(page['next_cursor'])
+		page = self.service.list_posts_page(limit=1, category_pk=other_category.pk,
+			author_pk=self.author.pk)
+		self.assertEqual([post['title'] for post in page['posts']], ["Post 4"])
+
+		self.assertEqual([post['pk'] for post in self.service.iter_posts()], newest_first)
+		self.assertEqual(len(list(self.service.iter_posts(author_pk=self.reader.pk))), 0)
+		with self.assertRaises(ValueError):
+			self.service.list_posts_page(cursor="not a cursor")
+
+	def test_get_post_by_pk_records_views(self):
+		post = self.publish_post()
+		# A view from before the window, as read back from storage
+		self.views.add(View.hydrate({'post': post, 'user': self.moderator,
+			'viewed_at': datetime.datetime.now() - datetime.timedelta(minutes=6)}))
+		self.service.rebuild_read_models()
+
+		# Authors don't count as viewers
+		self.assertEqual(self.service.get_post_by_pk(post.pk, user_pk=self.author.pk)['views'], 1)
+		# Repeat views inside the window only count once
+		self.assertEqual(self.service.get_post_by_pk(post.pk, user_pk=self.reader.pk)['views'], 2)
+		self.assertEqual(self.service.get_post_by_pk(post.pk, user_pk=self.reader.pk)['views'], 2)
+		# Once the window has passed the viewer counts again
+		self.assertEqual(self.service.get_post_by_pk(post.pk, user_pk=self.moderator.pk)['views'], 3)
+		self.assertEqual(self.service.get_post_by_pk(post.pk, user_pk=self.moderator.pk)['views'], 3)
+
+		# Every backend names the model
+		with self.assertRaisesRegex(DomainModelNotFoundException, "^Post with pk %d " % (post.pk + 100)):
+			self.service.get_post_by_pk(post.pk + 100)
+		# Unknown viewers still get the post, without a view
+		self.assertEqual(self.service.get_post_by_pk(post.pk, user_pk=999)['views'], 3)
+		self.assertEqual(self.views.count_by_post(post.pk), 3)
+		# and aren't marked as seen, so their view counts once they exist
+		self.users.add(User(pk=999, username="user999", password="testpass",
+			email="user@example.com", first_name="First", last_name="Late"))
+		self.assertEqual(self.service.get_post_by_pk(post.pk, user_pk=999)['views'], 4)
+
+	def test_failed_view_write_is_not_marked_seen(self):
+		post = self.publish_post()
+		with mock.patch.object(self.views, 'add', side_effect=RuntimeError("disk full")):
+			with self.assertRaises(RuntimeError):
+				self.service.get_post_by_pk(post.pk, user_pk=self.reader.pk)
+		self.assertEqual(self.service.get_post_by_pk(post.pk, user_pk=self.reader.pk)['views'], 1)
+
+	def test_get_post_by_pk_with_view_pipeline(self):
+		post = self.publish_post()
+		pipeline = ViewIngestionPipeline(self.views, self.posts, self.users, flush_interval=60)
+		self.service = build_blog_service(self.comments, self.posts, self.views, self.users,
+			self.categories, view_pipeline=pipeline, **self.service_options())
+
+		# Views count once written
+		self.assertEqual(self.service.get_post_by_pk(post.pk, user_pk=self.reader.pk)['views'], 0)
+		self.assertEqual(self.service.get_post_by_pk(post.pk, user_pk=self.moderator.pk)['views'], 0)
+		# Unknown viewers are skipped, the rest of the batch is written
+		self.service.get_post_by_pk(post.pk, user_pk=999)
+		pipeline.close()
+		self.assertEqual((pipeline.written, pipeline.skipped, pipeline.failed), (2, 1, 0))
+		self.assertEqual([view.user.pk for view in self.views.list_by_post(post.pk)],
+			[self.reader.pk, self.moderator.pk])
+		self.assertEqual(self.service.get_post_by_pk(post.pk)['views'], 2)
+
+	def test_create_comment(self):
+		post = self.publish_post()
+		comment = self.service.create_comment(post.pk, self.reader.pk, "My comment!")
+		self.assertEqual(comment, {
+			"pk": 1,
+			"post_pk": post.pk,
+			"user_name": "First Reader",
+			"body": "My comment!",
+		})
+		self.assertIsInstance(self.comments.get(1).created_at, datetime.datetime)
+
+		detail = self.service.get_post_by_pk(post.pk)
+		self.assertEqual(detail['comments'], [comment])
+		self.assertEqual(detail['status'], 'p')
+
+	def test_update_post_permissions(self):
+		now = [0]
+		permissions = PermissionCache(self.users, ttl=60, clock=lambda: now[0])
+		self.service = build_blog_service(
+			comment_repository=self.comments,
+			post_repository=self.posts,
+			view_repository=self.views,
+			user_repository=self.users,
+			category_repository=self.categories,
+			permission_cache=permissions,
+			**self.service_options()
+		)
+		post = self.service.create_post(self.author.pk, "Hello World")
+		self.service.update_post(post['pk'], self.author.pk, status='r')
+
+		# Role checks don't load users
+		get_user = self.users.get
+		def fail(*args, **kwargs):
+			raise AssertionError("Update loaded a User")
+		self.users.get = fail
+		with self.assertRaises(ValueError):
+			self.service.update_post(post['pk'], self.author.pk, status='p')
+		self.users.get = get_user
+
+		# Role changes are seen once invalidated
+		author = self.users.get(self.author.pk)
+		author.is_moderator = True
+		self.users.update(author)
+		with self.assertRaises(ValueError):
+			self.service.update_post(post['pk'], self.author.pk, status='p')
+		permissions.invalidate(self.author.pk)
+		self.assertEqual(self.service.update_post(post['pk'], self.author.pk, status='p')['status'], 'p')
+
+		# or once the cached roles expire
+		author.is_moderator = False
+		self.users.update(author)
+		self.service.update_post(post['pk'], self.author.pk, status='r')
+		now[0] = 61
+		with self.assertRaises(ValueError):
+			self.service.update_post(post['pk'], self.author.pk, status='p')
+
+		with self.assertRaises(DomainModelNotFoundException):
+			self.service.update_post(post['pk'], 999, status='a')
+
+	def test_create_comments_bulk(self):
+		post = self.publish_post()
+		result = self.service.create_comments_bulk([
+			{"post_pk": post.pk, "user_id": self.reader.pk, "body": "First!"},
+			{"post_pk": 999, "user_id": self.reader.pk, "body": "No post"},
+			{"post_pk": post.pk, "user_id": self.author.pk, "body": None},
+			{"post_pk": post.pk, "user_id": self.author.pk, "body": "Thanks"},
+		])
+		self.assertEqual([comment['body'] for comment in result['comments']], ["First!", "Thanks"])
+		self.assertEqual(list(result['errors']), [1, 2])
+		self.assertEqual(self.service.get_post_by_pk(post.pk)['comments'], result['comments'])
+
+	def test_update_post_clears_category(self):
+		post = self.service.create_post(self.author.pk, "Hello World", category_pk=self.category.pk)
+		updated = self.service.update_post(post['pk'], self.author.pk, category_pk=None)
+		self.assertIsNone(updated['category'])
+		self.assertIsNone(self.posts.get(post['pk']).category)
+		self.assertEqual(self.posts.list_by_category(self.category.pk), [])
+
+	def test_update_posts_bulk(self):
+		published = [self.publish_post(title="Post %d" % i) for i in range(3)]
+		draft = self.service.create_post(self.author.pk, "Draft")
+
+		result = self.service.update_posts_bulk(
+			[post.pk for post in published] + [draft['pk'], 999], self.moderator.pk,
+			title="Renamed")
+		self.assertEqual([post['pk'] for post in result['posts']], [draft['pk']])
+		self.assertEqual(sorted(result['errors']),
+			sorted([post.pk for post in published] + [999]))
+
+		result = self.service.update_posts_bulk(
+			[post.pk for post in published[:2]], self.moderator.pk, status='a')
+		self.assertEqual(result['errors'], {})
+		self.assertEqual([post['status'] for post in result['posts']], ['a', 'a'])
+		self.assertEqual([post['pk'] for post in self.service.list_posts()], [published[2].pk])
+		self.assertEqual(self.posts.get(published[0].pk).status, 'a')
+
+		with self.assertRaises(ValueError):
+			self.service.update_posts_bulk([draft['pk']], self.author.pk, status='p')
+
+	def test_list_popular_posts(self):
+		posts = [self.publish_post(title="Post %d" % i) for i in range(12)]
+		for i, post in enumerate(posts):
+			for _ in range(i):
+				self.views.add(View(post=post, user=self.reader))
+
+		self.service.rebuild_read_models()
+
+		popular = self.service.list_popular_posts()
+		self.assertEqual([post['views'] for post in popular], list(range(11, 1, -1)))
+		self.assertEqual(popular[0]['pk'], posts[-1].pk)
+
+		# New views move posts up, archiving drops them out
+		for i in range(3):
+			self.service.get_post_by_pk(posts[0].pk, user_pk=self.users.add(User(
+				username="viewer%d" % i, password="testpass", email="user@example.com",
+				first_name="First", last_name="Viewer")).pk)
+		self.service.update_post(posts[-1].pk, self.author.pk, status='a')
+		popular = self.service.list_popular_posts()
+		self.assertEqual([post['views'] for post in popular], list(range(10, 2, -1)) + [3, 2])
+		self.assertNotIn(posts[-1].pk, [post['pk'] for post in popular])
+		# Ties go to the lowest pk
+		self.assertEqual(popular[-3]['pk'], posts[0].pk)
+
+	def test_archived_views(self):
+		post = self.publish_post()
+		now = datetime.datetime.now()
+		views = [View(post=post, user=user) for user in (self.reader, self.moderator) * 3]
+		for days_ago, view in enumerate(views):
+			view.viewed_at = now - datetime.timedelta(days=days_ago)
+		self.views.add_many(views)
+
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		archive = ViewArchive(directory.name)
+		self.addCleanup(archive.close)
+		moved = compact_views(self.views, archive, now - datetime.timedelta(hours=12), batch_size=3)
+		self.assertEqual((moved, archive.segment_count), (5, 2))
+		self.assertEqual(self.views.count_by_post(post.pk), 1)
+		self.assertEqual(archive.count(post.pk, user_pk=self.reader.pk), 2)
+
+		# Rebuilt counts include the archived views
+		service = build_blog_service(self.comments, self.posts, self.views, self.users,
+			self.categories, view_archive=archive)
+		self.assertEqual(service.get_post_by_pk(post.pk)['views'], 6)
+
+	def test_update_post(self):
+		post = self.service.create_post(self.author.pk, "Hello World")
+		self.assertEqual((post['status'], post['category']), ('d', None))
+
+		post = self.service.update_post(post['pk'], self.author.pk,
+			title="New title", category_pk=self.category.pk)
+		self.assertEqual((post['title'], post['category']), ("New title", "For Fun!"))
+		self.assertIsInstance(post['updated_at'], datetime.datetime)
+
+		with self.assertRaises(ValueError):
+			self.service.update_post(post['pk'], self.author.pk, status='p')
+		with self.assertRaises(ValueError):
+			self.service.create_post(self.reader.pk, "Hello World")
+
+
+class AsyncBlogServiceTests(unittest.IsolatedAsyncioTestCase):
+	"""
+	Runs AsyncBlogService over async repositories sharing the stores of
+	a BlogService, which is used to create the data and check results.
+	"""
+	LATENCY = 0.05
+
+	def setUp(self):
+		stores = (InMemoryCommentRepository(), InMemoryPostRepository(), InMemoryViewRepository(),
+			InMemoryUserRepository(), InMemoryCategoryRepository())
+		comments, posts, views, users, categories = stores
+		self.data = BlogData(users, categories)
+		self.blog_service = build_blog_service(*stores)
+		self.repositories = [repository_class(repository, latency=self.LATENCY)
+			for repository_class, repository in zip((AsyncInMemoryCommentRepository,
+				AsyncInMemoryPostRepository, AsyncInMemoryViewRepository,
+				AsyncInMemoryUserRepository, AsyncInMemoryCategoryRepository), stores)]
+		self.service = build_async_blog_service(*self.repositories, timeout=self.LATENCY * 4)
+		self.post = posts.get(self.data.publish_post(self.blog_service, category=self.data.category))
+
+	async def asyncTearDown(self):
+		await self.service.close()
+
+	async def test_get_post_by_pk(self):
+		await self.service.create_comment(self.post.pk, self.data.reader.pk, "My comment!")
+		start = time.perf_counter()
+		post = await self.service.get_post_by_pk(self.post.pk, user_pk=self.data.reader.pk)
+		# Post, comments and view count are read concurrently
+		self.assertLess(time.perf_counter() - start, self.LATENCY * 2)
+		self.assertEqual(post, self.blog_service.get_post_by_pk(self.post.pk))
+		self.assertEqual(post['comments'][0]['user_name'], "First Reader")
+		self.assertEqual(post['views'], 0)
+
+		# The view is written in the background, repeats and the author's are not
+		await self.service.get_post_by_pk(self.post.pk, user_pk=self.data.reader.pk)
+		await self.service.get_post_by_pk(self.post.pk, user_pk=self.data.author.pk)
+		await self.service.get_post_by_pk(self.post.pk, user_pk=-1)
+		await self.service.close()
+		self.assertEqual((self.service.written_views, self.service.failed_views), (1, 1))
+		self.assertEqual((await self.service.get_post_by_pk(self.post.pk))['views'], 1)
+		self.assertEqual([post['pk'] for post in await self.service.list_posts()], [self.post.pk])
+
+	async def test_failed_view_write(self):
+		views = self.repositories[2]
+		add = views.add
+
+		async def fail(view):
+			raise ConnectionError("Lost the database")
+		views.add = fail
+		await self.service.get_post_by_pk(self.post.pk, user_pk=self.data.reader.pk)
+		await self.service.close()
+		self.assertEqual(self.service.failed_views, 1)
+
+		# The view wasn't stored, so the next read records it
+		views.add = add
+		await self.service.get_post_by_pk(self.post.pk, user_pk=self.data.reader.pk)
+		await self.service.close()
+		self.assertEqual(self.service.written_views, 1)
+		self.assertEqual((await self.service.get_post_by_pk(self.post.pk))['views'], 1)
+
+	async def test_timeout(self):
+		self.repositories[0].latency = lambda: self.LATENCY * 10
+		with self.assertRaises(asyncio.TimeoutError):
+			await self.service.get_post_by_pk(self.post.pk, user_pk=self.data.reader.pk)
+		await self.service.close()
+		self.assertEqual(self.service.written_views, 0)
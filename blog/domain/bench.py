@@ -0,0 +1,156 @@
+"""
+Benchmarks for Post.
+
+Compares to_json / to_json_many against a naive json.dumps(vars(post))
+for 10k posts with nested authors and categories, and hydrating a
+listing page of posts (with nested authors) from stored rows against
+constructing them through __init__.
+
+Also validates a 10k row feed import column by column with
+validate_columns (then hydrating the valid rows) against constructing
+every row through __init__.
+
+And checks which of 10k posts a moderator could publish, with the
+batched Post.can_transition against calling update on copies and
+catching the errors.
+
+To run:
+
+	cd .../onboard_exercise/
+	python3 -m blog.domain.bench
+"""
+import copy
+import datetime
+import json
+import timeit
+
+from auth.domain.models import User
+from blog.domain.models import Category, Post
+from shared.domain import models as shared_models
+from shared.domain.columnar import validate_columns
+from shared.domain.models import NESTED_PK
+
+
+def build_posts(count: int = 10000):
+	author = User(pk=1, username="author", password="testpass", email="user@example.com",
+		first_name="First", last_name="Last", is_author=True)
+	category = Category(pk=1, name="For Fun!")
+	published_at = datetime.datetime(2021, 3, 4, 5, 6, 7)
+	return [Post(pk=pk, title="Hello World %d" % pk, author=author, category=category,
+		status='p', body="This is my cool article.", published_at=published_at)
+		for pk in range(1, count + 1)]
+
+
+def naive(posts) -> str:
+	return json.dumps([vars(post) for post in posts], default=str)
+
+
+def page_rows(count: int = 500):
+	"""
+	Rows as a joined posts/users/categories query would return them.
+	"""
+	published_at = datetime.datetime(2021, 3, 4, 5, 6, 7)
+	return [(
+		(pk, "Hello World %d" % pk, 'p', "This is my cool article.", published_at, None, None),
+		(pk, "author%d" % pk, "testpass", "user@example.com", "First", "Last", True, False, True),
+		(pk % 10, "Category %d" % (pk % 10)),
+	) for pk in range(1, count + 1)]
+
+
+def construct_page(rows):
+	user_fields = User.schema.field_names
+	posts = []
+	for post_row, user_row, category_row in rows:
+		author = User(**dict(zip(user_fields, user_row)))
+		category = Category(pk=category_row[0], name=category_row[1])
+		pk, title, status, body, published_at, created_at, updated_at = post_row
+		posts.append(Post(pk=pk, title=title, author=author, category=category, status=status,
+			body=body, published_at=published_at, created_at=created_at, updated_at=updated_at))
+	return posts
+
+
+def hydrate_page(rows):
+	users = User.hydrate_many([user_row for _, user_row, _ in rows])
+	categories = Category.hydrate_many([category_row for _, _, category_row in rows])
+	return Post.hydrate_many([(post_row[0], post_row[1], author, category) + post_row[2:]
+		for (post_row, _, _), author, category in zip(rows, users, categories)])
+
+
+def feed_columns(count: int = 10000) -> dict:
+	"""
+	An imported feed, where every 10th row has a bad status.
+	"""
+	author = User(pk=1, username="author", password="testpass", email="user@example.com",
+		first_name="First", last_name="Last", is_author=True)
+	return {
+		'title': ["Imported %d" % i for i in range(count)],
+		'author': [author] * count,
+		'body': ["Imported from a feed."] * count,
+		'status': ['x' if i % 10 == 0 else 'd' for i in range(count)],
+	}
+
+
+def construct_rows(columns: dict):
+	posts, errors = [], {}
+	for i, values in enumerate(zip(*columns.values())):
+		try:
+			posts.append(Post(**dict(zip(columns, values))))
+		except Exception as error:
+			errors[i] = error
+	return posts, errors
+
+
+def validate_then_hydrate(columns: dict):
+	result = validate_columns(Post, columns)
+	rows = [dict(zip(columns, values)) for values, valid
+		in zip(zip(*columns.values()), result.valid) if valid]
+	return Post.hydrate_many(rows), result.errors
+
+
+def dashboard_posts(count: int = 10000):
+	author = User(pk=1, username="author", password="testpass", email="user@example.com",
+		first_name="First", last_name="Last", is_author=True)
+	statuses = [status for status, _ in Post.STATUS]
+	return [Post.hydrate({'pk': pk, 'title': "Post %d" % pk, 'author': author,
+		'status': statuses[pk % len(statuses)]}) for pk in range(1, count + 1)]
+
+
+def can_publish_by_update(posts, user):
+	allowed = []
+	for post in posts:
+		try:
+			copy.copy(post).update(updated_by=user, status='p')
+			allowed.append(True)
+		except ValueError:
+			allowed.append(False)
+	return allowed
+
+
+def timed(func, *args) -> float:
+	return min(timeit.repeat(lambda: func(*args), number=1, repeat=5)) * 1000
+
+
+if __name__ == "__main__":
+	posts = build_posts()
+	print("backend: %s" % ("orjson" if shared_models.orjson else "json"))
+	print("naive json.dumps(vars(post)):   %7.1f ms" % timed(naive, posts))
+	print("post.to_json() per post:        %7.1f ms" % timed(lambda: [p.to_json() for p in posts]))
+	print("Post.to_json_many, embedded:    %7.1f ms" % timed(Post.to_json_many, posts))
+	print("Post.to_json_many, pk refs:     %7.1f ms" % timed(
+		lambda: Post.to_json_many(posts, nested=NESTED_PK)))
+
+	rows = page_rows()
+	print("500 post page, __init__:        %7.2f ms" % timed(construct_page, rows))
+	print("500 post page, hydrate_many:    %7.2f ms" % timed(hydrate_page, rows))
+
+	columns = feed_columns()
+	print("10k row feed, __init__ per row: %7.1f ms" % timed(construct_rows, columns))
+	print("10k row feed, validate_columns: %7.1f ms" % timed(validate_columns, Post, columns))
+	print("  ... then hydrate_many:        %7.1f ms" % timed(validate_then_hydrate, columns))
+
+	posts = dashboard_posts()
+	moderator = User(pk=2, username="moderator", password="testpass", email="user@example.com",
+		first_name="First", last_name="Last", is_moderator=True)
+	print("10k can publish, via update:    %7.1f ms" % timed(can_publish_by_update, posts, moderator))
+	print("10k can publish, can_transition:%7.1f ms" % timed(
+		Post.can_transition, posts, moderator, 'p'))
@@ -0,0 +1,59 @@
+import datetime
+import time
+from typing import Dict, Iterable, NamedTuple
+
+from blog.domain.models import Comment, Post
+from shared.domain.models import BaseDomainModel
+
+
+def _event_value(value):
+	"""
+	Nested domain models are recorded by pk, datetimes as unix seconds.
+	"""
+	if isinstance(value, BaseDomainModel):
+		return value.pk
+	if isinstance(value, datetime.datetime):
+		return value.timestamp()
+	return value
+
+
+class PostSaved(NamedTuple):
+	"""
+	A post was created (changes holds every field) or updated (changes
+	holds the fields that changed), eg. a status transition or title edit.
+	"""
+	KIND = 1
+
+	post_pk: int
+	saved_at: float  # unix seconds
+	changes: Dict[str, object]  # field name -> new value, see _event_value
+
+	@classmethod
+	def from_post(cls, post: Post, fields: Iterable[str] = None) -> 'PostSaved':
+		"""
+		Parameters
+		----------
+		post: Post
+			The post, as stored
+		fields: Iterable[str], optional
+			The fields that changed, every field for a new post
+		"""
+		fields = post.schema.field_names if fields is None else fields
+		return cls(post.pk, time.time(),
+			{field: _event_value(getattr(post, field)) for field in fields if field != 'pk'})
+
+
+class CommentAdded(NamedTuple):
+
+	KIND = 2
+
+	comment_pk: int
+	post_pk: int
+	user_pk: int
+	created_at: float  # unix seconds
+	body: str
+
+	@classmethod
+	def from_comment(cls, comment: Comment) -> 'CommentAdded':
+		return cls(comment.pk, comment.post.pk, comment.user.pk,
+			comment.created_at.timestamp(), comment.body)
@@ -0,0 +1,87 @@
+"""
+Interfaces of the blog read structures, so application code can be
+handed any implementation (see blog.infrastructure).
+"""
+from abc import ABC, abstractmethod
+from typing import Iterable, List, Mapping, NamedTuple
+
+from blog.domain.models import Comment, Post
+
+
+class SearchHit(NamedTuple):
+	post_pk: int
+	score: float
+
+
+class PostProjectionInterface(ABC):
+	"""
+	Flat read models of posts, served without building domain objects.
+	"""
+
+	@abstractmethod
+	def __len__(self) -> int:
+		"""
+		Number of posts held.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def list_published(self) -> List[dict]:
+		raise NotImplementedError
+
+	@abstractmethod
+	def get_summary(self, post_pk: int) -> dict:
+		raise NotImplementedError
+
+	@abstractmethod
+	def get_detail(self, post_pk: int) -> dict:
+		"""
+		Raises KeyError for unknown posts.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def get_author_pk(self, post_pk: int) -> int:
+		raise NotImplementedError
+
+	@abstractmethod
+	def post_saved(self, post: Post):
+		raise NotImplementedError
+
+	@abstractmethod
+	def comment_added(self, comment: Comment):
+		raise NotImplementedError
+
+	@abstractmethod
+	def view_recorded(self, post_pk: int, count: int = 1):
+		raise NotImplementedError
+
+	@abstractmethod
+	def rebuild(self, posts: Iterable[Post], comments: Iterable[Comment],
+		view_counts: Mapping[int, int]):
+		raise NotImplementedError
+
+
+class SearchIndexInterface(ABC):
+	"""
+	Full text search over posts.
+	"""
+
+	@abstractmethod
+	def update_post(self, post: Post):
+		"""
+		Indexes a created or updated post.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def rebuild(self, posts: Iterable[Post]):
+		raise NotImplementedError
+
+	@abstractmethod
+	def search(self, query: str, limit: int = 20, status: str = None,
+		category_pk: int = None, author_pk: int = None) -> List[SearchHit]:
+		"""
+		The limit best matches for query, best first.
+		"""
+		raise NotImplementedError
@@ -1,7 +1,9 @@
 import datetime
+from typing import Dict, FrozenSet, Iterable, List, Sequence, Union
 
-from auth.domain.models import User
-from shared.domain.models import BaseDomainModel, DomainField
+from auth.domain.models import WRITE_ROLES, User, UserRoles
+from shared.domain.models import BaseDomainModel, BulkResult, DomainField
+from shared.domain.status import ANY, StatusMachine, StatusTransition
 
 
 class Category(BaseDomainModel):
@@ -9,6 +11,10 @@ class Category(BaseDomainModel):
 	name = DomainField(dtype=str, required=True)
 
 
+def _set_published_at(post: 'Post'):
+	post.published_at = datetime.datetime.now()
+
+
 class Post(BaseDomainModel):
 
 	STATUS = [
@@ -17,6 +23,15 @@ class Post(BaseDomainModel):
 		('p', 'Published'),
 		('a', 'Archived'),
 	]
+	STATUS_MACHINE = StatusMachine(STATUS, [
+		StatusTransition(None, 'd', 'create'),
+		StatusTransition(ANY, 'd', 'redraft'),
+		StatusTransition(ANY, 'r', 'submit'),
+		StatusTransition('r', 'p', 'publish', role='is_moderator', effects=(_set_published_at,)),
+		StatusTransition(ANY, 'a', 'archive'),
+	], name='post')
+	# Statuses in which the title can still be changed
+	TITLE_EDITABLE = frozenset(['d', 'r'])
 
 	pk = DomainField(dtype=int)
 	title = DomainField(dtype=str, required=True)
@@ -35,43 +50,138 @@ class Post(BaseDomainModel):
 		"""
 		super().__init__(self, *args, **kwargs)
 
-		if not self.pk and self.status != 'd':
+		if not self.pk and not self.STATUS_MACHINE.get(None, self.status):
 			raise ValueError("Cannot create a new post that is in a state other than draft.")
 		self._validate_user_can_write(updated_by=self.author)
 		self._validate_title(title=self.title)
 
+	@classmethod
+	def _validate_columns(cls, columns: Dict[str, list], rows: List[int]) -> Dict[int, Exception]:
+		"""
+		__init__'s rules for a batch, checking each distinct author once.
+		"""
+		pks, statuses, authors = columns['pk'], columns['status'], columns['author']
+		get_transition = cls.STATUS_MACHINE.get
+		author_errors = {}
+		errors = {}
+		for i in rows:
+			if not pks[i] and not get_transition(None, statuses[i]):
+				errors[i] = ValueError("Cannot create a new post that is in a state other than draft.")
+				continue
+
+			author = authors[i]
+			key = id(author)
+			if key not in author_errors:
+				try:
+					cls._validate_user_can_write(updated_by=author)
+					author_errors[key] = None
+				except ValueError as error:
+					author_errors[key] = error
+			if author_errors[key] is not None:
+				errors[i] = ValueError(*author_errors[key].args)
+			# Titles can't fail _validate_title here: title is required, so
+			# an empty one has already failed, and a new post has no old title.
+		return errors
+
 	def __str__(self):
 		return "<Post pk=%s, title=%s, author=%s>" % (self.pk, self.title, self.author)
 
 	def update(self, **kwargs):
-		if 'updated_by' not in kwargs or not isinstance(kwargs['updated_by'], User):
+		if 'updated_by' not in kwargs or not isinstance(kwargs['updated_by'], (User, UserRoles)):
 			raise ValueError("Updates must contain an updated_by argument that passes a User.")
 		else:
 			updated_by = kwargs.pop('updated_by')
 
-		self.validate_values(**kwargs)
+		self._validate_changes(updated_by=updated_by, changes=kwargs)
+		self._apply_changes(updated_by=updated_by, changes=kwargs)
 
-		# Validate per field rules
-		for field, new_val in kwargs.items():
+	@classmethod
+	def can_transition(cls, posts: Sequence['Post'], users: Union[User, Sequence[User]],
+		status: str) -> List[bool]:
+		"""
+		Whether each post could be moved to status by its user, without
+		raising. Each distinct user's roles are looked up once.
+
+		Parameters
+		----------
+		posts: Sequence[Post]
+		users: User or Sequence[User]
+			The acting user, or one per post
+		status: str
+			The status to move to
+		"""
+		return cls.STATUS_MACHINE.can_transition([post.status for post in posts], users, status)
 
-			self.validate_choices(field_name=field, value=new_val)
+	@classmethod
+	def allowed_statuses(cls, posts: Sequence['Post'],
+		users: Union[User, Sequence[User]]) -> List[FrozenSet[str]]:
+		"""
+		The statuses each post can be moved to by its user, see can_transition.
+		"""
+		return cls.STATUS_MACHINE.allowed([post.status for post in posts], users)
 
-			if field == "title":
-				self._validate_title(title=new_val)
+	@classmethod
+	def bulk_update(cls, posts: Iterable['Post'], updated_by: Union[User, UserRoles] = None,
+		**changes) -> BulkResult:
+		"""
+		Applies the same update to many posts, eg. archiving a batch.
+
+		Rules that only depend on updated_by and the new values are
+		checked once and raise, rules that depend on a post's current
+		state are checked per post. A post that fails is left unchanged
+		and reported in the result's errors, the rest are updated.
+
+		Parameters
+		----------
+		posts: Iterable[Post]
+		updated_by: User or UserRoles
+			The user making the update, UserRoles (eg. from a permission
+			cache) is enough as only their roles are checked
+		**changes: field_name=value
+			As accepted by update
+		"""
+		if not isinstance(updated_by, (User, UserRoles)):
+			raise ValueError("Updates must contain an updated_by argument that passes a User.")
+		cls._validate_changes(updated_by=updated_by, changes=changes)
+
+		updated, errors = [], {}
+		for index, post in enumerate(posts):
+			try:
+				post._apply_changes(updated_by=updated_by, changes=changes)
+			except ValueError as error:
+				errors[index] = error
+			else:
+				updated.append(post)
+		return BulkResult(updated, errors)
+
+	def _apply_changes(self, updated_by: Union[User, UserRoles], changes: dict):
+		"""
+		Checks the per post update rules for every change before applying
+		any of them, so a post is never left half updated.
+		"""
+		status, title = self.status, self.title
+		transition = None
+		for field, new_val in changes.items():
+			if field == 'title':
+				if status not in self.TITLE_EDITABLE and new_val != title:
+					raise ValueError("Can only update title in a draft or review state.")
+				title = new_val
 
 			if field == 'status':
-				self._validate_status(updated_by=updated_by, status=new_val)
-
-				if new_val == 'p':
-					self.published_at = datetime.datetime.now()
+				transition = self.STATUS_MACHINE.check(status, new_val, updated_by)
+				status = new_val
 
+		for field, new_val in changes.items():
+			if field == 'status':
+				for effect in transition.effects:
+					effect(self)
 			setattr(self, field, new_val)
 
-
 	#############
 	# Validations
-	def _validate_user_can_write(self, updated_by: User):
-		if not updated_by.is_author and not updated_by.is_moderator:
+	@staticmethod
+	def _validate_user_can_write(updated_by: Union[User, UserRoles]):
+		if not updated_by.roles & WRITE_ROLES:
 			raise ValueError("Only an author or a moderator can create or"
 				" update a post, received %s." % updated_by)
 
@@ -79,18 +189,26 @@ class Post(BaseDomainModel):
 		if not title:
 			raise ValueError("Title cannot be an empty string or null.")
 
-		if self.status not in ['d', 'r'] and title != self.title:
+		if self.status not in self.TITLE_EDITABLE and title != self.title:
 			raise ValueError("Can only update title in a draft or review state.")
 
-	def _validate_status(self, updated_by: User, status: str):
-		if status == 'p' and not updated_by.is_moderator:
-			raise ValueError("Only a User who is_moderator can publish a post.")
+	@classmethod
+	def _validate_changes(cls, updated_by: Union[User, UserRoles], changes: dict):
+		"""
+		Update rules that hold for any post.
+		"""
+		cls.validate_values(**changes)
+		for field, new_val in changes.items():
+			cls.validate_choices(field_name=field, value=new_val)
+
+		if 'title' in changes and not changes['title']:
+			raise ValueError("Title cannot be an empty string or null.")
 
-		elif status == 'p' and self.status != 'r':
-			raise ValueError("A post can only be published from review status.")
+		if 'status' in changes:
+			cls.STATUS_MACHINE.check_role(updated_by, changes['status'])
 
 
-class Comment(BaseDomainModel):
+class Comment(BaseDomainModel, compact=True):
 
 	pk = DomainField(dtype=int)
 	post = DomainField(dtype=Post, required=True)
@@ -100,5 +218,7 @@ class Comment(BaseDomainModel):
 	created_at = DomainField(dtype=datetime.datetime)
 
 	def __init__(self, *args, **kwargs):
-		self.created_at = datetime.datetime.now()
+		# Defaulted before construction so it doesn't count as a change
+		if not kwargs.get('created_at'):
+			kwargs['created_at'] = datetime.datetime.now()
 		super().__init__(self, *args, **kwargs)
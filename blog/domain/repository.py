@@ -0,0 +1,168 @@
+import datetime
+from abc import abstractmethod
+from typing import Iterable, Iterator, List, Tuple
+
+from blog.domain.models import Category, Comment, Post
+from shared.domain.repository import AsyncRepositoryInterface, RepositoryInterface
+
+
+class CategoryRepositoryInterface(RepositoryInterface):
+
+	@abstractmethod
+	def add(self, category: Category) -> Category:
+		raise NotImplementedError
+
+	@abstractmethod
+	def get(self, pk: int) -> Category:
+		raise NotImplementedError
+
+
+class PostRepositoryInterface(RepositoryInterface):
+
+	@abstractmethod
+	def add(self, post: Post) -> Post:
+		raise NotImplementedError
+
+	@abstractmethod
+	def get(self, pk: int) -> Post:
+		raise NotImplementedError
+
+	@abstractmethod
+	def get_many(self, pks: Iterable[int]) -> List[Post]:
+		"""
+		Loads the posts with these pks in one go, eg. to load lazy
+		references (see shared.domain.references). Missing pks are left
+		out, the order is not defined.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def add_many(self, posts: Iterable[Post]) -> List[Post]:
+		"""
+		Stores new posts in one batch.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def update(self, post: Post) -> Post:
+		"""
+		Persists changes made to a stored post (eg. through Post.update).
+		Only changed fields are written (see changed_fields) and a post
+		without changes is not written at all.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def update_many(self, posts: Iterable[Post]) -> List[Post]:
+		"""
+		Persists changes made to stored posts (eg. through Post.bulk_update)
+		in one batch.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def list_by_status(self, status: str) -> List[Post]:
+		"""
+		Returns posts in a status, in the order they entered it.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def iter_published(self, before: Tuple[datetime.datetime, int] = None,
+		category_pk: int = None, author_pk: int = None, chunk_size: int = 100) -> Iterator[Post]:
+		"""
+		Lazily yields published posts, newest first by (published_at, pk).
+
+		Parameters
+		----------
+		before: Tuple[datetime, int], optional
+			Keyset cursor, only posts with a smaller (published_at, pk)
+			are yielded
+		category_pk: int, optional
+		author_pk: int, optional
+			Only yield posts in this category / by this author
+		chunk_size: int, default to 100
+			How many posts are fetched from storage at a time
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def list_by_author(self, author_pk: int) -> List[Post]:
+		raise NotImplementedError
+
+	@abstractmethod
+	def list_by_category(self, category_pk: int) -> List[Post]:
+		raise NotImplementedError
+
+
+class CommentRepositoryInterface(RepositoryInterface):
+
+	@abstractmethod
+	def add(self, comment: Comment) -> Comment:
+		raise NotImplementedError
+
+	@abstractmethod
+	def add_many(self, comments: Iterable[Comment]) -> List[Comment]:
+		"""
+		Stores new comments in one batch.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def get(self, pk: int) -> Comment:
+		raise NotImplementedError
+
+	@abstractmethod
+	def list_by_post(self, post_pk: int) -> List[Comment]:
+		"""
+		Returns the comments on a post, oldest first.
+		"""
+		raise NotImplementedError
+
+
+class AsyncCategoryRepositoryInterface(AsyncRepositoryInterface):
+
+	@abstractmethod
+	async def add(self, category: Category) -> Category:
+		raise NotImplementedError
+
+	@abstractmethod
+	async def get(self, pk: int) -> Category:
+		raise NotImplementedError
+
+
+class AsyncPostRepositoryInterface(AsyncRepositoryInterface):
+
+	@abstractmethod
+	async def add(self, post: Post) -> Post:
+		raise NotImplementedError
+
+	@abstractmethod
+	async def get(self, pk: int) -> Post:
+		raise NotImplementedError
+
+	@abstractmethod
+	async def update(self, post: Post) -> Post:
+		raise NotImplementedError
+
+	@abstractmethod
+	async def list_by_status(self, status: str) -> List[Post]:
+		raise NotImplementedError
+
+
+class AsyncCommentRepositoryInterface(AsyncRepositoryInterface):
+
+	@abstractmethod
+	async def add(self, comment: Comment) -> Comment:
+		raise NotImplementedError
+
+	@abstractmethod
+	async def get(self, pk: int) -> Comment:
+		raise NotImplementedError
+
+	@abstractmethod
+	async def list_by_post(self, post_pk: int) -> List[Comment]:
+		"""
+		Returns the comments on a post, oldest first.
+		"""
+		raise NotImplementedError
@@ -1,8 +1,11 @@
 import copy
 import datetime
+import json
 import unittest
 
-from shared.domain.models import DomainModelConstructionException
+from analytics.domain.models import View
+from shared.domain.columnar import validate_columns
+from shared.domain.models import DomainModelConstructionException, NESTED_PK, _json_default
 from auth.domain.models import User
 from blog.domain.models import Category, Comment, Post
 
@@ -107,6 +110,95 @@ class BlogDomainTests(unittest.TestCase):
 			with self.assertRaises(expected_exception):
 				Post(**case)
 
+	def test_post_schema(self):
+		schema = Post.schema
+		self.assertEqual(schema.field_names[:3], ('pk', 'title', 'author'))
+		self.assertEqual(schema.required, ('title', 'author', 'status'))
+		self.assertIn('category', schema.nullable)
+		self.assertEqual(schema.choices['status'], frozenset(['d', 'r', 'p', 'a']))
+		self.assertEqual(dict(schema.defaults), {'status': 'd'})
+
+		# Field metadata lives on the class, not on each instance
+		post = Post(title="Hello World", author=self.author)
+		self.assertIs(post._status, schema.domain_fields['status'])
+		self.assertIsNone(post.body)
+
+		with self.assertRaises(DomainModelConstructionException):
+			Post(title="Hello World", author=self.author, not_a_field=1)
+
+	def test_compact_comment(self):
+		post = Post(title="Hello World", author=self.author)
+		comment = Comment(post=post, user=self.reader, body="My comment!")
+
+		# Values live in slots, metadata on the class only
+		self.assertTrue(Comment.compact)
+		self.assertIn('body', Comment.__slots__)
+		self.assertIs(comment._body, Comment.schema.domain_fields['body'])
+		self.assertEqual(comment.body, "My comment!")
+		with self.assertRaises(AttributeError):
+			comment.not_a_field = 1
+
+		with self.assertRaises(ValueError):
+			Comment(post=post, user=self.reader)
+
+	def test_post_json(self):
+		published_at = datetime.datetime(2021, 3, 4, 5, 6, 7, 890)
+		post = Post(pk=1, title="Hello World", author=self.author, status='p',
+			category=self.category, published_at=published_at)
+
+		data = json.loads(post.to_json())
+		self.assertEqual(data['published_at'], published_at.isoformat())
+		self.assertEqual(data['author']['username'], 'user2')
+		self.assertEqual(data, json.loads(json.dumps(post.to_dict(), default=_json_default)))
+
+		# Secret fields are only written when asked for by name
+		self.assertNotIn('password', data['author'])
+		self.assertNotIn('password', json.loads(self.author.to_json()))
+		self.assertEqual(self.author.to_dict(fields=['password']), {'password': 'testpass'})
+
+		data['author'] = self.author.to_dict(fields=User.schema.field_names)
+		loaded = Post.from_dict(data)
+		self.assertEqual(dict(loaded)['published_at'], published_at)
+		self.assertEqual(loaded.author.username, 'user2')
+		self.assertEqual(loaded.category.name, 'For Fun!')
+
+		# Field subsets and nested references
+		self.assertEqual(json.loads(post.to_json(fields=['pk', 'title'])),
+			{'pk': 1, 'title': 'Hello World'})
+		self.assertEqual(json.loads(post.to_json(fields=['author'], nested=NESTED_PK)),
+			{'author': None})
+		with self.assertRaises(DomainModelConstructionException):
+			post.to_json(fields=['not_a_field'])
+		with self.assertRaises(DomainModelConstructionException):
+			Post.from_json('{"title": "Hello World", "author": 1}')
+
+		# Bulk path encodes a json array
+		posts = json.loads(Post.to_json_many([post, post], fields=['pk']))
+		self.assertEqual(posts, [{'pk': 1}, {'pk': 1}])
+
+	def test_post_hydrate(self):
+		published_at = datetime.datetime(2021, 3, 4)
+		row = (1, 'Hello World', self.reader, None, 'p', 'Body', published_at, None, None)
+
+		# Creation rules (eg. readers can't write posts) are skipped for stored rows
+		post = Post.hydrate(row)
+		self.assertEqual(dict(post), dict(zip(Post.schema.field_names, row)))
+
+		post = Post.hydrate({'pk': 2, 'title': 'Hello World', 'author': self.author})
+		self.assertEqual((post.pk, post.status, post.body), (2, 'd', None))
+
+		comments = Comment.hydrate_many([(1, post, self.reader, 'First!', published_at)])
+		self.assertEqual(comments[0].created_at, published_at)
+
+		with self.assertRaises(DomainModelConstructionException):
+			Post.hydrate((1, 'Hello World'))
+		with self.assertRaises(DomainModelConstructionException):
+			Post.hydrate({'pk': 1, 'not_a_field': 1})
+
+		# Writes still validate fully
+		with self.assertRaises(ValueError):
+			post.update(updated_by=self.author, title='')
+
 	def test_post_update_constraints(self):
 		initial_post = Post(title="Hello World", author=self.author, body="This is my article.")
 
@@ -159,6 +251,138 @@ class BlogDomainTests(unittest.TestCase):
 		with self.assertRaises(ValueError):
 			initial_post.update(updated_by=self.moderator, title='Cannot update this')
 
+	def test_post_bulk_create(self):
+		result = Post.bulk_create([
+			{'title': 'Hello World'},
+			{'title': ''},
+			{'title': 'Published', 'status': 'p'},
+			{'title': 'Bad field', 'tags': 'x'},
+			{'title': 'Second', 'category': self.category},
+		], author=self.author)
+		self.assertEqual([post.title for post in result.objects], ['Hello World', 'Second'])
+		self.assertEqual(sorted(result.errors), [1, 2, 3])
+		self.assertIsInstance(result.errors[3], DomainModelConstructionException)
+
+		result = Post.bulk_create([{'title': 'Hello World'}], author=self.reader)
+		self.assertEqual((result.objects, list(result.errors)), ([], [0]))
+
+		# Shared values that can't be valid fail the whole batch
+		with self.assertRaises(DomainModelConstructionException):
+			Post.bulk_create([{'title': 'Hello World'}], author=self.author, status='x')
+
+	def test_post_validate_columns(self):
+		columns = {
+			'title': ['Hello', '', 'Hello', None, 'Hello', 'Hello', 'Hello', 'Hello'],
+			'author': [self.author, self.author, self.reader, self.author,
+				self.moderator, None, self.author, self.author],
+			'status': ['d', 'd', 'd', 'd', 'x', 'd', 'p', ['d']],
+			'category': [None, self.category, None, None, None, None, None, None],
+		}
+		result = validate_columns(Post, columns)
+		self.assertEqual(result.valid, [True, False, False, False, False, False, False, False])
+
+		# Exactly the failures constructing row by row gives
+		for i, valid in enumerate(result.valid):
+			try:
+				Post(**{field_name: column[i] for field_name, column in columns.items()})
+			except Exception as error:
+				self.assertFalse(valid)
+				self.assertEqual((type(result.errors[i]), str(result.errors[i])),
+					(type(error), str(error)))
+			else:
+				self.assertTrue(valid)
+				self.assertNotIn(i, result.errors)
+
+		# Unknown fields fail every row not already failed
+		result = validate_columns(Post, {'title': [None, ''], 'tags': [1, 2]})
+		self.assertIsInstance(result.errors[0], TypeError)
+		self.assertIsInstance(result.errors[1], DomainModelConstructionException)
+
+		with self.assertRaises(ValueError):
+			validate_columns(Post, {'title': ['Hello'], 'author': []})
+
+	def test_post_changed_fields(self):
+		post = Post.hydrate({'pk': 1, 'title': 'Hello World', 'author': self.author,
+			'status': 'r', 'body': 'Body'})
+		self.assertEqual(post.changed_fields(), [])
+
+		post.update(updated_by=self.moderator, status='p', body='Body', author=copy.copy(self.author))
+		self.assertEqual(post.changed_fields(), ['published_at', 'status'])
+		self.assertEqual(post.diff()['status'], ('r', 'p'))
+
+		# Copies don't share changes
+		other = copy.copy(post)
+		other.body = 'Edited'
+		self.assertEqual(post.changed_fields(), ['published_at', 'status'])
+
+		# Changing a field back undoes its change
+		post.status = 'r'
+		post.published_at = None
+		self.assertEqual(post.diff(), {})
+
+		post.category = self.category
+		post.mark_clean()
+		self.assertEqual(post.changed_fields(), [])
+
+		comment = Comment(post=post, user=self.reader, body="My comment!")
+		self.assertEqual(comment.changed_fields(), [])
+		comment.body = "Edited"
+		self.assertEqual(comment.diff(), {'body': ("My comment!", "Edited")})
+
+		view = View(post=post, user=self.reader)
+		self.assertEqual(view.changed_fields(), [])
+		self.assertIsNotNone(view.viewed_at)
+		viewed_at = datetime.datetime(2020, 1, 1)
+		self.assertEqual(View(post=post, user=self.reader, viewed_at=viewed_at).viewed_at, viewed_at)
+
+	def test_post_status_machine(self):
+		posts = [Post(title="Post %d" % i, author=self.author) for i in range(3)]
+		posts[1].update(updated_by=self.author, status='r')
+		posts[2].update(updated_by=self.author, status='r')
+		posts[2].update(updated_by=self.moderator, status='p')
+
+		self.assertEqual(Post.can_transition(posts, self.moderator, 'p'), [False, True, False])
+		self.assertEqual(Post.can_transition(posts, [self.moderator, self.author, self.reader], 'p'),
+			[False, False, False])
+		self.assertEqual(Post.can_transition(posts, self.reader, 'a'), [True, True, True])
+		self.assertEqual(Post.allowed_statuses(posts, self.moderator),
+			[{'d', 'r', 'a'}, {'d', 'r', 'p', 'a'}, {'d', 'r', 'a'}])
+		self.assertEqual(Post.allowed_statuses(posts[1:2], self.author), [{'d', 'r', 'a'}])
+
+		# Checks agree with update
+		for post, allowed in zip(posts, Post.can_transition(posts, self.moderator, 'p')):
+			post = copy.copy(post)
+			if allowed:
+				post.update(updated_by=self.moderator, status='p')
+			else:
+				with self.assertRaises(ValueError):
+					post.update(updated_by=self.moderator, status='p')
+
+		transition = Post.STATUS_MACHINE.get('r', 'p')
+		self.assertEqual((transition.action, transition.role), ('publish', 'is_moderator'))
+		self.assertIsNone(Post.STATUS_MACHINE.get('p', 'p'))
+
+	def test_post_bulk_update(self):
+		posts = [Post(title="Post %d" % i, author=self.author) for i in range(3)]
+		posts[0].update(updated_by=self.author, status='r')
+		posts[1].update(updated_by=self.author, status='r')
+
+		result = Post.bulk_update(posts, updated_by=self.moderator, status='p')
+		self.assertEqual(result.objects, posts[:2])
+		self.assertEqual(list(result.errors), [2])
+		self.assertEqual([post.status for post in posts], ['p', 'p', 'd'])
+		self.assertIsInstance(posts[0].published_at, datetime.datetime)
+
+		# A failing post is left untouched, not half updated
+		result = Post.bulk_update(posts, updated_by=self.author, body='Edited', title='New')
+		self.assertEqual(list(result.errors), [0, 1])
+		self.assertEqual([post.body for post in posts], [None, None, 'Edited'])
+
+		with self.assertRaises(ValueError):
+			Post.bulk_update(posts, updated_by=self.author, status='p')
+		with self.assertRaises(ValueError):
+			Post.bulk_update(posts, status='a')
+
 
 class CommentDomainTests(unittest.TestCase):
 
@@ -0,0 +1,207 @@
+"""
+Benchmark for BlogService reads on the in-memory repositories, at 100k
+posts and 1M views, against full scans of the same data.
+
+With the `threads` argument, instead measures BlogService.get_post_by_pk
+throughput from 1 to 32 threads with 1ms of latency per stored object
+read or written, paid inside the repositories under their own locks:
+the thread safe in-memory repositories against the plain ones behind
+one global lock.
+
+Benchmarks of the other blog.infrastructure modules live next to them,
+eg. sqlite_bench.py and search_bench.py.
+
+To run:
+
+	cd .../onboard_exercise/
+	python3 -m blog.infrastructure.bench [threads]
+"""
+import datetime
+import heapq
+import random
+import sys
+import threading
+import time
+import timeit
+
+from analytics.domain.models import View
+from analytics.infrastructure.memory import ConcurrentInMemoryViewRepository, InMemoryViewRepository
+from auth.domain.models import User
+from auth.infrastructure.memory import ConcurrentInMemoryUserRepository, InMemoryUserRepository
+from blog.application.blog_service import BlogService, post_summary
+from blog.domain.models import Category, Comment, Post
+from blog.infrastructure.memory import (ConcurrentInMemoryCategoryRepository,
+	ConcurrentInMemoryCommentRepository, ConcurrentInMemoryPostRepository,
+	InMemoryCategoryRepository, InMemoryCommentRepository, InMemoryPostRepository)
+from blog.infrastructure.wiring import build_blog_service
+
+POSTS = 100000
+VIEWS = 1000000
+USERS = 1000
+STATUSES = 'drpa'
+
+
+def build_service(posts: int = POSTS, views: int = VIEWS, users: int = USERS) -> BlogService:
+	rng = random.Random(0)
+	now = datetime.datetime.now()
+
+	user_repository = InMemoryUserRepository()
+	for user in User.hydrate_many([(pk, "user%d" % pk, "testpass", "user@example.com",
+			"First", "Last %d" % pk, True, False, True) for pk in range(1, users + 1)]):
+		user_repository.add(user)
+	authors = [user_repository.get(pk) for pk in range(1, users + 1)]
+	category_repository = InMemoryCategoryRepository()
+	categories = [category_repository.add(category)
+		for category in Category.hydrate_many([(pk, "Category %d" % pk) for pk in range(1, 51)])]
+
+	post_repository = InMemoryPostRepository()
+	for post in Post.hydrate_many([(pk, "Post %d" % pk, rng.choice(authors), rng.choice(categories),
+			rng.choice(STATUSES), "Body", now, now, None) for pk in range(1, posts + 1)]):
+		post_repository.add(post)
+
+	comment_repository = InMemoryCommentRepository()
+	for comment in Comment.hydrate_many([(pk, post_repository.get(rng.randint(1, posts)),
+			rng.choice(authors), "Comment", now) for pk in range(1, posts + 1)]):
+		comment_repository.add(comment)
+
+	view_repository = InMemoryViewRepository()
+	all_posts = [post_repository.get(pk) for pk in range(1, posts + 1)]
+	for view in View.hydrate_many([(pk, rng.choice(all_posts), rng.choice(authors), now)
+			for pk in range(1, views + 1)]):
+		view_repository.add(view)
+
+	return build_blog_service(comment_repository, post_repository, view_repository,
+		user_repository, category_repository)
+
+
+def scan_list_posts(service: BlogService) -> list:
+	"""
+	What list_posts costs without a status index.
+	"""
+	return [post_summary(post)
+		for post in service._post_repository._objects.values() if post.status == 'p']
+
+
+def scan_post_views(service: BlogService, post_pk: int) -> int:
+	"""
+	What a view count costs without a views-by-post index.
+	"""
+	return sum(1 for view in service._view_repository._objects.values() if view.post.pk == post_pk)
+
+
+def count_popular_posts(service: BlogService) -> list:
+	"""
+	What list_popular_posts costs when counting views on every request.
+	"""
+	posts = service._post_repository.list_by_status('p')
+	counts = service._view_repository.count_by_posts(post.pk for post in posts)
+	return heapq.nlargest(10, posts, key=lambda post: counts[post.pk])
+
+
+def timed(func, *args, number: int = 5) -> float:
+	return min(timeit.repeat(lambda: func(*args), number=number, repeat=3)) / number * 1000
+
+
+class SlowStore(dict):
+	"""
+	Stands in for a repository's dict of stored objects, sleeping latency
+	seconds on every read or write of one (time.sleep releases the GIL,
+	like waiting on a socket). The latency is paid wherever the repository
+	touches its storage, so under whatever locks it holds there.
+	"""
+	def __init__(self, latency: float, objects: dict = ()):
+		super().__init__(objects)
+		self._latency = latency
+
+	def __getitem__(self, pk):
+		time.sleep(self._latency)
+		return super().__getitem__(pk)
+
+	def __setitem__(self, pk, model):
+		time.sleep(self._latency)
+		super().__setitem__(pk, model)
+
+	def setdefault(self, pk, model):
+		time.sleep(self._latency)
+		return super().setdefault(pk, model)
+
+
+class LockedRepository:
+	"""
+	Proxies a repository, every call holding one lock throughout, as when
+	all repositories are serialized behind one global lock.
+	"""
+	def __init__(self, repository, lock: threading.Lock):
+		self._repository = repository
+		self._lock = lock
+
+	def __getattr__(self, name: str):
+		method = getattr(self._repository, name)
+
+		def call(*args, **kwargs):
+			with self._lock:
+				return method(*args, **kwargs)
+		return call
+
+
+def bench_threads(posts_count: int = 100, reads_per_thread: int = 50, latency: float = 0.001):
+	def build(user, category, post, comment, view, lock: threading.Lock = None) -> BlogService:
+		users, categories, posts, comments, views = user(), category(), post(), comment(), view()
+		now = datetime.datetime.now()
+		for reader in User.hydrate_many([(pk, "user%d" % pk, "testpass", "user@example.com",
+				"First", "Last %d" % pk, True, False, True) for pk in range(1, 32 * reads_per_thread + 2)]):
+			users.add(reader)
+		author = users.get(1)
+		for post in Post.hydrate_many([(pk, "Post %d" % pk, author, None, 'p', "Body", now, now, None)
+				for pk in range(1, posts_count + 1)]):
+			posts.add(post)
+			comments.add_many([Comment(post=post, user=author, body="Thanks!") for _ in range(5)])
+		repositories = (comments, posts, views, users, categories)
+		# Slowed down once loaded, so only the reads pay
+		for repository in repositories:
+			repository._objects = SlowStore(latency, repository._objects)
+		if lock is not None:
+			repositories = [LockedRepository(repository, lock) for repository in repositories]
+		return build_blog_service(*repositories)
+
+	def throughput(service: BlogService, threads: int) -> float:
+		def read(number: int):
+			# Distinct users, so every read also records a view
+			for index in range(reads_per_thread):
+				user_pk = 2 + number * reads_per_thread + index
+				service.get_post_by_pk(1 + user_pk % posts_count, user_pk=user_pk)
+
+		workers = [threading.Thread(target=read, args=(number,)) for number in range(threads)]
+		start = time.perf_counter()
+		for worker in workers:
+			worker.start()
+		for worker in workers:
+			worker.join()
+		return threads * reads_per_thread / (time.perf_counter() - start)
+
+	print("get_post_by_pk with a view, %.0fms per stored object access, reads/s:" % (latency * 1000))
+	print("threads   global lock   thread safe repositories")
+	for threads in (1, 2, 4, 8, 16, 32):
+		serialized = build(InMemoryUserRepository, InMemoryCategoryRepository, InMemoryPostRepository,
+			InMemoryCommentRepository, InMemoryViewRepository, lock=threading.Lock())
+		concurrent = build(ConcurrentInMemoryUserRepository, ConcurrentInMemoryCategoryRepository,
+			ConcurrentInMemoryPostRepository, ConcurrentInMemoryCommentRepository,
+			ConcurrentInMemoryViewRepository)
+		print("%7d   %11.0f   %24.0f" % (threads, throughput(serialized, threads),
+			throughput(concurrent, threads)))
+
+
+if __name__ == "__main__" and sys.argv[1:] == ["threads"]:
+	bench_threads()
+elif __name__ == "__main__":
+	start = time.perf_counter()
+	service = build_service()
+	print("built %d posts, %d views in %.1fs" % (POSTS, VIEWS, time.perf_counter() - start))
+
+	post_pk = service._post_repository.list_by_status('p')[0].pk
+	print("list_posts:              %8.2f ms" % timed(service.list_posts))
+	print("  scanning all posts:    %8.2f ms" % timed(scan_list_posts, service))
+	print("list_popular_posts:      %8.3f ms" % timed(service.list_popular_posts, number=1000))
+	print("  counting on request:   %8.2f ms" % timed(count_popular_posts, service))
+	print("get_post_by_pk:          %8.3f ms" % timed(service.get_post_by_pk, post_pk, number=1000))
+	print("  scan for view count:   %8.2f ms" % timed(scan_post_views, service, post_pk))
@@ -0,0 +1,103 @@
+from collections import Counter
+from operator import itemgetter
+from typing import Iterable
+
+from analytics.domain.events import ViewRecorded
+from analytics.infrastructure.popularity import PopularPostsIndex
+from blog.domain.events import CommentAdded, PostSaved
+from shared.infrastructure.event_log import EventLog, Frame
+
+EVENT_TYPES = (PostSaved, CommentAdded, ViewRecorded)
+
+
+class PostHistory:
+	"""
+	Per post state replayed from the event log (see BlogService's
+	event_log): status, view count and comment count. Lets caches such as
+	PopularPostsIndex be recovered on a cold start from a snapshot plus
+	the events after it, instead of scanning the posts and views tables.
+
+	Usage:
+
+		history = PostHistory.recover(event_log)
+		history.rebuild_popular_posts(popular_posts_index)
+		...
+		history.checkpoint(event_log, every=1000000)  # eg. from a periodic job
+
+	Runs of events are applied a frame at a time, views and comments
+	through Counter.update, so replay costs little more than decoding.
+	"""
+	def __init__(self):
+		# Sequence number of the last event applied
+		self.sequence = 0
+		self.snapshot_sequence = 0
+		self.statuses = {}
+		self.view_counts = Counter()
+		self.comment_counts = Counter()
+
+	@classmethod
+	def recover(cls, event_log: EventLog) -> 'PostHistory':
+		"""
+		The history as of the last stored event: the latest snapshot, if
+		any, plus the events after it.
+		"""
+		history = cls()
+		snapshot = event_log.load_snapshot()
+		if snapshot is not None:
+			history.restore(*snapshot)
+		history.catch_up(event_log)
+		return history
+
+	def apply(self, frames: Iterable[Frame]):
+		view_counts, comment_counts, statuses = self.view_counts, self.comment_counts, self.statuses
+		for frame in frames:
+			event_type = frame.event_type
+			if event_type is ViewRecorded:
+				view_counts.update(map(itemgetter(0), frame.records))
+			elif event_type is CommentAdded:
+				comment_counts.update(map(itemgetter(1), frame.records))
+			elif event_type is PostSaved:
+				for post_pk, _, changes in frame.records:
+					status = changes.get('status')
+					if status is not None:
+						statuses[post_pk] = status
+			self.sequence = frame.sequence + len(frame.records) - 1
+
+	def catch_up(self, event_log: EventLog):
+		"""
+		Applies the events stored since the last one applied.
+		"""
+		self.apply(event_log.replay(after=self.sequence))
+
+	def checkpoint(self, event_log: EventLog, every: int = 0) -> bool:
+		"""
+		Catches up with event_log and snapshots the history into it, if at
+		least every events were applied since the last snapshot. Returns
+		whether a snapshot was taken.
+		"""
+		event_log.flush()
+		self.catch_up(event_log)
+		if self.sequence == self.snapshot_sequence or self.sequence - self.snapshot_sequence < every:
+			return False
+		event_log.save_snapshot(self.sequence, self.snapshot())
+		self.snapshot_sequence = self.sequence
+		return True
+
+	def snapshot(self) -> dict:
+		# Pairs rather than objects, json object keys can't be ints
+		return {
+			"statuses": list(self.statuses.items()),
+			"view_counts": list(self.view_counts.items()),
+			"comment_counts": list(self.comment_counts.items()),
+		}
+
+	def restore(self, sequence: int, state: dict):
+		self.sequence = self.snapshot_sequence = sequence
+		self.statuses = dict(state["statuses"])
+		self.view_counts = Counter(dict(state["view_counts"]))
+		self.comment_counts = Counter(dict(state["comment_counts"]))
+
+	def rebuild_popular_posts(self, popular_posts_index: PopularPostsIndex):
+		popular_posts_index.rebuild(self.view_counts, [post_pk
+			for post_pk, status in self.statuses.items()
+			if status == popular_posts_index.eligible_status])
@@ -0,0 +1,50 @@
+"""
+Benchmark for PostHistory: recovering it from an event log of 10M views
+and 100k post saves, by full replay and from the latest snapshot plus
+the last 1M views.
+
+To run:
+
+	cd .../onboard_exercise/
+	python3 -m blog.infrastructure.history_bench
+"""
+import tempfile
+import time
+
+from analytics.domain.events import ViewRecorded
+from blog.domain.events import PostSaved
+from blog.infrastructure.history import EVENT_TYPES, PostHistory
+from shared.infrastructure.event_log import EventLog
+
+USERS = 1000
+
+
+def bench_events(views: int = 10000000, posts: int = 100000, chunk_size: int = 100000):
+	now = time.time()
+	with tempfile.TemporaryDirectory() as directory:
+		event_log = EventLog(directory, EVENT_TYPES)
+		event_log.append_many(PostSaved(post_pk, now, {'status': 'p'}) for post_pk in range(1, posts + 1))
+		elapsed = 0
+		for first in range(0, views, chunk_size):
+			events = [ViewRecorded(view % posts + 1, view % USERS + 1, now)
+				for view in range(first, min(first + chunk_size, views))]
+			start = time.perf_counter()
+			event_log.append_many(events)
+			elapsed += time.perf_counter() - start
+		print("append %d views in chunks of %d: %6.2f s" % (views, chunk_size, elapsed))
+
+		start = time.perf_counter()
+		history = PostHistory.recover(event_log)
+		print("replay %d events: %6.2f s" % (history.sequence, time.perf_counter() - start))
+
+		history.sequence -= views // 10
+		event_log.save_snapshot(history.sequence, history.snapshot())
+		start = time.perf_counter()
+		recovered = PostHistory.recover(event_log)
+		print("snapshot + replay %d events: %6.2f s" % (
+			recovered.sequence - history.sequence, time.perf_counter() - start))
+		event_log.close()
+
+
+if __name__ == "__main__":
+	bench_events()
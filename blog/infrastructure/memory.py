@@ -0,0 +1,269 @@
+import bisect
+import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from blog.domain.models import Category, Comment, Post
+from blog.domain.repository import (AsyncCategoryRepositoryInterface,
+	AsyncCommentRepositoryInterface, AsyncPostRepositoryInterface, CategoryRepositoryInterface,
+	CommentRepositoryInterface, PostRepositoryInterface)
+from shared.application.locks import ReadWriteLock
+from shared.infrastructure.memory import (AsyncInMemoryRepository, ConcurrentInMemoryRepository,
+	InMemoryRepository)
+
+
+_NOT_INDEXED = object()
+
+
+def published_key(post: Post) -> Tuple[datetime.datetime, int]:
+	"""
+	(published_at, pk) sort key of a published post, see iter_published.
+	"""
+	return (post.published_at or datetime.datetime.min, post.pk)
+
+
+class InMemoryCategoryRepository(InMemoryRepository, CategoryRepositoryInterface):
+	model = Category
+
+
+class InMemoryPostRepository(InMemoryRepository, PostRepositoryInterface):
+	"""
+	Keeps secondary indexes on status, author pk and category pk, so
+	every list_by_* read costs O(result) instead of a scan over all posts.
+
+	Indexes are ordered sets (dicts of pk -> None): posts are listed in
+	the order they entered the status, author or category.
+
+	Published posts are also kept in sorted lists of (published_at, pk)
+	keys, overall and per author and category, for keyset pagination.
+	"""
+	model = Post
+
+	def __init__(self):
+		super().__init__()
+		self._by_status = {}
+		self._by_author = {}
+		self._by_category = {}
+		# pk -> (status, author pk, category pk) as currently indexed
+		self._index_keys = {}
+		# None, ('author', pk) or ('category', pk) -> sorted published keys
+		self._published = {None: []}
+		# pk -> (published key, author pk, category pk) as currently indexed
+		self._published_keys = {}
+
+	def add(self, post: Post) -> Post:
+		if post.created_at is None:
+			post.created_at = datetime.datetime.now()
+		super().add(post)
+		self._index(post)
+		return post
+
+	def update(self, post: Post) -> Post:
+		return self.update_many([post])[0]
+
+	def update_many(self, posts: Iterable[Post]) -> List[Post]:
+		posts = list(posts)
+		for post in posts:
+			self.get(post.pk)
+		now = datetime.datetime.now()
+		for post in posts:
+			# Posts without changes are not touched at all
+			if not post.changed_fields():
+				continue
+			post.updated_at = now
+			self._objects[post.pk] = post
+			self._index(post)
+			post.mark_clean()
+		return posts
+
+	def list_by_status(self, status: str) -> List[Post]:
+		return self._list(self._by_status, status)
+
+	def list_by_author(self, author_pk: int) -> List[Post]:
+		return self._list(self._by_author, author_pk)
+
+	def list_by_category(self, category_pk: int) -> List[Post]:
+		return self._list(self._by_category, category_pk)
+
+	def iter_published(self, before: Tuple[datetime.datetime, int] = None,
+		category_pk: int = None, author_pk: int = None, chunk_size: int = 100) -> Iterator[Post]:
+		if category_pk is not None:
+			keys = self._published.get(('category', category_pk), [])
+		elif author_pk is not None:
+			keys = self._published.get(('author', author_pk), [])
+		else:
+			keys = self._published[None]
+
+		objects = self._objects
+		while True:
+			chunk = self._published_chunk(keys, before, chunk_size)
+			if not chunk:
+				return
+			for key in reversed(chunk):
+				post = objects[key[1]]
+				if author_pk is None or post.author.pk == author_pk:
+					yield post
+			before = chunk[0]
+
+	def _published_chunk(self, keys: list, before: Optional[Tuple[datetime.datetime, int]],
+		chunk_size: int) -> list:
+		"""
+		Up to chunk_size of the sorted keys ending just before before.
+		"""
+		# Re-seek from the last key for every chunk, so writes made while
+		# iterating can't shift positions under us.
+		end = bisect.bisect_left(keys, before) if before is not None else len(keys)
+		return keys[max(0, end - chunk_size):end]
+
+	def _list(self, index: dict, key) -> List[Post]:
+		objects = self._objects
+		return [objects[pk] for pk in index.get(key, ())]
+
+	def _index(self, post: Post):
+		pk = post.pk
+		keys = (post.status, post.author.pk, post.category.pk if post.category else None)
+		self._index_published(post, keys)
+		old_keys = self._index_keys.get(pk)
+		if keys == old_keys:
+			return
+
+		indexes = (self._by_status, self._by_author, self._by_category)
+		for index, old_key, key in zip(indexes, old_keys or (_NOT_INDEXED,) * 3, keys):
+			if old_key == key:
+				continue
+			if old_key is not _NOT_INDEXED:
+				index[old_key].pop(pk, None)
+			index.setdefault(key, {})[pk] = None
+		self._index_keys[pk] = keys
+
+	def _index_published(self, post: Post, keys: tuple):
+		status, author_pk, category_pk = keys
+		new = (published_key(post), author_pk, category_pk) if status == 'p' else None
+		old = self._published_keys.get(post.pk)
+		if new == old:
+			return
+
+		published = self._published
+		if old is not None:
+			key, old_author_pk, old_category_pk = old
+			for index_key in (None, ('author', old_author_pk), ('category', old_category_pk)):
+				sorted_keys = published[index_key]
+				del sorted_keys[bisect.bisect_left(sorted_keys, key)]
+			del self._published_keys[post.pk]
+		if new is not None:
+			key = new[0]
+			for index_key in (None, ('author', author_pk), ('category', category_pk)):
+				bisect.insort(published.setdefault(index_key, []), key)
+			self._published_keys[post.pk] = new
+
+
+class InMemoryCommentRepository(InMemoryRepository, CommentRepositoryInterface):
+	"""
+	Indexes comments by post pk.
+	"""
+	model = Comment
+
+	def __init__(self):
+		super().__init__()
+		self._by_post = {}
+
+	def add(self, comment: Comment) -> Comment:
+		super().add(comment)
+		self._by_post.setdefault(comment.post.pk, []).append(comment)
+		return comment
+
+	def list_by_post(self, post_pk: int) -> List[Comment]:
+		return list(self._by_post.get(post_pk, ()))
+
+
+class ConcurrentInMemoryCategoryRepository(InMemoryCategoryRepository, ConcurrentInMemoryRepository):
+	pass
+
+
+class ConcurrentInMemoryPostRepository(InMemoryPostRepository, ConcurrentInMemoryRepository):
+	"""
+	InMemoryPostRepository safe to share between threads.
+
+	Posts are read far more than written, and a write updates several
+	indexes at once, so the indexes are guarded by a ReadWriteLock: any
+	number of threads list posts together, a write waits for them and
+	holds the indexes alone. get and get_many don't touch the indexes
+	and take no lock.
+
+	iter_published only holds the read lock while copying each chunk of
+	keys, never between yields, so a slow consumer doesn't hold up
+	writers.
+
+	The stored posts never leave the repository: add and update store
+	copies, and every read hands out copies, so a thread changing the
+	post it got can't be seen half way by others. Changes are only shared
+	through update.
+	"""
+	def __init__(self):
+		super().__init__()
+		self._lock = ReadWriteLock()
+
+	def add(self, post: Post) -> Post:
+		with self._lock.write():
+			super().add(post)
+			self._objects[post.pk] = self._copy(post)
+		return post
+
+	def update_many(self, posts: Iterable[Post]) -> List[Post]:
+		posts = list(posts)
+		changed = [post for post in posts if post.changed_fields()]
+		with self._lock.write():
+			super().update_many(posts)
+			for post in changed:
+				self._objects[post.pk] = self._copy(post)
+		return posts
+
+	def iter_published(self, before: Tuple[datetime.datetime, int] = None,
+		category_pk: int = None, author_pk: int = None, chunk_size: int = 100) -> Iterator[Post]:
+		copy = self._copy
+		for post in super().iter_published(before, category_pk, author_pk, chunk_size):
+			yield copy(post)
+
+	def _published_chunk(self, keys: list, before: Optional[Tuple[datetime.datetime, int]],
+		chunk_size: int) -> list:
+		with self._lock.read():
+			return super()._published_chunk(keys, before, chunk_size)
+
+	def _list(self, index: dict, key) -> List[Post]:
+		with self._lock.read():
+			return self._hand_out(super()._list(index, key))
+
+	def _hand_out(self, posts: List[Post]) -> List[Post]:
+		return Post.hydrate_many([dict(post) for post in posts])
+
+	@staticmethod
+	def _copy(post: Post) -> Post:
+		return Post.hydrate(dict(post))
+
+
+class ConcurrentInMemoryCommentRepository(InMemoryCommentRepository, ConcurrentInMemoryRepository):
+	"""
+	InMemoryCommentRepository safe to share between threads, without
+	locks: comments are only appended to their post's list, which is
+	atomic in CPython, and list_by_post copies the list in one step.
+	"""
+
+
+class AsyncInMemoryCategoryRepository(AsyncInMemoryRepository, AsyncCategoryRepositoryInterface):
+	repository_class = InMemoryCategoryRepository
+
+
+class AsyncInMemoryPostRepository(AsyncInMemoryRepository, AsyncPostRepositoryInterface):
+	repository_class = InMemoryPostRepository
+
+	async def update(self, post: Post) -> Post:
+		return await self._call(self.repository.update, post)
+
+	async def list_by_status(self, status: str) -> List[Post]:
+		return await self._call(self.repository.list_by_status, status)
+
+
+class AsyncInMemoryCommentRepository(AsyncInMemoryRepository, AsyncCommentRepositoryInterface):
+	repository_class = InMemoryCommentRepository
+
+	async def list_by_post(self, post_pk: int) -> List[Comment]:
+		return await self._call(self.repository.list_by_post, post_pk)
@@ -0,0 +1,152 @@
+import threading
+from typing import Iterable, List, Mapping
+
+from blog.domain.interfaces import PostProjectionInterface
+from blog.domain.models import Comment, Post
+
+
+class PostProjection(PostProjectionInterface):
+	"""
+	Flat, denormalized read models for posts, per the CQRS note on
+	BlogService: domain models are for writing, reads are served from
+	precomputed rows without building any Post/User/Category objects.
+
+	- summaries: one row per post, as listed by list_posts plus "views"
+	- details: one document per post, as returned by get_post_by_pk
+
+	It is kept up to date incrementally by post_saved, comment_added and
+	view_recorded, and can be rebuilt from scratch with rebuild. Comments
+	and views of posts it doesn't hold are ignored.
+	Reads return copies, so callers can't change the stored rows.
+
+	Thread safe: writes and the copies made by reads hold a lock, they
+	are short.
+	"""
+	def __init__(self):
+		self._summaries = {}
+		self._details = {}
+		# Ordered set of published pks, in the order they were published
+		self._published = {}
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._summaries)
+
+	#######
+	# Reads
+	def list_published(self) -> List[dict]:
+		with self._lock:
+			summaries = self._summaries
+			return [self._public_summary(summaries[pk]) for pk in self._published]
+
+	def get_summary(self, post_pk: int) -> dict:
+		with self._lock:
+			return self._public_summary(self._summaries[post_pk])
+
+	def get_detail(self, post_pk: int) -> dict:
+		"""
+		Raises KeyError for unknown posts.
+		"""
+		with self._lock:
+			detail = self._details[post_pk]
+			summary = self._summaries[post_pk]
+			return dict(self._public_summary(summary),
+				status=detail['status'],
+				body=detail['body'],
+				comments=[dict(comment) for comment in detail['comments']],
+				views=summary['views'],
+				created_at=detail['created_at'],
+				updated_at=detail['updated_at'],
+			)
+
+	def get_author_pk(self, post_pk: int) -> int:
+		with self._lock:
+			return self._summaries[post_pk]['author_pk']
+
+	########
+	# Writes
+	def post_saved(self, post: Post):
+		"""
+		Projects a created or updated post.
+		"""
+		with self._lock:
+			self._project_post(post)
+
+	def comment_added(self, comment: Comment):
+		with self._lock:
+			self._project_comment(comment)
+
+	def view_recorded(self, post_pk: int, count: int = 1):
+		with self._lock:
+			self._add_views(post_pk, count)
+
+	def rebuild(self, posts: Iterable[Post], comments: Iterable[Comment],
+		view_counts: Mapping[int, int]):
+		"""
+		Replaces every row. Posts should be passed in the order they
+		should be listed (eg. published ones by publication order).
+		The new rows are built aside and swapped in at once.
+		"""
+		fresh = PostProjection()
+		for post in posts:
+			fresh._project_post(post)
+		for comment in comments:
+			fresh._project_comment(comment)
+		for post_pk, count in view_counts.items():
+			if count:
+				fresh._add_views(post_pk, count)
+		with self._lock:
+			self._summaries, self._details, self._published = (
+				fresh._summaries, fresh._details, fresh._published)
+
+	# The following expect the lock to be held
+	def _project_post(self, post: Post):
+		summary = self._summaries.get(post.pk)
+		if summary is None:
+			summary = self._summaries[post.pk] = {"views": 0}
+			self._details[post.pk] = {"comments": []}
+		summary.update(
+			pk=post.pk,
+			title=post.title,
+			author=post.author.full_name,
+			author_pk=post.author.pk,
+			published_at=post.published_at,
+			category=post.category.name if post.category else None,
+		)
+		self._details[post.pk].update(
+			status=post.status,
+			body=post.body,
+			created_at=post.created_at,
+			updated_at=post.updated_at,
+		)
+		if post.status == 'p':
+			self._published.setdefault(post.pk, None)
+		else:
+			self._published.pop(post.pk, None)
+
+	def _project_comment(self, comment: Comment):
+		detail = self._details.get(comment.post.pk)
+		# Posts saved before the projection was built are left to rebuild
+		if detail is None:
+			return
+		detail['comments'].append({
+			"pk": comment.pk,
+			"post_pk": comment.post.pk,
+			"user_name": comment.user.full_name,
+			"body": comment.body,
+		})
+
+	def _add_views(self, post_pk: int, count: int):
+		summary = self._summaries.get(post_pk)
+		if summary is not None:
+			summary['views'] += count
+
+	@staticmethod
+	def _public_summary(summary: dict) -> dict:
+		return {
+			"pk": summary['pk'],
+			"title": summary['title'],
+			"author": summary['author'],
+			"published_at": summary['published_at'],
+			"category": summary['category'],
+		}
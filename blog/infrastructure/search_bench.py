@@ -0,0 +1,71 @@
+"""
+Benchmark for SearchIndex: queries over 1M posts of random words, held
+in memory and memory-mapped from a file.
+
+To run:
+
+	cd .../onboard_exercise/
+	python3 -m blog.infrastructure.search_bench
+"""
+import os
+import random
+import tempfile
+import time
+
+from auth.domain.models import User
+from blog.domain.models import Category, Post
+from blog.infrastructure.search import SearchIndex
+
+USERS = 1000
+
+
+def bench_search(posts: int = 1000000, vocabulary: int = 50000, queries: int = 200):
+	rng = random.Random(0)
+	# Zipf-like word frequencies, as in real text
+	words = ["w%d" % rank for rank in range(vocabulary)]
+	weights = [1 / (rank + 1) for rank in range(vocabulary)]
+	authors = [User.hydrate({'pk': pk}) for pk in range(1, USERS + 1)]
+	categories = [Category.hydrate((pk, "Category %d" % pk)) for pk in range(1, 51)]
+	index = SearchIndex()
+	start = time.perf_counter()
+	for first in range(1, posts + 1, 10000):
+		count = min(10000, posts + 1 - first)
+		texts = rng.choices(words, weights, k=count * 40)
+		for offset, post in enumerate(Post.hydrate_many({
+				'pk': pk, 'title': " ".join(texts[(pk - first) * 40:(pk - first) * 40 + 6]),
+				'body': " ".join(texts[(pk - first) * 40 + 6:(pk - first + 1) * 40]),
+				'author': authors[pk % USERS], 'category': categories[pk % 50],
+				'status': 'p' if pk % 10 else 'a'} for pk in range(first, first + count))):
+			index.update_post(post)
+	print("indexed %d posts: %.1f s" % (posts, time.perf_counter() - start))
+
+	# Two word queries of mid frequency words, eg. names or topics
+	samples = [" ".join(rng.sample(words[200:5000], 2)) for _ in range(queries)]
+
+	def latencies(search, **filters) -> str:
+		times = []
+		for query in samples:
+			start = time.perf_counter()
+			search(query, status='p', **filters)
+			times.append((time.perf_counter() - start) * 1000)
+		times.sort()
+		return "median %6.2f ms, p99 %6.2f ms" % (times[len(times) // 2], times[len(times) * 99 // 100])
+
+	print("in memory:            ", latencies(index.search))
+	print("  with category:      ", latencies(index.search, category_pk=7))
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = directory + "/search.idx"
+		start = time.perf_counter()
+		index.save(path)
+		print("save: %.1f s, %.0f MB" % (time.perf_counter() - start, os.path.getsize(path) / 2 ** 20))
+		start = time.perf_counter()
+		loaded = SearchIndex.load(path)
+		print("load: %.2f ms" % ((time.perf_counter() - start) * 1000))
+		print("memory-mapped:        ", latencies(loaded.search))
+		print("  with category:      ", latencies(loaded.search, category_pk=7))
+		loaded.close()
+
+
+if __name__ == "__main__":
+	bench_search()
@@ -0,0 +1,343 @@
+import datetime
+import functools
+import json
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from auth.domain.models import User
+from auth.infrastructure.sqlite import USER_COLUMNS, USER_COLUMN_COUNT, user_from_row
+from blog.domain.models import Category, Comment, Post
+from blog.domain.repository import (CategoryRepositoryInterface,
+	CommentRepositoryInterface, PostRepositoryInterface)
+from shared.domain.references import ReferenceBatch, is_reference
+from shared.infrastructure.identity import identities
+from shared.infrastructure.sqlite import (SqliteRepository, from_datetime, hydrate_rows,
+	to_datetime)
+
+CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS categories (
+	pk INTEGER PRIMARY KEY,
+	name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS posts (
+	pk INTEGER PRIMARY KEY,
+	title TEXT NOT NULL,
+	author_pk INTEGER NOT NULL REFERENCES users (pk),
+	category_pk INTEGER REFERENCES categories (pk),
+	status TEXT NOT NULL,
+	body TEXT,
+	published_at TEXT,
+	created_at TEXT,
+	updated_at TEXT,
+	-- When the post entered its current status, orders list_by_status
+	status_changed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posts_status ON posts (status, status_changed_at, pk);
+CREATE INDEX IF NOT EXISTS posts_published ON posts (status, published_at, pk);
+CREATE INDEX IF NOT EXISTS posts_author ON posts (author_pk, status, published_at, pk);
+CREATE INDEX IF NOT EXISTS posts_category ON posts (category_pk, status, published_at, pk);
+CREATE TABLE IF NOT EXISTS comments (
+	pk INTEGER PRIMARY KEY,
+	post_pk INTEGER NOT NULL REFERENCES posts (pk),
+	user_pk INTEGER NOT NULL REFERENCES users (pk),
+	body TEXT NOT NULL,
+	created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS comments_post ON comments (post_pk, pk);
+"""
+
+INSERT_CATEGORY = "INSERT INTO categories VALUES (?, ?)"
+SELECT_CATEGORY = "SELECT pk, name FROM categories WHERE pk = ?"
+
+# Post, its author and its category in one joined query
+SELECT_POSTS = """
+SELECT p.pk, p.title, p.status, p.body, p.published_at, p.created_at, p.updated_at,
+	%s, c.pk, c.name
+FROM posts p
+JOIN users u ON u.pk = p.author_pk
+LEFT JOIN categories c ON c.pk = p.category_pk
+""" % USER_COLUMNS.format('u')
+SELECT_POST = SELECT_POSTS + "WHERE p.pk = ?"
+# The pks are passed as one json array, see COUNT_VIEWS_BY_POSTS
+SELECT_POSTS_BY_PKS = SELECT_POSTS + "WHERE p.pk IN (SELECT value FROM json_each(?))"
+SELECT_POSTS_BY_STATUS = SELECT_POSTS + "WHERE p.status = ? ORDER BY p.status_changed_at, p.pk"
+SELECT_POSTS_BY_AUTHOR = SELECT_POSTS + "WHERE p.author_pk = ? ORDER BY p.pk"
+SELECT_POSTS_BY_CATEGORY = SELECT_POSTS + "WHERE p.category_pk = ? ORDER BY p.pk"
+
+# Keyset pages of published posts, newest first, one statement per filter
+# combination so each can use its index.
+_PUBLISHED_PAGE = SELECT_POSTS + """WHERE p.status = 'p' AND (p.published_at, p.pk) < (?, ?) %s
+ORDER BY p.published_at DESC, p.pk DESC LIMIT ?"""
+SELECT_PUBLISHED_PAGE = {
+	(False, False): _PUBLISHED_PAGE % "",
+	(True, False): _PUBLISHED_PAGE % "AND p.category_pk = ?",
+	(False, True): _PUBLISHED_PAGE % "AND p.author_pk = ?",
+	(True, True): _PUBLISHED_PAGE % "AND p.category_pk = ? AND p.author_pk = ?",
+}
+# Sorts after every stored (published_at, pk)
+_LAST_PUBLISHED_KEY = ("9999-12-31T23:59:59.999999", 2 ** 63 - 1)
+
+INSERT_POST = """
+INSERT INTO posts (pk, title, author_pk, category_pk, status, body,
+	published_at, created_at, updated_at, status_changed_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+# Post field -> (posts column, value to store), for partial updates
+POST_COLUMNS = {
+	'title': ('title', lambda post: post.title),
+	'author': ('author_pk', lambda post: post.author.pk),
+	'category': ('category_pk', lambda post: post.category.pk if post.category else None),
+	'status': ('status', lambda post: post.status),
+	'body': ('body', lambda post: post.body),
+	'published_at': ('published_at', lambda post: from_datetime(post.published_at)),
+	'created_at': ('created_at', lambda post: from_datetime(post.created_at)),
+}
+
+# Comments and their users in one joined query
+SELECT_COMMENTS = """
+SELECT cm.pk, cm.post_pk, cm.body, cm.created_at, %s
+FROM comments cm
+JOIN users u ON u.pk = cm.user_pk
+""" % USER_COLUMNS.format('u')
+SELECT_COMMENT = SELECT_COMMENTS + "WHERE cm.pk = ?"
+SELECT_COMMENTS_BY_POST = SELECT_COMMENTS + "WHERE cm.post_pk = ? ORDER BY cm.pk"
+INSERT_COMMENT = "INSERT INTO comments VALUES (?, ?, ?, ?, ?)"
+
+
+def create_tables(connection: sqlite3.Connection):
+	connection.executescript(CREATE_TABLES)
+
+
+@functools.lru_cache(maxsize=None)
+def update_post_query(fields: Tuple[str, ...]) -> str:
+	"""
+	UPDATE of just the columns for fields (in POST_COLUMNS order) plus
+	updated_at, and status_changed_at when the status changes. Built once
+	per combination, so the same string keeps hitting the statement cache.
+
+	Parameters are the field values, updated_at, status_changed_at (only
+	if 'status' is in fields) and the pk.
+	"""
+	columns = [POST_COLUMNS[field][0] for field in fields] + ['updated_at']
+	if 'status' in fields:
+		columns.append('status_changed_at')
+	return "UPDATE posts SET %s WHERE pk = ?" % ", ".join(
+		"%s = ?" % column for column in columns)
+
+
+def posts_from_rows(rows: Iterable[tuple]) -> List[Post]:
+	"""
+	Hydrates rows from SELECT_POSTS, sharing one User, Category and Post
+	instance per pk across the result, or across the request while an
+	IdentityMap is current.
+	"""
+	users, categories, posts = identities(User), identities(Category), []
+	author_end = 7 + USER_COLUMN_COUNT
+	for row in rows:
+		author = user_from_row(row[7:author_end], users)
+		category_pk, category_name = row[author_end:]
+		category = None
+		if category_pk is not None:
+			category = categories.get(category_pk)
+			if category is None:
+				category = categories[category_pk] = Category.hydrate((category_pk, category_name))
+		pk, title, status, body, published_at, created_at, updated_at = row[:7]
+		posts.append((pk, title, author, category, status, body, to_datetime(published_at),
+			to_datetime(created_at), to_datetime(updated_at)))
+	return hydrate_rows(Post, posts)
+
+
+def post_references(repository: PostRepositoryInterface, pks: Iterable[int]) -> Dict[int, Post]:
+	"""
+	pk -> the Post already in the current identity map, or else a lazy
+	reference to it. The references share one ReferenceBatch, so using
+	any of them loads them all through one repository.get_many.
+
+	New references are mapped themselves, and later loads of their pks
+	fill them in place (see hydrate_rows), so a post reached through a
+	reference is the instance the identity map tracks.
+	"""
+	mapped, batch = identities(Post), ReferenceBatch(Post, repository.get_many)
+	posts = {}
+	for pk in pks:
+		post = mapped.get(pk)
+		if post is None:
+			post = mapped[pk] = batch.get(pk)
+		posts[pk] = post
+	return posts
+
+
+class SqliteCategoryRepository(SqliteRepository, CategoryRepositoryInterface):
+
+	table = "categories"
+	model = Category
+
+	def add(self, category: Category) -> Category:
+		with self._inserting():
+			self._assign_pks([category])
+			self._connection.execute(INSERT_CATEGORY, (category.pk, category.name))
+		category.mark_clean()
+		return category
+
+	def get(self, pk: int) -> Category:
+		rows = self._connection.execute(SELECT_CATEGORY, (pk,)).fetchall()
+		return self._one(hydrate_rows(Category, rows), pk)
+
+
+class SqlitePostRepository(SqliteRepository, PostRepositoryInterface):
+	"""
+	Posts are always loaded with their author and category through
+	one joined query, see SELECT_POSTS.
+	"""
+	table = "posts"
+	model = Post
+
+	def add(self, post: Post) -> Post:
+		return self.add_many([post])[0]
+
+	def add_many(self, posts: Iterable[Post]) -> List[Post]:
+		posts = list(posts)
+		now = datetime.datetime.now()
+		for post in posts:
+			if post.created_at is None:
+				post.created_at = now
+		with self._inserting():
+			self._assign_pks(posts)
+			self._connection.executemany(INSERT_POST, [(
+				post.pk, post.title, post.author.pk, post.category.pk if post.category else None,
+				post.status, post.body, from_datetime(post.published_at),
+				from_datetime(post.created_at), from_datetime(post.updated_at), from_datetime(now),
+			) for post in posts])
+		for post in posts:
+			post.mark_clean()
+		return posts
+
+	def get(self, pk: int) -> Post:
+		post = identities(Post).get(pk)
+		if post is not None and not is_reference(post):
+			return post
+		return self._one(self._select(SELECT_POST, pk), pk)
+
+	def get_many(self, pks: Iterable[int]) -> List[Post]:
+		mapped, missing = identities(Post), []
+		posts = []
+		for pk in dict.fromkeys(pks):
+			post = mapped.get(pk)
+			if post is None or is_reference(post):
+				missing.append(pk)
+			else:
+				posts.append(post)
+		if missing:
+			posts.extend(self._select(SELECT_POSTS_BY_PKS, json.dumps(missing)))
+		return posts
+
+	def update(self, post: Post) -> Post:
+		return self.update_many([post])[0]
+
+	def update_many(self, posts: Iterable[Post]) -> List[Post]:
+		"""
+		Writes only the changed columns of each post (see
+		Post.changed_fields), with one executemany per combination of
+		changed fields. Posts without changes are not written at all.
+		"""
+		posts = list(posts)
+		now = datetime.datetime.now()
+		stamp = from_datetime(now)
+
+		# changed fields -> posts
+		groups = {}
+		for post in posts:
+			changed_fields = post.changed_fields()
+			if changed_fields:
+				fields = tuple(field for field in POST_COLUMNS if field in changed_fields)
+				groups.setdefault(fields, []).append(post)
+
+		with self._connection:
+			for fields, group in groups.items():
+				values = [POST_COLUMNS[field][1] for field in fields]
+				stamps = (stamp, stamp) if 'status' in fields else (stamp,)
+				cursor = self._connection.executemany(update_post_query(fields), [
+					tuple(value(post) for value in values) + stamps + (post.pk,)
+					for post in group])
+				if cursor.rowcount != len(group):
+					# Find the missing post, raising rolls the batch back
+					for post in group:
+						self.get(post.pk)
+
+		for group in groups.values():
+			for post in group:
+				post.updated_at = now
+				post.mark_clean()
+		return posts
+
+	def list_by_status(self, status: str) -> List[Post]:
+		return self._select(SELECT_POSTS_BY_STATUS, status)
+
+	def iter_published(self, before: Tuple[datetime.datetime, int] = None,
+		category_pk: int = None, author_pk: int = None, chunk_size: int = 100) -> Iterator[Post]:
+		query = SELECT_PUBLISHED_PAGE[(category_pk is not None, author_pk is not None)]
+		filters = tuple(pk for pk in (category_pk, author_pk) if pk is not None)
+		key = (from_datetime(before[0]), before[1]) if before is not None else _LAST_PUBLISHED_KEY
+		while True:
+			posts = self._select(query, *key, *filters, chunk_size)
+			yield from posts
+			if len(posts) < chunk_size:
+				return
+			key = (from_datetime(posts[-1].published_at), posts[-1].pk)
+
+	def list_by_author(self, author_pk: int) -> List[Post]:
+		return self._select(SELECT_POSTS_BY_AUTHOR, author_pk)
+
+	def list_by_category(self, category_pk: int) -> List[Post]:
+		return self._select(SELECT_POSTS_BY_CATEGORY, category_pk)
+
+	def _select(self, query: str, *params) -> List[Post]:
+		return posts_from_rows(self._connection.execute(query, params))
+
+
+class SqliteCommentRepository(SqliteRepository, CommentRepositoryInterface):
+	"""
+	Comments are loaded with their users through one joined query. Their
+	posts are lazy references (see post_references), loaded together
+	through one more query only if a field other than pk is used.
+	"""
+	table = "comments"
+	model = Comment
+
+	def __init__(self, connection: sqlite3.Connection):
+		super().__init__(connection)
+		self._posts = SqlitePostRepository(connection)
+
+	def add(self, comment: Comment) -> Comment:
+		return self.add_many([comment])[0]
+
+	def add_many(self, comments: Iterable[Comment]) -> List[Comment]:
+		comments = list(comments)
+		with self._inserting():
+			self._assign_pks(comments)
+			self._connection.executemany(INSERT_COMMENT, [(
+				comment.pk, comment.post.pk, comment.user.pk, comment.body,
+				from_datetime(comment.created_at),
+			) for comment in comments])
+		for comment in comments:
+			comment.mark_clean()
+		return comments
+
+	def get(self, pk: int) -> Comment:
+		rows = self._connection.execute(SELECT_COMMENT, (pk,)).fetchall()
+		return self._one(self._comments_from_rows(rows), pk)
+
+	def list_by_post(self, post_pk: int) -> List[Comment]:
+		rows = self._connection.execute(SELECT_COMMENTS_BY_POST, (post_pk,)).fetchall()
+		return self._comments_from_rows(rows)
+
+	def _comments_from_rows(self, rows: List[tuple]) -> List[Comment]:
+		if not rows:
+			return []
+		posts = post_references(self._posts, {row[1] for row in rows})
+		users, comments = identities(User), []
+		for row in rows:
+			pk, post_pk, body, created_at = row[:4]
+			comments.append((pk, posts[post_pk], user_from_row(row[4:], users),
+				body, to_datetime(created_at)))
+		return hydrate_rows(Comment, comments)
@@ -0,0 +1,136 @@
+"""
+Benchmarks for the sqlite blog repositories.
+
+Measures peak memory streaming every published post through
+BlogService.iter_posts (SqlitePostRepository.iter_published), at 100k
+and 1M posts, against materializing them all with list_posts, and the
+cost of a deep list_posts_page.
+
+With the `updates` argument, instead times archiving 20k posts with
+4KB bodies through update_many, which writes only the changed columns,
+against rewriting every column of each row.
+
+To run:
+
+	cd .../onboard_exercise/
+	python3 -m blog.infrastructure.sqlite_bench [updates]
+"""
+import datetime
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from analytics.infrastructure import sqlite as analytics_sqlite
+from analytics.infrastructure.popularity import PopularPostsIndex
+from auth.domain.models import User
+from auth.infrastructure import sqlite as auth_sqlite
+from blog.application.blog_service import BlogService
+from blog.domain.models import Post
+from blog.infrastructure import sqlite as blog_sqlite
+from blog.infrastructure.wiring import build_blog_service
+from shared.infrastructure.sqlite import connect, from_datetime
+
+USERS = 1000
+
+
+def timed(func, *args, number: int = 5) -> float:
+	return min(timeit.repeat(lambda: func(*args), number=number, repeat=3)) / number * 1000
+
+
+def build_sqlite_service(database: str, posts: int, body: str = "Body") -> BlogService:
+	connection = connect(database)
+	for module in (auth_sqlite, blog_sqlite, analytics_sqlite):
+		module.create_tables(connection)
+	with connection:
+		connection.executemany(auth_sqlite.INSERT_USER, [(pk, "user%d" % pk, "testpass",
+			"user@example.com", "First", "Last", 1, 0, 1) for pk in range(1, USERS + 1)])
+		connection.executemany(blog_sqlite.INSERT_CATEGORY,
+			[(pk, "Category %d" % pk) for pk in range(1, 51)])
+		start = datetime.datetime(2020, 1, 1)
+		for first in range(1, posts + 1, 100000):
+			connection.executemany(blog_sqlite.INSERT_POST, [(
+				pk, "Post %d" % pk, pk % USERS + 1, pk % 50 + 1, 'p', body,
+				(start + datetime.timedelta(seconds=pk)).isoformat(), None, None, start.isoformat(),
+			) for pk in range(first, min(first + 100000, posts + 1))])
+	return build_blog_service(
+		blog_sqlite.SqliteCommentRepository(connection),
+		blog_sqlite.SqlitePostRepository(connection),
+		analytics_sqlite.SqliteViewRepository(connection),
+		auth_sqlite.SqliteUserRepository(connection),
+		blog_sqlite.SqliteCategoryRepository(connection),
+		popular_posts_index=PopularPostsIndex(),
+	)
+
+
+def peak_memory(func) -> tuple:
+	"""
+	Returns (result, peak traced MiB) of calling func.
+	"""
+	tracemalloc.start()
+	result = func()
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return result, peak / 2 ** 20
+
+
+def bench_pagination():
+	for posts in (100000, 1000000):
+		with tempfile.TemporaryDirectory() as directory:
+			service = build_sqlite_service(directory + "/bench.db", posts)
+			start = time.perf_counter()
+			count, peak = peak_memory(lambda: sum(1 for _ in service.iter_posts()))
+			print("%8d posts, iter_posts:  %6.1f MiB peak, %.1fs" % (
+				count, peak, time.perf_counter() - start))
+			if posts <= 100000:
+				result, peak = peak_memory(service.list_posts)
+				print("%8d posts, list_posts:  %6.1f MiB peak" % (len(result), peak))
+			page = service.list_posts_page(limit=20)
+			for _ in range(100):
+				page = service.list_posts_page(cursor=page['next_cursor'], limit=20)
+			print("%8d posts, list_posts_page, 101st page: %.3f ms" % (
+				posts, timed(service.list_posts_page, page['next_cursor'], number=100)))
+
+
+# Every column, as updates were written before change tracking
+FULL_ROW_UPDATE = """
+UPDATE posts SET title = ?, author_pk = ?, category_pk = ?,
+	status_changed_at = CASE WHEN status = ? THEN status_changed_at ELSE ? END,
+	status = ?, body = ?, published_at = ?, created_at = ?, updated_at = ?
+WHERE pk = ?
+"""
+
+
+def full_row_update(connection, posts):
+	now = datetime.datetime.now().isoformat()
+	with connection:
+		connection.executemany(FULL_ROW_UPDATE, [(
+			post.title, post.author.pk, post.category.pk if post.category else None,
+			post.status, now, post.status, post.body, from_datetime(post.published_at),
+			from_datetime(post.created_at), now, post.pk,
+		) for post in posts])
+
+
+def bench_updates(posts: int = 20000):
+	moderator = User(pk=USERS + 1, username="moderator", password="testpass",
+		email="user@example.com", first_name="First", last_name="Last", is_moderator=True)
+	for name, partial in (("update_many, changed columns", True), ("full row rewrite", False)):
+		with tempfile.TemporaryDirectory() as directory:
+			service = build_sqlite_service(directory + "/bench.db", posts, body="x" * 4096)
+			repository = service._post_repository
+			loaded = repository.list_by_status('p')
+			Post.bulk_update(loaded, updated_by=moderator, status='a')
+			start = time.perf_counter()
+			if partial:
+				repository.update_many(loaded)
+			else:
+				full_row_update(repository._connection, loaded)
+			print("archive %d posts, %s: %7.1f ms" % (
+				posts, name, (time.perf_counter() - start) * 1000))
+
+
+if __name__ == "__main__" and sys.argv[1:] == ["updates"]:
+	bench_updates()
+elif __name__ == "__main__":
+	bench_pagination()
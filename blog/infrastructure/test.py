@@ -0,0 +1,604 @@
+import os
+import sys
+import tempfile
+import threading
+from unittest.mock import ANY
+
+from analytics.domain.models import View
+from analytics.infrastructure import sqlite as analytics_sqlite
+from analytics.infrastructure.memory import ConcurrentInMemoryViewRepository
+from analytics.infrastructure.popularity import PopularPostsIndex
+from analytics.infrastructure.rollups import DAY, ViewRollups
+from auth.domain.models import User
+from auth.infrastructure import sqlite as auth_sqlite
+from auth.infrastructure.memory import ConcurrentInMemoryUserRepository
+from blog.application.test import BlogServiceTests
+from blog.domain.events import PostSaved
+from blog.domain.models import Category, Comment, Post
+from blog.infrastructure import sqlite as blog_sqlite
+from blog.infrastructure.history import EVENT_TYPES, PostHistory
+from blog.infrastructure.memory import (ConcurrentInMemoryCategoryRepository,
+	ConcurrentInMemoryCommentRepository, ConcurrentInMemoryPostRepository)
+from blog.infrastructure.projections import PostProjection
+from blog.infrastructure.search import SearchIndex
+from blog.infrastructure.wiring import build_blog_service
+from shared.domain.references import is_reference
+from shared.infrastructure.cache import ResponseCache
+from shared.infrastructure.event_log import EventLog
+from shared.infrastructure.identity import IdentityMap, UnitOfWork
+from shared.infrastructure.sqlite import connect
+
+
+class SqliteBlogServiceTests(BlogServiceTests):
+	"""
+	Runs the BlogService tests against the sqlite repositories.
+	"""
+	def build_repositories(self):
+		# Shared with the view ingestion worker thread
+		self.connection = connect(check_same_thread=False)
+		for module in (auth_sqlite, blog_sqlite, analytics_sqlite):
+			module.create_tables(self.connection)
+
+		self.users = auth_sqlite.SqliteUserRepository(self.connection)
+		self.categories = blog_sqlite.SqliteCategoryRepository(self.connection)
+		self.posts = blog_sqlite.SqlitePostRepository(self.connection)
+		self.comments = blog_sqlite.SqliteCommentRepository(self.connection)
+		self.views = analytics_sqlite.SqliteViewRepository(self.connection)
+
+	def count_queries(self, func, *args, **kwargs) -> int:
+		queries = []
+		self.connection.set_trace_callback(queries.append)
+		try:
+			func(*args, **kwargs)
+		finally:
+			self.connection.set_trace_callback(None)
+		return len([query for query in queries if query.lstrip().startswith("SELECT")])
+
+	def test_get_post_by_pk_query_count(self):
+		post = self.publish_post(category=self.category)
+		self.comments.add(Comment(post=post, user=self.reader, body="First!"))
+		one_comment = self.count_queries(self.service.get_post_by_pk, post.pk)
+
+		self.comments.add_many([Comment(post=post, user=user, body="Me too!")
+			for user in (self.reader, self.author, self.moderator) * 20])
+		self.views.add_many([View(post=post, user=self.reader) for _ in range(20)])
+		self.assertEqual(len(self.service.get_post_by_pk(post.pk)['comments']), 61)
+		self.assertEqual(self.count_queries(self.service.get_post_by_pk, post.pk), one_comment)
+
+	def test_post_loads_shared_nested_objects(self):
+		first = self.publish_post(category=self.category)
+		second = self.publish_post(category=self.category)
+		posts = self.posts.list_by_status('p')
+
+		self.assertEqual([post.pk for post in posts], [first.pk, second.pk])
+		self.assertIs(posts[0].author, posts[1].author)
+		self.assertIs(posts[0].category, posts[1].category)
+		self.assertEqual(posts[0].author.is_author, True)
+		self.assertEqual(posts[0].published_at, first.published_at)
+
+	def test_partial_updates(self):
+		post = self.publish_post()
+		queries = []
+		self.connection.set_trace_callback(queries.append)
+		try:
+			self.service.update_post(post.pk, self.moderator.pk, status='p')
+		except ValueError:
+			pass
+		self.service.update_post(post.pk, self.author.pk, body="This is my cool article.")
+		self.service.update_posts_bulk([post.pk], self.author.pk, status='a')
+		self.connection.set_trace_callback(None)
+
+		updates = [query for query in queries if query.lstrip().startswith("UPDATE")]
+		self.assertEqual(len(updates), 1)
+		self.assertIn("status = 'a'", updates[0])
+		self.assertNotIn("body", updates[0])
+		self.assertEqual(self.posts.get(post.pk).status, 'a')
+
+	def test_identity_map(self):
+		post = self.publish_post(category=self.category)
+		self.comments.add_many([Comment(post=post, user=user, body="Me too!")
+			for user in (self.reader, self.author) * 5])
+		self.views.add_many([View(post=post, user=self.reader) for _ in range(5)])
+
+		with IdentityMap() as identity_map:
+			loaded = self.posts.get(post.pk)
+			self.assertEqual(self.count_queries(self.posts.get, post.pk), 0)
+			comments = self.comments.list_by_post(post.pk)
+			views = self.views.list_by_post(post.pk)
+
+			self.assertTrue(all(comment.post is loaded for comment in comments))
+			self.assertTrue(all(view.post is loaded for view in views))
+			self.assertIs(comments[1].user, loaded.author)
+			self.assertIs(views[0].user, comments[0].user)
+			self.assertIs(self.comments.list_by_post(post.pk)[0], comments[0])
+			# The post, its author and category, the reader, 10 comments and 5 views
+			self.assertEqual(len(identity_map), 19)
+
+		self.assertIsNot(self.posts.get(post.pk), loaded)
+
+	def test_lazy_post_references(self):
+		first = self.publish_post(title="First")
+		second = self.publish_post(title="Second")
+		self.comments.add_many([Comment(post=post, user=self.reader, body="Me too!")
+			for post in (first, second, first)])
+
+		queries = []
+		self.connection.set_trace_callback(queries.append)
+		comments = self.comments.list_by_post(first.pk) + self.comments.list_by_post(second.pk)
+		self.assertEqual([comment.post.pk for comment in comments], [first.pk, first.pk, second.pk])
+		self.assertTrue(all(is_reference(comment.post) for comment in comments))
+		self.assertIs(comments[0].post, comments[1].post)
+		self.assertEqual(len(queries), 2)
+
+		# Using one reference loads the others of its batch
+		self.assertEqual(comments[0].post.title, "First")
+		self.assertIs(type(comments[0].post), Post)
+		self.assertIs(comments[1].post.author, comments[0].post.author)
+		self.assertEqual(len(queries), 3)
+		self.assertEqual(comments[2].post.body, second.body)
+		self.assertEqual(len(queries), 4)
+		self.connection.set_trace_callback(None)
+
+		# References pass type checks and are no change
+		comment = comments[2]
+		self.assertEqual(Comment(post=self.comments.get(comment.pk).post, user=self.reader,
+			body="Still?").post.pk, second.pk)
+		comment.post = second
+		self.assertEqual(comment.changed_fields(), [])
+
+	def test_concurrent_inserts(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		path = os.path.join(directory.name, "blog.db")
+		shared = connect(path, check_same_thread=False)
+		self.addCleanup(shared.close)
+		auth_sqlite.create_tables(shared)
+
+		def add_users(number: int):
+			# Half the threads share a connection, the others have their own
+			connection = shared if number % 2 else connect(path)
+			users = auth_sqlite.SqliteUserRepository(connection)
+			for index in range(50):
+				users.add(User(username="user%d.%d" % (number, index), password="testpass",
+					email="user@example.com", first_name="First", last_name="Last"))
+			if connection is not shared:
+				connection.close()
+
+		threads = [threading.Thread(target=add_users, args=(number,)) for number in range(6)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(shared.execute("SELECT COUNT(*), MAX(pk) FROM users").fetchone(), (300, 300))
+
+	def test_update_through_reference(self):
+		post = self.publish_post()
+		self.comments.add(Comment(post=post, user=self.reader, body="Nice"))
+
+		with UnitOfWork({Post: self.posts, Comment: self.comments}) as uow:
+			(comment,) = self.comments.list_by_post(post.pk)
+			self.assertTrue(is_reference(comment.post))
+			# The mapped reference is the instance everyone gets
+			self.assertIs(self.posts.get(post.pk), comment.post)
+			self.assertIs(type(comment.post), Post)
+			comment.post.update(updated_by=self.author, status='a')
+			self.assertEqual(uow.dirty(), [(comment.post, ['status'])])
+			self.assertEqual(uow.commit(), {"added": 0, "updated": 1})
+		self.assertEqual(self.posts.get(post.pk).status, 'a')
+
+		# Loading the reference first gives the same instance too
+		with UnitOfWork({Post: self.posts}):
+			(comment,) = self.comments.list_by_post(post.pk)
+			self.assertEqual(comment.post.title, "Hello World")
+			self.assertIs(self.posts.get_many([post.pk])[0], comment.post)
+
+	def test_unit_of_work(self):
+		first = self.publish_post(title="First")
+		second = self.publish_post(title="Second")
+		updates = []
+		update_many = self.posts.update_many
+		self.posts.update_many = lambda posts: updates.append(list(posts)) or update_many(posts)
+
+		with UnitOfWork({Post: self.posts, Comment: self.comments}) as uow:
+			post = self.posts.get(first.pk)
+			self.posts.get(second.pk)
+			post.update(updated_by=self.author, status='a')
+			uow.add(Comment(post=post, user=self.moderator, body="Archived"))
+			self.assertEqual(uow.dirty(), [(post, ['status'])])
+			self.assertEqual(uow.commit(), {"added": 1, "updated": 1})
+			self.assertEqual(uow.dirty(), [])
+
+			self.users.get(self.reader.pk).first_name = "Changed"
+			with self.assertRaises(ValueError):
+				uow.commit()
+
+		# Only the changed post was written
+		self.assertEqual(updates, [[post]])
+		self.assertEqual(self.posts.get(first.pk).status, 'a')
+		self.assertEqual(self.posts.get(second.pk).status, 'p')
+		self.assertEqual([comment.body for comment in self.comments.list_by_post(first.pk)],
+			["Archived"])
+
+
+class ProjectedBlogServiceTests(BlogServiceTests):
+	"""
+	Runs the BlogService tests with reads served from a PostProjection.
+	"""
+	def service_options(self) -> dict:
+		self.projection = PostProjection()
+		return {'post_projection': self.projection}
+
+	def test_reads_skip_domain_objects(self):
+		post = self.publish_post(category=self.category)
+		comment = self.service.create_comment(post.pk, self.reader.pk, "My comment!")
+		expected = self.service.get_post_by_pk(post.pk)
+
+		def fail(*args, **kwargs):
+			raise AssertionError("Read went to the post repository")
+		self.posts.get = self.posts.list_by_status = fail
+
+		self.assertEqual(self.service.get_post_by_pk(post.pk), expected)
+		self.assertEqual(expected['comments'], [comment])
+		self.assertEqual([post['pk'] for post in self.service.list_posts()], [post.pk])
+		self.assertEqual(self.service.list_popular_posts()[0]['views'], 0)
+
+		# Returned rows are copies
+		expected['comments'].clear()
+		self.assertEqual(len(self.service.get_post_by_pk(post.pk)['comments']), 1)
+
+	def test_rebuild(self):
+		post = self.publish_post(category=self.category)
+		self.service.create_comment(post.pk, self.reader.pk, "My comment!")
+		self.service.get_post_by_pk(post.pk, user_pk=self.reader.pk)
+		expected = self.service.get_post_by_pk(post.pk)
+
+		self.projection.rebuild([], [], {})
+		self.assertEqual(self.service.list_posts(), [])
+		self.service.rebuild_read_models()
+		self.assertEqual(self.service.get_post_by_pk(post.pk), expected)
+
+	def test_built_over_existing_data(self):
+		post = self.publish_post(category=self.category)
+		self.service.create_comment(post.pk, self.reader.pk, "My comment!")
+		self.service = build_blog_service(self.comments, self.posts, self.views, self.users,
+			self.categories, post_projection=PostProjection())
+		self.assertEqual(len(self.service.get_post_by_pk(post.pk)['comments']), 1)
+		self.service.create_comment(post.pk, self.reader.pk, "Another!")
+		self.assertEqual(len(self.service.get_post_by_pk(post.pk)['comments']), 2)
+
+		# Comments and views of posts the projection doesn't hold are skipped
+		projection = PostProjection()
+		projection.comment_added(self.comments.list_by_post(post.pk)[0])
+		projection.view_recorded(post.pk)
+		self.assertEqual(len(projection), 0)
+
+	def test_concurrent_reads_and_writes(self):
+		post = self.publish_post()
+		errors = []
+
+		def work(number: int):
+			try:
+				for index in range(200):
+					if number % 2:
+						self.service.list_posts()
+						self.service.get_post_by_pk(post.pk)
+					else:
+						# New published posts grow the rows being listed
+						self.projection.post_saved(Post.hydrate(dict(post,
+							pk=1000 * (number + 1) + index)))
+						self.projection.view_recorded(post.pk)
+			except Exception as error:
+				errors.append(error)
+
+		interval = sys.getswitchinterval()
+		# Switch threads often, so reads and writes interleave
+		sys.setswitchinterval(1e-6)
+		try:
+			threads = [threading.Thread(target=work, args=(number,)) for number in range(8)]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+		finally:
+			sys.setswitchinterval(interval)
+		self.assertEqual(errors, [])
+		self.assertEqual(len(self.service.list_posts()), 1 + 4 * 200)
+		self.assertEqual(self.projection.get_detail(post.pk)['views'], 4 * 200)
+
+
+class CachedBlogServiceTests(BlogServiceTests):
+	"""
+	Runs the BlogService tests with a response cache in front of reads.
+	"""
+	def service_options(self) -> dict:
+		self.cache = ResponseCache()
+		return {'response_cache': self.cache}
+
+	def test_writes_invalidate(self):
+		post = self.publish_post(category=self.category)
+		self.assertEqual(self.service.list_posts()[0]['category'], "For Fun!")
+		self.assertEqual(self.service.get_post_by_pk(post.pk)['comments'], [])
+		self.service.list_popular_posts()
+		self.service.list_posts_page(limit=1)
+		hits = self.cache.hits
+		self.service.list_posts()
+		self.service.get_post_by_pk(post.pk)
+		self.service.list_popular_posts()
+		self.service.list_posts_page(limit=1)
+		self.assertEqual(self.cache.hits, hits + 4)
+
+		self.service.create_comment(post.pk, self.reader.pk, "My comment!")
+		self.assertEqual(len(self.service.get_post_by_pk(post.pk)['comments']), 1)
+
+		other = self.categories.add(Category(name="Other"))
+		self.service.update_post(post.pk, self.author.pk, category_pk=other.pk)
+		self.assertEqual(self.service.get_post_by_pk(post.pk)['category'], "Other")
+		self.assertEqual(self.service.list_posts()[0]['category'], "Other")
+		self.assertEqual(self.service.list_popular_posts()[0]['category'], "Other")
+		self.assertEqual(self.service.list_posts_page(limit=1)['posts'][0]['category'], "Other")
+
+		self.service.update_post(post.pk, self.author.pk, status='a')
+		self.assertEqual(self.service.list_posts(), [])
+		self.assertEqual(self.service.list_popular_posts(), [])
+
+	def test_views_are_live(self):
+		post = self.publish_post()
+		self.assertEqual(self.service.get_post_by_pk(post.pk, user_pk=self.reader.pk)['views'], 1)
+		self.assertEqual(self.service.list_popular_posts()[0]['views'], 1)
+		self.service.get_post_by_pk(post.pk)['comments'].append(None)
+		self.assertEqual(self.service.get_post_by_pk(post.pk)['comments'], [])
+
+
+class EventLogBlogServiceTests(BlogServiceTests):
+	"""
+	Runs the BlogService tests with domain events appended to an event log.
+	"""
+	def service_options(self) -> dict:
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.event_log = EventLog(directory.name, EVENT_TYPES)
+		self.addCleanup(self.event_log.close)
+		return {'event_log': self.event_log}
+
+	def test_history_recovers_popular_posts(self):
+		first = self.publish_post(title="First")
+		second = self.publish_post(title="Second")
+		self.service.get_post_by_pk(first.pk, user_pk=self.reader.pk)
+		self.service.get_post_by_pk(second.pk, user_pk=self.reader.pk)
+		self.service.get_post_by_pk(second.pk, user_pk=self.moderator.pk)
+		self.service.create_comment(first.pk, self.reader.pk, "My comment!")
+
+		history = PostHistory.recover(self.event_log)
+		self.assertTrue(history.checkpoint(self.event_log))
+		self.assertEqual(history.statuses, {first.pk: 'p', second.pk: 'p'})
+		self.assertEqual(history.view_counts, {first.pk: 1, second.pk: 2})
+		self.assertEqual(history.comment_counts, {first.pk: 1})
+
+		self.service.update_post(second.pk, self.author.pk, status='a')
+		self.event_log.flush()
+		self.assertEqual([event for _, event in self.event_log.events(after=history.sequence)],
+			[PostSaved(second.pk, ANY, {'status': 'a'})])
+
+		recovered = PostHistory.recover(self.event_log)
+		self.assertEqual(recovered.snapshot_sequence, history.sequence)
+		self.assertEqual(recovered.statuses, {first.pk: 'p', second.pk: 'a'})
+		index = PopularPostsIndex()
+		recovered.rebuild_popular_posts(index)
+		self.assertEqual(index.top(), [(first.pk, 1)])
+
+
+class SearchBlogServiceTests(BlogServiceTests):
+	"""
+	Runs the BlogService tests with a search index.
+	"""
+	def service_options(self) -> dict:
+		self.search_index = SearchIndex()
+		self.addCleanup(self.search_index.close)
+		return {'search_index': self.search_index}
+
+	def test_search_posts(self):
+		cats = self.publish_post(title="Cats", category=self.category)
+		self.service.update_post(cats.pk, self.author.pk, body="All about cats and dogs.")
+		dogs = self.publish_post(title="Dogs and more dogs")
+		self.service.create_post(self.author.pk, "Draft about dogs")
+
+		self.assertEqual([post['pk'] for post in self.service.search_posts("dogs")], [dogs.pk, cats.pk])
+		self.assertEqual([post['pk'] for post in self.service.search_posts("CATS!")], [cats.pk])
+		self.assertEqual([post['pk'] for post in self.service.search_posts("dogs",
+			category_pk=self.category.pk)], [cats.pk])
+		self.assertEqual(self.service.search_posts("the"), [])
+		self.assertGreater(self.service.search_posts("cool article")[0]['score'], 0)
+
+		self.service.update_post(dogs.pk, self.author.pk, status='a')
+		self.assertEqual([post['pk'] for post in self.service.search_posts("dogs")], [cats.pk])
+
+	def test_index_file(self):
+		cats = self.publish_post(title="Cats", category=self.category)
+		dogs = self.publish_post(title="Dogs")
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		path = os.path.join(directory.name, "search.idx")
+		self.search_index.save(path)
+
+		loaded = SearchIndex.load(path)
+		self.addCleanup(loaded.close)
+		self.assertEqual(len(loaded), 2)
+		self.assertEqual(loaded.search("cats"), self.search_index.search("cats"))
+		self.assertEqual([hit.post_pk for hit in loaded.search("cool", status='p',
+			category_pk=self.category.pk, author_pk=self.author.pk)], [cats.pk])
+
+		# Changes go to the delta, masking the base
+		dogs.title = "Birds"
+		loaded.update_post(dogs)
+		loaded.remove_post(cats.pk)
+		self.assertEqual(loaded.search("dogs cats"), [])
+		self.assertEqual([hit.post_pk for hit in loaded.search("birds")], [dogs.pk])
+
+		loaded.save(path)
+		merged = SearchIndex.load(path)
+		self.addCleanup(merged.close)
+		self.assertEqual(len(merged), 1)
+		self.assertNotIn(cats.pk, merged)
+		self.assertEqual([hit.post_pk for hit in merged.search("birds cool")], [dogs.pk])
+		self.assertGreater(merged.search("birds cool")[0].score, 0)
+
+	def test_concurrent_updates(self):
+		post = self.publish_post(title="Cats")
+		body = " ".join("word%d" % number for number in range(50))
+		posts = [Post.hydrate(dict(post, pk=1000 + number, body=body)) for number in range(8)]
+		errors = []
+
+		def update(number: int):
+			# Removing a post can drop the postings other posts are being added to
+			try:
+				for _ in range(500):
+					self.search_index.remove_post(posts[number].pk)
+					self.search_index.update_post(posts[number])
+			except Exception as error:
+				errors.append(error)
+
+		interval = sys.getswitchinterval()
+		# Switch threads often, so updates interleave
+		sys.setswitchinterval(1e-6)
+		try:
+			threads = [threading.Thread(target=update, args=(number,)) for number in range(8)]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+		finally:
+			sys.setswitchinterval(interval)
+		self.assertEqual(errors, [])
+		for query in ("cats", "word0", "word49"):
+			self.assertEqual(sorted(hit.post_pk for hit in self.search_index.search(query)),
+				([post.pk] if query == "cats" else []) + [post.pk for post in posts])
+
+
+class RollupBlogServiceTests(BlogServiceTests):
+	"""
+	Runs the BlogService tests with views rolled up in time buckets.
+	"""
+	def service_options(self) -> dict:
+		self.view_rollups = ViewRollups()
+		return {'view_rollups': self.view_rollups}
+
+	def test_popular_this_week(self):
+		first = self.publish_post(title="First", category=self.category)
+		second = self.publish_post(title="Second")
+		self.service.get_post_by_pk(first.pk, user_pk=self.reader.pk)
+		self.service.get_post_by_pk(second.pk, user_pk=self.reader.pk)
+		self.service.get_post_by_pk(second.pk, user_pk=self.moderator.pk)
+
+		popular = self.service.list_popular_posts(days=7)
+		self.assertEqual([(post['pk'], post['views']) for post in popular],
+			[(second.pk, 2), (first.pk, 1)])
+		self.assertEqual(self.view_rollups.category_views(self.category.pk, 0, granularity=DAY), 1)
+		self.assertEqual(self.view_rollups.unique_viewers(second.pk, 0), 2)
+		with self.assertRaises(ValueError):
+			self.service.list_popular_posts(days=30)
+
+		self.view_rollups.rebuild([], [])
+		self.service.rebuild_read_models()
+		self.assertEqual(self.service.list_popular_posts(days=7), popular)
+
+
+class ConcurrentBlogServiceTests(BlogServiceTests):
+	"""
+	Runs the BlogService tests against the thread safe in-memory
+	repositories, plus reads and writes from many threads at once.
+	"""
+	def build_repositories(self):
+		self.users = ConcurrentInMemoryUserRepository()
+		self.categories = ConcurrentInMemoryCategoryRepository()
+		self.posts = ConcurrentInMemoryPostRepository()
+		self.comments = ConcurrentInMemoryCommentRepository()
+		self.views = ConcurrentInMemoryViewRepository()
+
+	def run_threads(self, target, count: int = 8):
+		threads = [threading.Thread(target=target, args=(number,)) for number in range(count)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+	def test_concurrent_reads_and_views(self):
+		post = self.publish_post()
+		readers = [self.users.add(User(username="reader%d" % number, password="testpass",
+			email="user@example.com", first_name="First", last_name="Reader",
+			is_active=True, is_author=False, is_moderator=False)) for number in range(8)]
+		self.views.add(View(post=post, user=self.moderator))
+
+		def read(number: int):
+			for _ in range(50):
+				self.service.get_post_by_pk(post.pk, user_pk=readers[number].pk)
+				self.service.list_posts()
+				# Also races repeat views of one user
+				self.service.get_post_by_pk(post.pk, user_pk=self.reader.pk)
+
+		self.run_threads(read)
+		# Each reader's view counted once, the repeats inside the window not
+		self.assertEqual(self.views.count_by_post(post.pk), 10)
+		self.assertEqual(self.service.get_post_by_pk(post.pk)['views'], 9)
+
+	def test_concurrent_adds(self):
+		post = self.publish_post()
+		self.comments.add(Comment(pk=1000, post=post, user=self.reader, body="Explicit"))
+
+		def comment(number: int):
+			for index in range(200):
+				self.service.create_comment(post.pk, self.reader.pk, "%d.%d" % (number, index))
+
+		self.run_threads(comment)
+		comments = self.comments.list_by_post(post.pk)
+		self.assertEqual(len(comments), 1601)
+		self.assertEqual(len({comment.pk for comment in comments}), 1601)
+		with self.assertRaises(ValueError):
+			self.comments.add(Comment(pk=1000, post=post, user=self.reader, body="Again"))
+
+	def test_concurrent_updates(self):
+		post = self.service.create_post(self.author.pk, "Hello World")
+
+		def update(number: int):
+			field = 'title' if number % 2 else 'body'
+			for index in range(50):
+				self.service.update_post(post['pk'], self.author.pk, **{field: "%d.%d" % (number, index)})
+
+		interval = sys.getswitchinterval()
+		# Switch threads often, so updates interleave
+		sys.setswitchinterval(1e-6)
+		try:
+			self.run_threads(update)
+		finally:
+			sys.setswitchinterval(interval)
+		# Each update starts from the one before it, so neither field's
+		# last value is overwritten by a stale copy of the post
+		stored = self.posts.get(post['pk'])
+		self.assertTrue(stored.title.endswith('.49'))
+		self.assertTrue(stored.body.endswith('.49'))
+
+	def test_gets_copies(self):
+		post = self.publish_post()
+		got = self.posts.get(post.pk)
+		self.assertIsNot(got, self.posts.get(post.pk))
+		got.title = "Not saved"
+		self.assertEqual(self.posts.get(post.pk).title, "Hello World")
+		self.assertEqual(self.posts.list_by_status('p')[0].title, "Hello World")
+		self.posts.update(got)
+		self.assertEqual(next(self.posts.iter_published()).title, "Not saved")
+
+	def test_remove_views_while_adding(self):
+		post = self.publish_post()
+		old = self.views.add_many(View(post=post, user=self.reader) for _ in range(1000))
+
+		def add_or_remove(number: int):
+			if number:
+				self.views.add_many(View(post=post, user=self.moderator) for _ in range(1000))
+			else:
+				for start in range(0, 1000, 10):
+					self.views.remove_many(view.pk for view in old[start:start + 10])
+
+		self.run_threads(add_or_remove, count=4)
+		views = self.views.list_by_post(post.pk)
+		self.assertEqual(len(views), 3000)
+		self.assertEqual(len(self.views), 3000)
+		self.assertTrue(all(view.user.pk == self.moderator.pk for view in views))
@@ -0,0 +1,85 @@
+"""
+Assembles the blog services from infrastructure implementations. The
+services themselves only know their collaborators' interfaces.
+"""
+from analytics.domain.repository import AsyncViewRepositoryInterface, ViewRepositoryInterface
+from analytics.infrastructure.last_seen import LastSeenIndex, ViewRepositoryLastSeenStore
+from analytics.infrastructure.popularity import PopularPostsIndex
+from auth.domain.repository import AsyncUserRepositoryInterface, UserRepositoryInterface
+from auth.infrastructure.permissions import PermissionCache
+from blog.application.async_blog_service import AsyncBlogService
+from blog.application.blog_service import VIEW_WINDOW, BlogService
+from blog.domain.repository import (AsyncCategoryRepositoryInterface,
+	AsyncCommentRepositoryInterface, AsyncPostRepositoryInterface, CategoryRepositoryInterface,
+	CommentRepositoryInterface, PostRepositoryInterface)
+
+
+def build_blog_service(
+	comment_repository: CommentRepositoryInterface,
+	post_repository: PostRepositoryInterface,
+	view_repository: ViewRepositoryInterface,
+	user_repository: UserRepositoryInterface,
+	category_repository: CategoryRepositoryInterface,
+	popular_posts_index: PopularPostsIndex = None,
+	last_seen_index: LastSeenIndex = None,
+	permission_cache: PermissionCache = None,
+	**options
+) -> BlogService:
+	"""
+	A BlogService over these repositories, making the collaborators it
+	needs when not passed.
+
+	Parameters
+	----------
+	popular_posts_index: PopularPostsIndex, optional
+		A new one rebuilt from the repositories when not passed
+	last_seen_index: LastSeenIndex, optional
+		A new one over VIEW_WINDOW when not passed, falling back to the
+		view repository for pairs it does not hold
+	permission_cache: PermissionCache, optional
+		A new one over user_repository when not passed. It should be
+		shared by everything in the process using the same user
+		repository.
+	**options
+		The optional collaborators of BlogService, eg. view_pipeline
+	"""
+	if last_seen_index is None:
+		last_seen_index = LastSeenIndex(VIEW_WINDOW,
+			backing=ViewRepositoryLastSeenStore(view_repository))
+	if permission_cache is None:
+		permission_cache = PermissionCache(user_repository)
+	service = BlogService(comment_repository, post_repository, view_repository,
+		user_repository, category_repository,
+		popular_posts_index=popular_posts_index if popular_posts_index is not None
+			else PopularPostsIndex(),
+		last_seen_index=last_seen_index,
+		permission_cache=permission_cache,
+		**options)
+	if popular_posts_index is None:
+		service.rebuild_popular_posts()
+	return service
+
+
+def build_async_blog_service(
+	comment_repository: AsyncCommentRepositoryInterface,
+	post_repository: AsyncPostRepositoryInterface,
+	view_repository: AsyncViewRepositoryInterface,
+	user_repository: AsyncUserRepositoryInterface,
+	category_repository: AsyncCategoryRepositoryInterface,
+	last_seen_index: LastSeenIndex = None,
+	**options
+) -> AsyncBlogService:
+	"""
+	An AsyncBlogService over these repositories.
+
+	Parameters
+	----------
+	last_seen_index: LastSeenIndex, optional
+		A new one over VIEW_WINDOW without backing when not passed
+	**options
+		As accepted by AsyncBlogService, eg. timeout
+	"""
+	if last_seen_index is None:
+		last_seen_index = LastSeenIndex(VIEW_WINDOW)
+	return AsyncBlogService(comment_repository, post_repository, view_repository,
+		user_repository, category_repository, last_seen_index=last_seen_index, **options)
@@ -0,0 +1,101 @@
+import threading
+from contextlib import contextmanager
+from typing import Hashable, Iterable, Iterator
+
+
+class ReadWriteLock:
+	"""
+	Lets many readers or one writer in at a time, for read-mostly data.
+
+	Writers are preferred: once one is waiting, new readers wait behind
+	it, so a steady stream of reads can't starve writes. Not reentrant,
+	a thread holding either side must not acquire again.
+
+	Usage:
+
+		with lock.read():
+			...
+		with lock.write():
+			...
+	"""
+	def __init__(self):
+		self._condition = threading.Condition(threading.Lock())
+		self._readers = 0
+		self._writing = False
+		self._waiting_writers = 0
+
+	@contextmanager
+	def read(self) -> Iterator[None]:
+		with self._condition:
+			while self._writing or self._waiting_writers:
+				self._condition.wait()
+			self._readers += 1
+		try:
+			yield
+		finally:
+			with self._condition:
+				self._readers -= 1
+				if not self._readers:
+					self._condition.notify_all()
+
+	@contextmanager
+	def write(self) -> Iterator[None]:
+		with self._condition:
+			self._waiting_writers += 1
+			try:
+				while self._writing or self._readers:
+					self._condition.wait()
+			finally:
+				self._waiting_writers -= 1
+			self._writing = True
+		try:
+			yield
+		finally:
+			with self._condition:
+				self._writing = False
+				self._condition.notify_all()
+
+
+class StripedLock:
+	"""
+	A fixed set of locks shared by any number of keys, each key always
+	mapping to the same one: threads working on different keys rarely
+	contend, for the memory of stripes locks rather than one per key.
+
+	Usage:
+
+		with stripes.lock_for(pk):
+			...
+		with stripes.locks_for(pks):  # eg. a batch update
+			...
+
+	Parameters
+	----------
+	stripes: int, default to 64
+	"""
+	def __init__(self, stripes: int = 64):
+		self._locks = [threading.Lock() for _ in range(stripes)]
+
+	def lock_for(self, key: Hashable) -> threading.Lock:
+		return self._locks[hash(key) % len(self._locks)]
+
+	@contextmanager
+	def locks_for(self, keys: Iterable[Hashable]) -> Iterator[None]:
+		"""
+		Holds the locks of all keys, taken in stripe order so two threads
+		locking overlapping sets can't deadlock.
+		"""
+		stripes = len(self._locks)
+		locks = [self._locks[index] for index in sorted({hash(key) % stripes for key in keys})]
+		for acquired, lock in enumerate(locks):
+			try:
+				lock.acquire()
+			except BaseException:
+				for held in reversed(locks[:acquired]):
+					held.release()
+				raise
+		try:
+			yield
+		finally:
+			for lock in reversed(locks):
+				lock.release()
@@ -0,0 +1,95 @@
+"""
+Microbenchmark for domain model construction.
+
+Compares the compiled-schema constructor on BaseDomainModel with the
+previous dir() scanning constructor, reproduced here as LegacyModel.
+
+To run:
+
+	cd .../onboard_exercise/
+	python3 -m shared.domain.bench
+"""
+import datetime
+import timeit
+
+from shared.domain.models import BaseDomainModel, DomainField
+
+
+class LegacyModel:
+	"""
+	The pre-schema BaseDomainModel.__init__, kept only as a baseline.
+	"""
+	def __init__(self, *args, **kwargs):
+		domain_field_names = [field_name for field_name in dir(self)
+			if not field_name == '_domain_field_names' and
+			isinstance(getattr(self, field_name), DomainField)]
+
+		for field_name in domain_field_names:
+			setattr(self, "_" + field_name, getattr(self, field_name))
+			setattr(self, field_name, None)
+
+		for field_name in domain_field_names:
+			default = getattr(self, "_" + field_name).default
+			if default:
+				setattr(self, field_name, default)
+
+		for k, v in kwargs.items():
+			domain_field = getattr(self, "_" + k)
+			if (not domain_field.nullable and v is None) \
+					and not isinstance(v, domain_field.dtype):
+				raise TypeError(k)
+			if domain_field.choices and v not in [c for c, _ in domain_field.choices]:
+				raise ValueError(k)
+			setattr(self, k, v)
+
+		required_fields = [df[1:] for df in self._domain_field_names
+			if getattr(self, df).required]
+		for field in required_fields:
+			if not getattr(self, field):
+				raise ValueError(field)
+
+	@property
+	def _domain_field_names(self):
+		return [field_name for field_name in dir(self)
+			if field_name.startswith("_")
+			and field_name != '_domain_field_names'
+			and isinstance(getattr(self, field_name), DomainField)]
+
+
+STATUS = [('d', 'Draft'), ('r', 'Review'), ('p', 'Published'), ('a', 'Archived')]
+
+
+def post_fields():
+	return dict(
+		pk=DomainField(dtype=int),
+		title=DomainField(dtype=str, required=True),
+		author=DomainField(dtype=object, required=True),
+		category=DomainField(dtype=object, nullable=True, default=None),
+		status=DomainField(dtype=str, required=True, default='d', choices=STATUS),
+		body=DomainField(dtype=str, default=''),
+		published_at=DomainField(dtype=datetime.datetime, nullable=True, default=None),
+		created_at=DomainField(dtype=datetime.datetime, nullable=True, default=None),
+		updated_at=DomainField(dtype=datetime.datetime, nullable=True, default=None),
+	)
+
+
+LegacyPost = type('LegacyPost', (LegacyModel,), post_fields())
+SchemaPost = type('SchemaPost', (BaseDomainModel,), post_fields())
+
+
+def bench(model_cls, number: int = 20000) -> float:
+	"""
+	Returns construction cost per object in microseconds.
+	"""
+	kwargs = dict(pk=1, title='Hello World', author='author', status='p',
+		body='This is my cool article.', published_at=datetime.datetime.now())
+	seconds = min(timeit.repeat(lambda: model_cls(**kwargs), number=number, repeat=5))
+	return seconds / number * 1e6
+
+
+if __name__ == "__main__":
+	legacy = bench(LegacyPost)
+	compiled = bench(SchemaPost)
+	print("dir() scan:      %.2f us/object" % legacy)
+	print("compiled schema: %.2f us/object" % compiled)
+	print("speedup:         %.1fx" % (legacy / compiled))
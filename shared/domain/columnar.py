@@ -0,0 +1,126 @@
+"""
+Column-at-a-time validation for batches of new domain objects, eg. posts
+imported from a feed.
+
+validate_columns runs each BaseDomainModel.__init__ check once per column
+instead of once per field per row, and reports exactly the failures that
+constructing every row through __init__ would: the same exception, with
+the same message, for the first check each row fails.
+"""
+from typing import Dict, List, Mapping, NamedTuple, Sequence
+
+from shared.domain.models import DomainModelConstructionException
+
+
+class ColumnValidation(NamedTuple):
+	"""
+	valid: one bool per row, True if the row would construct
+	errors: row index -> the exception __init__ would raise for it
+	"""
+	valid: List[bool]
+	errors: Dict[int, Exception]
+
+
+def validate_columns(model_cls: type, columns: Mapping[str, Sequence]) -> ColumnValidation:
+	"""
+	Validates rows given as columns against model_cls's creation rules.
+
+	Checks run column by column in the order __init__ would meet them for
+	a row passed as model_cls(**{name: column[i] for name, column in
+	columns.items()}):
+
+	- unknown field names
+	- None on non nullable fields (as in __init__, other values are not
+	  type checked)
+	- choices, one set membership pass per column
+	- required fields, against the column or the field's default
+	- model specific rules, through model_cls._validate_columns
+
+	A row is only checked until its first failure, as __init__ stops at
+	the first exception.
+
+	Rows that pass are safe to build with model_cls.hydrate_many for
+	models whose __init__ only validates (eg. Post).
+
+	Parameters
+	----------
+	model_cls: type
+		The BaseDomainModel subclass the rows are for
+	columns: Mapping[str, Sequence]
+		field_name -> one value per row. Lists, tuples or anything with a
+		tolist() method (eg. numpy arrays), all of the same length.
+	"""
+	columns = {field_name: column.tolist() if hasattr(column, 'tolist') else list(column)
+		for field_name, column in columns.items()}
+	lengths = {len(column) for column in columns.values()}
+	if len(lengths) > 1:
+		raise ValueError("Columns passed to validate_columns must all be the same length,"
+			" got lengths %s" % sorted(lengths))
+	row_count = lengths.pop() if lengths else 0
+
+	schema = model_cls.schema
+	domain_fields = schema.domain_fields
+	errors = {}
+	# Rows that have not failed yet, in order
+	remaining = range(row_count)
+
+	for field_name, column in columns.items():
+		if not remaining:
+			break
+		domain_field = domain_fields.get(field_name)
+		if domain_field is None:
+			for i in remaining:
+				errors[i] = DomainModelConstructionException((
+					"Illegal field %s passed to object %s,"
+					" legal fields are %s") % (field_name,
+					model_cls.__name__, ",".join(schema.field_names)))
+			remaining = []
+			break
+
+		if not domain_field.nullable:
+			failed = [i for i in remaining if column[i] is None]
+			for i in failed:
+				errors[i] = TypeError(
+					"Illegal value for field %s, should be %s, got %s" \
+					% (field_name, domain_field.dtype, type(None)))
+			if failed:
+				remaining = [i for i in remaining if i not in errors]
+
+		choices = schema.choices.get(field_name)
+		if choices is not None:
+			failed = [i for i in remaining if not _is_choice(column[i], choices)]
+			for i in failed:
+				errors[i] = DomainModelConstructionException(
+					"Illegal value for field %s, legal values are %s" %
+					(field_name, domain_field.choices))
+			if failed:
+				remaining = [i for i in remaining if i not in errors]
+
+	# Every field as __init__ leaves it, for required and model rules
+	initial_values = dict(model_cls._initial_values)
+	full_columns = {field_name: columns.get(field_name) or [initial_values[field_name]] * row_count
+		for field_name in schema.field_names}
+
+	for field_name in schema.required:
+		if not remaining:
+			break
+		column = full_columns[field_name]
+		failed = [i for i in remaining if not column[i]]
+		for i in failed:
+			errors[i] = ValueError("Required field %s not found" % field_name)
+		if failed:
+			remaining = [i for i in remaining if i not in errors]
+
+	if remaining:
+		errors.update(model_cls._validate_columns(full_columns, remaining))
+
+	return ColumnValidation([i not in errors for i in range(row_count)],
+		dict(sorted(errors.items())))
+
+
+def _is_choice(value, choices: frozenset) -> bool:
+	try:
+		return value in choices
+	except TypeError:
+		# Unhashable values can never be one of the choices.
+		return False
@@ -0,0 +1,33 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Hashable, NamedTuple
+
+
+class ResponseCacheInterface(ABC):
+	"""
+	Caches computed values (eg. service responses) by key.
+	"""
+
+	@abstractmethod
+	def get_or_compute(self, key: Hashable, compute: Callable):
+		"""
+		Returns the value cached for key, calling compute() to get and
+		cache it when there is none.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def clear(self):
+		raise NotImplementedError
+
+
+class EventLogInterface(ABC):
+	"""
+	Append only log of domain events.
+	"""
+
+	@abstractmethod
+	def append(self, event: NamedTuple) -> int:
+		"""
+		Appends event, returning its sequence number.
+		"""
+		raise NotImplementedError
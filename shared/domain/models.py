@@ -1,12 +1,37 @@
-from abc import ABC
+import datetime
+import functools
+import json
+from abc import ABCMeta, ABC
 from dataclasses import dataclass
-from typing import List, Tuple
+from operator import attrgetter
+from types import MappingProxyType, MemberDescriptorType
+from typing import Callable, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Tuple
+
+try:
+	import orjson
+except ImportError:  # pragma: no cover - optional faster backend
+	orjson = None
 
 
 class DomainModelConstructionException(Exception):
 	pass
 
 
+class DomainModelNotFoundException(Exception):
+	pass
+
+
+class BulkResult(NamedTuple):
+	"""
+	Outcome of a bulk operation, which does not stop at the first bad item.
+
+	objects: the items that went through, in input order
+	errors: input index -> exception, for the items that did not
+	"""
+	objects: list
+	errors: Dict[int, Exception]
+
+
 class DomainField:
 	"""
 	Defines attributes on a domain field
@@ -20,18 +45,265 @@ class DomainField:
 	choices: List[Tuple], default to empty list
 		If no value is provided, then we do not check against choices.
 		If a list of choices is provided
+	secret: bool, default to False
+		Whether the field (eg. a password) is left out of json unless
+		asked for by name, see to_json
 	"""
 	def __init__(self, dtype: type, required: bool = False,
-		choices: List[Tuple] = [], nullable: bool = False, default=None):
+		choices: List[Tuple] = [], nullable: bool = False, default=None, secret: bool = False):
 		self.dtype = dtype
 		self.required = required
 		self.choices = choices
 		self.default = default
 		self.nullable = nullable
+		self.secret = secret
+
+
+@dataclass(frozen=True)
+class DomainSchema:
+	"""
+	Compiled, read-only description of the DomainFields on a model class.
+
+	Built once per class by DomainModelMeta so that construction and
+	validation look fields up in precomputed tables instead of walking
+	dir() on every instance.
+
+	Attributes
+	----------
+	field_names: Tuple[str]
+		Field names in definition order, base class fields first.
+	domain_fields: Mapping[str, DomainField]
+		field name -> DomainField
+	required: Tuple[str]
+		Names of required fields, in definition order.
+	nullable: FrozenSet[str]
+		Names of fields that accept None.
+	secret: FrozenSet[str]
+		Names of fields left out of json unless asked for.
+	defaults: Mapping[str, object]
+		field name -> default, only for fields with a truthy default
+		(falsey defaults have always initialised to None).
+	choices: Mapping[str, FrozenSet]
+		field name -> set of legal values, only for fields with choices.
+	"""
+	field_names: Tuple[str, ...]
+	domain_fields: Mapping[str, DomainField]
+	required: Tuple[str, ...]
+	nullable: FrozenSet[str]
+	secret: FrozenSet[str]
+	defaults: Mapping[str, object]
+	choices: Mapping[str, FrozenSet]
+
+	@classmethod
+	def compile(cls, domain_fields: dict) -> 'DomainSchema':
+		return cls(
+			field_names=tuple(domain_fields),
+			domain_fields=MappingProxyType(dict(domain_fields)),
+			required=tuple(name for name, df in domain_fields.items() if df.required),
+			nullable=frozenset(name for name, df in domain_fields.items() if df.nullable),
+			secret=frozenset(name for name, df in domain_fields.items() if df.secret),
+			defaults=MappingProxyType({name: df.default
+				for name, df in domain_fields.items() if df.default}),
+			choices=MappingProxyType({name: frozenset(choice for choice, _ in df.choices)
+				for name, df in domain_fields.items() if df.choices}),
+		)
+
+	@property
+	def initial_values(self) -> Tuple[Tuple[str, object], ...]:
+		"""
+		(field_name, value) pairs every new instance starts from.
+		"""
+		defaults = self.defaults
+		return tuple((name, defaults.get(name)) for name in self.field_names)
+
+
+class DomainModelMeta(ABCMeta):
+	"""
+	Compiles the DomainFields declared on a model (and its bases) into
+	a DomainSchema available as `Model.schema`.
+
+	The DomainField for each field is also exposed on the class as
+	`Model._<field_name>`, which is where instances used to copy it to.
+
+	Passing `compact=True` in the class statement, eg.
+
+		class View(BaseDomainModel, compact=True):
+			...
+
+	stores field values in generated __slots__ rather than a per-instance
+	__dict__. Field metadata then lives only on the class (in the schema),
+	and instances cannot be given attributes that are not DomainFields.
+	"""
+	def __new__(mcls, name, bases, namespace, compact: bool = False, **kwargs):
+		domain_fields = {}
+		for base in reversed(bases):
+			for klass in reversed(base.__mro__):
+				schema = klass.__dict__.get('schema')
+				if isinstance(schema, DomainSchema):
+					domain_fields.update(schema.domain_fields)
+		inherited_field_names = set(domain_fields)
+
+		own_field_names = []
+		for attr_name, value in namespace.items():
+			if isinstance(value, DomainField):
+				domain_fields[attr_name] = value
+				own_field_names.append(attr_name)
 
+		if compact:
+			namespace = dict(namespace)
+			slots = []
+			for field_name in own_field_names:
+				# The slot descriptor replaces the DomainField class attribute
+				del namespace[field_name]
+				if field_name not in inherited_field_names:
+					slots.append(field_name)
+			if not any(base.__weakrefoffset__ for base in bases):
+				slots.append('__weakref__')
+			namespace['__slots__'] = tuple(slots)
 
+		cls = super().__new__(mcls, name, bases, namespace, **kwargs)
+		cls.compact = compact
+		cls.schema = DomainSchema.compile(domain_fields)
+		# Precomputed once, it is read on every construction.
+		cls._initial_values = cls.schema.initial_values
+		# Whether all field values live in the instance __dict__, which
+		# lets hydrate() fill them in with a single dict assignment.
+		cls._values_in_dict = not any(
+			isinstance(getattr(cls, field_name, None), MemberDescriptorType)
+			for field_name in domain_fields)
+		for field_name, domain_field in domain_fields.items():
+			setattr(cls, "_" + field_name, domain_field)
+		return cls
 
-class BaseDomainModel(ABC):
+
+#####################
+# JSON serialization
+
+# How nested domain models are serialized by to_json
+NESTED_EMBED = 'embed'  # as a full json object
+NESTED_PK = 'pk'  # as a reference, the nested model's pk
+
+
+def _json_default(value):
+	if isinstance(value, (datetime.datetime, datetime.date)):
+		return value.isoformat()
+	raise TypeError("Object of type %s is not JSON serializable" % type(value).__name__)
+
+
+if orjson is not None:
+	def json_dumps(value) -> str:
+		# orjson encodes datetimes natively (RFC 3339, same as isoformat)
+		return orjson.dumps(value).decode()
+
+	json_loads = orjson.loads
+else:
+	def json_dumps(value) -> str:
+		return json.dumps(value, default=_json_default, separators=(',', ':'))
+
+	json_loads = json.loads
+
+
+def _same_value(a, b) -> bool:
+	"""
+	Equality for change tracking: nested domain models are the same when
+	their pks are (see BaseDomainModel.__eq__), None never equals a model.
+	Models are compared by schema, which references share with their
+	model class (see shared.domain.references).
+	"""
+	if a is b:
+		return True
+	if isinstance(a, BaseDomainModel) or isinstance(b, BaseDomainModel):
+		return isinstance(a, BaseDomainModel) and isinstance(b, BaseDomainModel) \
+			and a.schema is b.schema and a.pk == b.pk
+	return a == b
+
+
+def _is_domain_model(dtype) -> bool:
+	return isinstance(dtype, type) and isinstance(dtype.__dict__.get('schema'), DomainSchema)
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoder(model_cls, fields: Tuple[str, ...] = (), nested: str = NESTED_EMBED) -> Callable:
+	"""
+	Returns a function converting an instance of model_cls to a json-ready
+	dict. Encoders are compiled once per (model_cls, fields, nested).
+
+	Parameters
+	----------
+	model_cls: type
+		The BaseDomainModel subclass to encode
+	fields: Tuple[str], optional
+		If included, encode only these fields, otherwise all schema fields
+		but the secret ones
+	nested: str, default to NESTED_EMBED
+		NESTED_EMBED to embed nested domain models as objects,
+		NESTED_PK to replace them by their pk
+	"""
+	if nested not in (NESTED_EMBED, NESTED_PK):
+		raise ValueError("nested must be %r or %r, got %r" % (NESTED_EMBED, NESTED_PK, nested))
+
+	schema = model_cls.schema
+	field_names = tuple(fields) or tuple(
+		field_name for field_name in schema.field_names if field_name not in schema.secret)
+	nested_encoders = {}
+	for field_name in field_names:
+		dtype = model_cls._get_domain_field(field_name).dtype
+		if _is_domain_model(dtype):
+			nested_encoders[field_name] = (get_encoder(dtype, (), nested)
+				if nested == NESTED_EMBED else attrgetter('pk'))
+
+	if len(field_names) == 1:
+		field_name = field_names[0]
+		getter = attrgetter(field_name)
+		values = lambda obj: (getter(obj),)
+	else:
+		values = attrgetter(*field_names)
+
+	if not nested_encoders:
+		def encode(obj, memo: dict = None) -> dict:
+			return dict(zip(field_names, values(obj)))
+	elif nested == NESTED_PK:
+		nested_items = tuple(nested_encoders.items())
+
+		def encode(obj, memo: dict = None) -> dict:
+			data = dict(zip(field_names, values(obj)))
+			for field_name, get_pk in nested_items:
+				value = data[field_name]
+				if value is not None:
+					data[field_name] = get_pk(value)
+			return data
+	else:
+		nested_items = tuple(nested_encoders.items())
+
+		def encode(obj, memo: dict = None) -> dict:
+			"""
+			memo maps id(nested object) -> encoded dict, so that a nested
+			object shared by many models (eg. one author across a page of
+			posts) is encoded only once per bulk call.
+			"""
+			data = dict(zip(field_names, values(obj)))
+			for field_name, nested_encoder in nested_items:
+				value = data[field_name]
+				if value is None:
+					continue
+				if memo is None:
+					data[field_name] = nested_encoder(value)
+					continue
+				encoded = memo.get(id(value))
+				if encoded is None:
+					encoded = memo[id(value)] = nested_encoder(value, memo)
+				data[field_name] = encoded
+			return data
+
+	return encode
+
+
+class BaseDomainModel(ABC, metaclass=DomainModelMeta):
+
+	# Only the change tracking slot (see changed_fields), so compact
+	# subclasses get no per-instance __dict__. Regular subclasses still
+	# get one as normal.
+	__slots__ = ('_changes',)
 
 	# {field: (datatype, required), ...} mapping should be
 	# be defined for all domain models
@@ -43,58 +315,195 @@ class BaseDomainModel(ABC):
 		and load into attributes, checking type and enforcing
 		required nature of field.
 		"""
+		schema = self.schema
+		# Construction is not a change, see changed_fields
+		set_value = object.__setattr__
 
-		# Get domain field names
-		domain_field_names = [field_name for field_name in dir(self)
-			if not field_name == '_domain_field_names' and
-			isinstance(getattr(self, field_name), DomainField)]
-
-		# domain_field_names to private variables for later access
-		for field_name in domain_field_names:
-			setattr(self, "_" + field_name, getattr(self, field_name))
-			setattr(self, field_name, None)
-
-		# Set defaults
-		for field_name in domain_field_names:
-			default = getattr(self, "_" + field_name).default
-			if default:
-				setattr(self, field_name, default)
+		# Start every field from its default (or None)
+		for field_name, value in self._initial_values:
+			set_value(self, field_name, value)
 
 		# Enforce type constraints, choices and set values
+		domain_fields = schema.domain_fields
 		for k, v in kwargs.items():
-			if k not in domain_field_names:
+			domain_field = domain_fields.get(k)
+			if domain_field is None:
 				raise DomainModelConstructionException((
 					"Illegal field %s passed to object %s,"
 					" legal fields are %s") % (k,
-					self.__class__.__name__, ",".join(domain_field_names)))
+					self.__class__.__name__, ",".join(schema.field_names)))
 
-			domain_field = getattr(self, "_" + k)
-			is_nullable = domain_field.nullable
-			dtype = domain_field.dtype
-			if (not is_nullable and v is None) \
-					and not isinstance(v, dtype):
+			if (not domain_field.nullable and v is None) \
+					and not isinstance(v, domain_field.dtype):
 				raise TypeError(
 					"Illegal value for field %s, should be %s, got %s" \
-					% (k, dtype, type(v)))
+					% (k, domain_field.dtype, type(v)))
 
-			self.validate_choices(k, v)
+			if k in schema.choices:
+				self.validate_choices(k, v)
 
-			setattr(self, k, v)
+			set_value(self, k, v)
 
 		# Enforce required constraints
-		# Note, the string slice on df[1:] is to cut off the leading underscore
-		required_fields = [df[1:] for df in self._domain_field_names
-			if getattr(self, df).required]
-
-		for field in required_fields:
+		for field in schema.required:
 			if not getattr(self, field):
 				raise ValueError("Required field %s not found" % field)
 
-	def __dict__(self):
+	@classmethod
+	def hydrate(cls, row):
+		"""
+		Builds a domain object from trusted, already validated data, eg. a
+		row read back from storage. Skips __init__ entirely, so none of the
+		type, choices, required or model specific creation rules run.
+		Writes (Post.update, creating new objects) must keep going through
+		the validating paths.
+
+		Parameters
+		----------
+		row: tuple or dict
+			Either one value per field in cls.schema.field_names order, or
+			a field_name -> value dict where missing fields take their
+			default. Nested domain models must already be built.
+		"""
+		return cls.hydrate_many((row,))[0]
+
+	@classmethod
+	def hydrate_many(cls, rows: Iterable) -> list:
+		"""
+		Builds a list of domain objects from trusted rows, see hydrate.
+		"""
+		field_names = cls.schema.field_names
+		field_count = len(field_names)
+		initial_values = dict(cls._initial_values)
+		new = cls.__new__
+		set_value = object.__setattr__
+		values_in_dict = cls._values_in_dict
+		models = []
+		for row in rows:
+			if isinstance(row, dict):
+				if not row.keys() <= initial_values.keys():
+					raise DomainModelConstructionException(
+						"Illegal fields %s passed to object %s, legal fields are %s" %
+						(",".join(sorted(row.keys() - initial_values.keys())),
+						cls.__name__, ",".join(field_names)))
+				values = initial_values.copy()
+				values.update(row)
+			elif len(row) != field_count:
+				raise DomainModelConstructionException(
+					"Expected %d values to hydrate %s (%s), got %d" %
+					(field_count, cls.__name__, ",".join(field_names), len(row)))
+			else:
+				values = dict(zip(field_names, row))
+
+			model = new(cls)
+			if values_in_dict:
+				model.__dict__ = values
+			else:
+				for field_name, value in values.items():
+					set_value(model, field_name, value)
+			models.append(model)
+		return models
+
+	@classmethod
+	def bulk_create(cls, rows: Iterable[dict], **shared) -> BulkResult:
+		"""
+		Builds many new objects through __init__, so every creation rule
+		still applies, collecting per-row errors instead of stopping at
+		the first one.
+
+		Parameters
+		----------
+		rows: Iterable[dict]
+			field_name -> value for each object
+		**shared: field_name=value
+			Values for every row (eg. author=user), checked once up front.
+			Raises straight away if they can't be valid for any row.
+		"""
+		for field_name, value in shared.items():
+			cls._get_domain_field(field_name)
+			if value is not None:
+				cls.validate_choices(field_name, value)
+
+		objects, errors = [], {}
+		for index, row in enumerate(rows):
+			try:
+				objects.append(cls(**shared, **row) if shared else cls(**row))
+			except (ValueError, TypeError, DomainModelConstructionException) as error:
+				errors[index] = error
+		return BulkResult(objects, errors)
+
+	@classmethod
+	def _validate_columns(cls, columns: Dict[str, list], rows: List[int]) -> Dict[int, Exception]:
+		"""
+		Column form of the creation rules a subclass adds in __init__, for
+		shared.domain.columnar.validate_columns. Returns row index -> the
+		exception __init__ would raise, for the rows that would fail.
+
+		Parameters
+		----------
+		columns: Dict[str, list]
+			Every field, with defaults filled in, one value per row
+		rows: List[int]
+			Indexes of the rows that passed every field level check
+		"""
+		return {}
+
+	def __setattr__(self, name: str, value):
+		if name in self.schema.domain_fields:
+			self._track_change(name, value)
+		object.__setattr__(self, name, value)
+
+	def _track_change(self, field_name: str, value):
+		try:
+			current = getattr(self, field_name)
+		except AttributeError:
+			# Unset slot, the object is still being built
+			return
+		changes = getattr(self, '_changes', None) or {}
+		if field_name in changes:
+			if not _same_value(changes[field_name], value):
+				return
+			# Back to its original value
+			changes = dict(changes)
+			del changes[field_name]
+		elif _same_value(current, value):
+			return
+		else:
+			# Copied rather than updated in place, so copies of a model
+			# never share their changes
+			changes = dict(changes)
+			changes[field_name] = current
+		object.__setattr__(self, '_changes', changes or None)
+
+	def changed_fields(self) -> List[str]:
+		"""
+		Names of the fields assigned a different value since the object
+		was built, hydrated or last marked clean (eg. by a repository
+		once it stored the changes). Assigning a field its current value
+		is not a change, nor is changing it and then changing it back.
+		"""
+		return list(getattr(self, '_changes', None) or ())
+
+	def diff(self) -> Dict[str, Tuple[object, object]]:
+		"""
+		{field_name: (original value, current value)} for changed_fields.
+		"""
+		return {field_name: (original, getattr(self, field_name))
+			for field_name, original in (getattr(self, '_changes', None) or {}).items()}
+
+	def mark_clean(self):
+		"""
+		Forgets the changes, once they are stored.
 		"""
-		Returns DomainField attributes as key, value dictionary.
+		object.__setattr__(self, '_changes', None)
+
+	def __iter__(self):
+		"""
+		Yields (field name, value) pairs, so dict(model) returns DomainField
+		attributes as a key, value dictionary.
 		"""
-		raise NotImplementedError
+		for field_name in self.schema.field_names:
+			yield field_name, getattr(self, field_name)
 
 	def __eq__(self, other):
 		"""
@@ -107,19 +516,34 @@ class BaseDomainModel(ABC):
 		"""
 		Returns all DomainFields as a list.
 		"""
-		return [field_name for field_name in dir(self)
-			if field_name.startswith("_")
-			and field_name != '_domain_field_names'
-			and isinstance(getattr(self, field_name), DomainField)]
+		return ["_" + field_name for field_name in self.schema.field_names]
+
+	@classmethod
+	def _get_domain_field(cls, field_name: str) -> DomainField:
+		domain_field = cls.schema.domain_fields.get(field_name)
+		if domain_field is None:
+			raise DomainModelConstructionException(
+				"Illegal field %s for object %s, legal fields are %s" %
+				(field_name, cls.__name__, ",".join(cls.schema.field_names)))
+		return domain_field
 
-	def validate_choices(self, field_name: str, value):
-		domain_field = getattr(self, "_" + field_name)
-		if domain_field.choices and value not in [choice for choice, _ in domain_field.choices]:
+	@classmethod
+	def validate_choices(cls, field_name: str, value):
+		choices = cls.schema.choices.get(field_name)
+		if choices is None:
+			return
+		try:
+			is_legal = value in choices
+		except TypeError:
+			# Unhashable values can never be one of the choices.
+			is_legal = False
+		if not is_legal:
 			raise DomainModelConstructionException(
 				"Illegal value for field %s, legal values are %s" %
-				(field_name, domain_field.choices))
+				(field_name, cls._get_domain_field(field_name).choices))
 
-	def validate_values(self, **kwargs):
+	@classmethod
+	def validate_values(cls, **kwargs):
 		"""
 		Enforce update rules.
 
@@ -129,12 +553,21 @@ class BaseDomainModel(ABC):
 			field_name is the name of the field to update, value is the new value.
 		"""
 		for field, value in kwargs.items():
-			dtype = getattr(self, "_" + field).dtype
+			domain_field = cls._get_domain_field(field)
+			if value is None and domain_field.nullable:
+				continue
+			dtype = domain_field.dtype
 			if dtype and not isinstance(value, dtype):
 				raise ValueError("Illegal type %s for field %s, must be %s" %
 					(type(value), field, dtype))
 
-	def to_json(self, fields: list = []) -> str:
+	def to_dict(self, fields: list = [], nested: str = NESTED_EMBED) -> dict:
+		"""
+		Converts the domain model to a json-ready dict, see to_json.
+		"""
+		return get_encoder(self.__class__, tuple(fields), nested)(self)
+
+	def to_json(self, fields: list = [], nested: str = NESTED_EMBED) -> str:
 		"""
 		Converts the domain model to json.
 
@@ -143,9 +576,54 @@ class BaseDomainModel(ABC):
 		fields: list[str], optional
 			If included, return only the requested fields
 			otherwise, return all self._domain_field_names
-			on the domain model
+			on the domain model but the secret ones (eg. User.password),
+			which are only written when requested
+		nested: str, default to NESTED_EMBED
+			NESTED_EMBED embeds nested domain models (eg. Post.author)
+			as json objects, without their secret fields, NESTED_PK
+			replaces them with their pk.
+		"""
+		return json_dumps(get_encoder(self.__class__, tuple(fields), nested)(self))
+
+	@classmethod
+	def to_json_many(cls, models: Iterable['BaseDomainModel'],
+		fields: list = [], nested: str = NESTED_EMBED) -> str:
 		"""
-		raise NotImplementedError
+		Converts a list of domain models to a json array in one pass,
+		sharing one encoder across all of them. See to_json.
+		"""
+		encode = get_encoder(cls, tuple(fields), nested)
+		memo = {}
+		return json_dumps([encode(model, memo) for model in models])
+
+	@classmethod
+	def from_dict(cls, data: dict):
+		"""
+		Builds a domain object from a dict produced by to_dict, going
+		through __init__ so that all creation rules are validated.
+
+		Nested domain models must be embedded, pk references cannot be
+		resolved here. Datetime fields are parsed from isoformat strings and
+		nulls on non nullable fields are treated as unset.
+		"""
+		kwargs = {}
+		for field_name, value in data.items():
+			domain_field = cls._get_domain_field(field_name)
+			dtype = domain_field.dtype
+			if value is None:
+				# to_json writes unset fields (eg. pk before saving) as null
+				if not domain_field.nullable:
+					continue
+			elif _is_domain_model(dtype):
+				if not isinstance(value, dict):
+					raise DomainModelConstructionException(
+						"Field %s on %s must be an embedded object, got %r" %
+						(field_name, cls.__name__, value))
+				value = dtype.from_dict(value)
+			elif dtype is datetime.datetime and isinstance(value, str):
+				value = datetime.datetime.fromisoformat(value)
+			kwargs[field_name] = value
+		return cls(**kwargs)
 
 	@classmethod
 	def from_json(cls, json_string: str):
@@ -159,5 +637,8 @@ class BaseDomainModel(ABC):
 			if required fields defined in cls._domain_field_names are not included,
 			this should raise a DomainModelConstruction exception
 		"""
-		raise NotImplementedError
-
+		data = json_loads(json_string)
+		if not isinstance(data, dict):
+			raise DomainModelConstructionException(
+				"Expected a json object to build %s, got %s" % (cls.__name__, type(data).__name__))
+		return cls.from_dict(data)
@@ -0,0 +1,179 @@
+"""
+Lazy references to nested domain models.
+
+A reference stands in for a nested domain model (eg. Comment.post) of
+which only the pk is known. It is an instance of a generated subclass of
+the model class, so it passes DomainField type checks, and reading its
+pk (eg. to_json with NESTED_PK) costs nothing. Reading or assigning any
+other field loads the model, and the reference then turns into a plain
+instance of the model class holding the loaded values (its __class__ is
+swapped), so it costs nothing from then on.
+
+References are handed out by a ReferenceBatch, which loads all of its
+pending references with one call to its loader when the first of them is
+used, eg.
+
+	batch = ReferenceBatch(Post, post_repository.get_many)
+	comments = [Comment.hydrate((pk, batch.get(post_pk), ...)) for ...]
+	comments[0].post.title  # loads every post referenced by the comments
+
+A loaded reference is a copy of the model the loader returned, not the
+same instance. To keep one instance per pk (eg. in an identity map),
+register the reference itself where the instances are kept and have the
+loader fill it in place with load_reference.
+"""
+import functools
+from typing import Callable, Iterable, List
+
+from shared.domain.models import BaseDomainModel, DomainModelNotFoundException
+
+# pks -> the models with these pks that exist, in any order
+LoadMany = Callable[[List[int]], Iterable[BaseDomainModel]]
+
+
+class _LazyField:
+	"""
+	Shadows a field on a reference class, loading the reference on use.
+	"""
+	__slots__ = ('name',)
+
+	def __init__(self, name: str):
+		self.name = name
+
+	def __get__(self, reference, owner=None):
+		if reference is None:
+			return self
+		reference._load()
+		return getattr(reference, self.name)
+
+	def __set__(self, reference, value):
+		reference._load()
+		setattr(reference, self.name, value)
+
+
+class _Reference:
+	"""
+	Behaviour shared by all reference classes, see reference_class.
+
+	An unloaded reference keeps its ReferenceBatch in the change tracking
+	slot: it has no changes until it is loaded.
+	"""
+	__slots__ = ()
+
+	def _load(self):
+		object.__getattribute__(self, '_changes').load(self)
+
+	def __setattr__(self, name: str, value):
+		self._load()
+		setattr(self, name, value)
+
+	def changed_fields(self) -> List[str]:
+		return []
+
+	def diff(self) -> dict:
+		return {}
+
+	def mark_clean(self):
+		pass
+
+
+@functools.lru_cache(maxsize=None)
+def reference_class(model_cls: type) -> type:
+	"""
+	The reference class for model_cls, a subclass with the same schema
+	and instance layout (so a loaded reference can become a model_cls).
+	"""
+	namespace = {field_name: _LazyField(field_name)
+		for field_name in model_cls.schema.field_names if field_name != 'pk'}
+	namespace['__slots__'] = ()
+	namespace['__module__'] = model_cls.__module__
+	cls = type(model_cls)(model_cls.__name__ + 'Reference', (_Reference, model_cls), namespace)
+	cls.schema = model_cls.schema
+	cls.compact = model_cls.compact
+	return cls
+
+
+def load_reference(reference: BaseDomainModel, model: BaseDomainModel):
+	"""
+	Turns a pending reference into a plain instance of its model class
+	holding model's field values.
+	"""
+	set_value = object.__setattr__
+	model_cls = type(model)
+	set_value(reference, '__class__', model_cls)
+	for field_name in model_cls.schema.field_names:
+		set_value(reference, field_name, getattr(model, field_name))
+	set_value(reference, '_changes', None)
+
+
+def is_reference(value) -> bool:
+	"""
+	Whether value is a reference that has not been loaded yet.
+	"""
+	return isinstance(value, _Reference)
+
+
+class ReferenceBatch:
+	"""
+	Hands out references to model_cls objects and loads the pending ones
+	together.
+
+	Parameters
+	----------
+	model_cls: type
+		The BaseDomainModel subclass referenced
+	load_many: Callable[[List[int]], Iterable[BaseDomainModel]]
+		Loads the models for a list of pks, eg. a repository's get_many.
+		Missing pks are left out of the result.
+	"""
+	def __init__(self, model_cls: type, load_many: LoadMany):
+		self.model_cls = model_cls
+		self._load_many = load_many
+		self._reference_cls = reference_class(model_cls)
+		# pk -> unloaded reference
+		self._pending = {}
+
+	def __len__(self):
+		"""
+		Number of references not loaded yet.
+		"""
+		return len(self._pending)
+
+	def get(self, pk: int) -> BaseDomainModel:
+		"""
+		The reference to the model_cls object with pk, one per pk.
+		"""
+		reference = self._pending.get(pk)
+		if reference is None:
+			reference = self._pending[pk] = self._reference_cls.__new__(self._reference_cls)
+			object.__setattr__(reference, 'pk', pk)
+			object.__setattr__(reference, '_changes', self)
+		return reference
+
+	def load(self, reference: BaseDomainModel = None):
+		"""
+		Loads every pending reference with one call to load_many.
+
+		Parameters
+		----------
+		reference: BaseDomainModel, optional
+			The reference being used, raises DomainModelNotFoundException
+			if its model does not exist (references to other missing
+			models raise once they are used).
+		"""
+		pending, self._pending = self._pending, {}
+		if reference is not None and is_reference(reference):
+			pending[reference.pk] = reference
+		if not pending:
+			return
+
+		loaded = {model.pk: model for model in self._load_many(list(pending))}
+		for pk, pending_reference in pending.items():
+			model = loaded.get(pk)
+			# The loader may have filled the reference in place already
+			if model is not None and model is not pending_reference:
+				load_reference(pending_reference, model)
+
+		if reference is not None and is_reference(reference):
+			raise DomainModelNotFoundException(
+				"%s with pk %s does not exist." % (self.model_cls.__name__, reference.pk))
@@ -0,0 +1,40 @@
+from abc import ABC, abstractmethod
+
+from shared.domain.models import BaseDomainModel
+
+
+class RepositoryInterface(ABC):
+	"""
+	Persistence for one domain model. Saving happens here rather than
+	on the domain model.
+	"""
+
+	@abstractmethod
+	def add(self, model: BaseDomainModel) -> BaseDomainModel:
+		"""
+		Stores a new domain object, assigning its pk.
+		"""
+		raise NotImplementedError
+
+	@abstractmethod
+	def get(self, pk: int) -> BaseDomainModel:
+		"""
+		Returns the domain object with this pk, raising
+		DomainModelNotFoundException if there is none.
+		"""
+		raise NotImplementedError
+
+
+class AsyncRepositoryInterface(ABC):
+	"""
+	RepositoryInterface for asyncio code: every call is a coroutine, so
+	independent round trips can run concurrently.
+	"""
+
+	@abstractmethod
+	async def add(self, model: BaseDomainModel) -> BaseDomainModel:
+		raise NotImplementedError
+
+	@abstractmethod
+	async def get(self, pk: int) -> BaseDomainModel:
+		raise NotImplementedError
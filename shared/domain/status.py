@@ -0,0 +1,175 @@
+"""
+Declarative status state machines for domain models.
+"""
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# from_status matching every status
+ANY = '*'
+
+
+class StatusTransition(NamedTuple):
+	"""
+	One row of a transition table.
+
+	from_status: status moved from, ANY for every status or None for
+		the status a new object is created in
+	to_status: status moved to
+	action: name of the transition, eg. 'publish', used in messages and
+		for listing what a user can do
+	role: User flag the acting user needs set (eg. 'is_moderator'),
+		None if anyone can make the transition
+	effects: callables run with the object when the transition is applied
+	"""
+	from_status: Optional[str]
+	to_status: str
+	action: str
+	role: Optional[str] = None
+	effects: Tuple[Callable, ...] = ()
+
+
+class StatusMachine:
+	"""
+	Compiles a transition table into a dict keyed by (from status, to
+	status), so checking a transition is one lookup whatever the size
+	of the table. Pairs not in the table are not allowed.
+
+	Parameters
+	----------
+	statuses: List[Tuple[str, str]]
+		(status, label) pairs, as in a DomainField's choices
+	transitions: Iterable[StatusTransition]
+		The table, later rows override earlier ones for the same pair
+	name: str, default to 'object'
+		What is being moved between statuses, for messages
+	"""
+	def __init__(self, statuses: List[Tuple[str, str]],
+		transitions: Iterable[StatusTransition], name: str = 'object'):
+		self.labels = dict(statuses)
+		self.name = name
+		self._transitions = {}
+		for transition in transitions:
+			from_statuses = (self.labels if transition.from_status == ANY
+				else (transition.from_status,))
+			for from_status in from_statuses:
+				self._transitions[(from_status, transition.to_status)] = transition
+
+		# from status -> transitions out of it
+		self._outgoing = {}
+		# to status -> sorted statuses it can be reached from
+		self._incoming = {}
+		for (from_status, to_status), transition in self._transitions.items():
+			self._outgoing.setdefault(from_status, []).append(transition)
+			if from_status is not None:
+				self._incoming.setdefault(to_status, []).append(from_status)
+		for from_statuses in self._incoming.values():
+			from_statuses.sort(key=list(self.labels).index)
+		# to status -> roles of the transitions into it, None meaning open to all
+		self._roles_into = {}
+		for (from_status, to_status), transition in self._transitions.items():
+			if from_status is not None:
+				self._roles_into.setdefault(to_status, set()).add(transition.role)
+		self.roles = frozenset(transition.role for transition in self._transitions.values()
+			if transition.role is not None)
+
+	def get(self, from_status: Optional[str], to_status: str) -> Optional[StatusTransition]:
+		"""
+		The transition from from_status (None for a new object) to
+		to_status, or None if it is not allowed.
+		"""
+		return self._transitions.get((from_status, to_status))
+
+	def check_role(self, user, to_status: str):
+		"""
+		Raises ValueError if user can't reach to_status from any status,
+		a check that does not depend on any one object.
+		"""
+		roles = self._roles_into.get(to_status, ())
+		if roles and None not in roles and not any(getattr(user, role) for role in roles):
+			transition = next(transition for (from_status, status), transition
+				in self._transitions.items() if status == to_status and from_status is not None)
+			raise ValueError("Only a User who %s can %s a %s." % (
+				" or ".join(sorted(roles)), transition.action, self.name))
+
+	def check(self, from_status: str, to_status: str, user) -> StatusTransition:
+		"""
+		Returns the transition from from_status to to_status, raising
+		ValueError if there is none or user lacks its role.
+		"""
+		transition = self._transitions.get((from_status, to_status))
+		if transition is None:
+			from_statuses = self._incoming.get(to_status)
+			if not from_statuses:
+				raise ValueError("A %s can't be moved to %s status." % (
+					self.name, self.labels.get(to_status, to_status).lower()))
+			raise ValueError("A %s can only be %s from %s status." % (
+				self.name, self.labels[to_status].lower(),
+				" or ".join(self.labels[status].lower() for status in from_statuses)))
+		if transition.role is not None and not getattr(user, transition.role):
+			raise ValueError("Only a User who %s can %s a %s." % (
+				transition.role, transition.action, self.name))
+		return transition
+
+	def can_transition(self, from_statuses: Sequence[str], users, to_status: str) -> List[bool]:
+		"""
+		Whether each object can be moved to to_status, without raising.
+
+		Parameters
+		----------
+		from_statuses: Sequence[str]
+			Current status of each object
+		users: User or Sequence[User]
+			The acting user, or one per object
+		to_status: str
+		"""
+		users = self._per_row(users, len(from_statuses))
+		user_roles = {}
+		allowed = []
+		for from_status, user in zip(from_statuses, users):
+			transition = self._transitions.get((from_status, to_status))
+			if transition is None:
+				allowed.append(False)
+			elif transition.role is None:
+				allowed.append(True)
+			else:
+				allowed.append(transition.role in self._roles_of(user, user_roles))
+		return allowed
+
+	def allowed(self, from_statuses: Sequence[str], users) -> List[FrozenSet[str]]:
+		"""
+		The statuses each object can be moved to by its user, eg. to show
+		the actions available on every post of a moderation dashboard.
+		See can_transition for the parameters.
+		"""
+		users = self._per_row(users, len(from_statuses))
+		user_roles = {}
+		# (from status, roles) -> allowed to statuses, shared across rows
+		memo = {}
+		allowed = []
+		for from_status, user in zip(from_statuses, users):
+			roles = self._roles_of(user, user_roles)
+			key = (from_status, roles)
+			to_statuses = memo.get(key)
+			if to_statuses is None:
+				to_statuses = memo[key] = frozenset(transition.to_status
+					for transition in self._outgoing.get(from_status, ())
+					if transition.role is None or transition.role in roles)
+			allowed.append(to_statuses)
+		return allowed
+
+	def _roles_of(self, user, user_roles: Dict[int, FrozenSet[str]]) -> FrozenSet[str]:
+		"""
+		The roles user holds, computed once per user per batch.
+		"""
+		roles = user_roles.get(id(user))
+		if roles is None:
+			roles = user_roles[id(user)] = frozenset(
+				role for role in self.roles if getattr(user, role))
+		return roles
+
+	@staticmethod
+	def _per_row(users, count: int) -> Sequence:
+		if isinstance(users, (list, tuple)):
+			if len(users) != count:
+				raise ValueError("Expected %d users, got %d" % (count, len(users)))
+			return users
+		return [users] * count
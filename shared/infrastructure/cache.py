@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from shared.domain.interfaces import ResponseCacheInterface
+
+
+class ResponseCache(ResponseCacheInterface):
+	"""
+	Thread safe LRU cache with a TTL, for computed read responses.
+
+	Keys are expected to carry the version of whatever the value was
+	computed from (eg. ("post", pk, post version)), so writes invalidate
+	entries by bumping versions rather than by deleting keys. Stale
+	entries simply stop being asked for and age out of the LRU.
+
+	get_or_compute protects against stampedes: when many callers miss on
+	the same key at once, one of them computes the value while the others
+	wait for it.
+
+	Parameters
+	----------
+	max_entries: int, default to 10,000
+		Least recently used entries are evicted past this
+	ttl: float, default to 300
+		Seconds an entry stays valid, None for no expiry
+	clock: Callable[[], float], default to time.monotonic
+	"""
+	def __init__(self, max_entries: int = 10000, ttl: float = 300,
+		clock: Callable[[], float] = time.monotonic):
+		self.max_entries = max_entries
+		self.ttl = ttl
+		self._clock = clock
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		# key -> Event set once the computing caller is done
+		self._in_flight = {}
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.expirations = 0
+
+	def __len__(self):
+		return len(self._entries)
+
+	def stats(self) -> dict:
+		return {
+			"entries": len(self._entries),
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+			"expirations": self.expirations,
+		}
+
+	def get_or_compute(self, key: Hashable, compute: Callable):
+		"""
+		Returns the cached value for key, calling compute() to fill it on
+		a miss. Exceptions from compute are raised and nothing is cached.
+		"""
+		while True:
+			with self._lock:
+				found, value = self._get(key)
+				if found:
+					self.hits += 1
+					return value
+				in_flight = self._in_flight.get(key)
+				if in_flight is None:
+					self.misses += 1
+					in_flight = self._in_flight[key] = threading.Event()
+					break
+			# Someone else is computing this key, wait and look again
+			in_flight.wait()
+
+		try:
+			value = compute()
+			with self._lock:
+				self._set(key, value)
+			return value
+		finally:
+			with self._lock:
+				del self._in_flight[key]
+			in_flight.set()
+
+	def invalidate(self, key: Hashable):
+		"""
+		Drops key, for values that can't carry a version in their key.
+		"""
+		with self._lock:
+			self._entries.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+	def _get(self, key: Hashable) -> tuple:
+		entry = self._entries.get(key)
+		if entry is None:
+			return False, None
+		value, expires_at = entry
+		if expires_at is not None and self._clock() >= expires_at:
+			del self._entries[key]
+			self.expirations += 1
+			return False, None
+		self._entries.move_to_end(key)
+		return True, value
+
+	def _set(self, key: Hashable, value):
+		expires_at = self._clock() + self.ttl if self.ttl is not None else None
+		self._entries[key] = (value, expires_at)
+		self._entries.move_to_end(key)
+		while len(self._entries) > self.max_entries:
+			self._entries.popitem(last=False)
+			self.evictions += 1
@@ -0,0 +1,356 @@
+"""
+Append-only, segmented log of domain events.
+
+Events are NamedTuples with a class level KIND (a small int, unique per
+log) and optionally a FORMAT, a struct format for events made only of
+numbers, eg.
+
+	class ViewRecorded(NamedTuple):
+		KIND = 3
+		FORMAT = '<qqd'
+		post_pk: int
+		user_pk: int
+		viewed_at: float
+
+Events without a FORMAT are stored as json arrays.
+
+On disk the log is a directory of segment files, each named after the
+sequence number of its first event and holding frames:
+
+	payload length: u32, crc32: u32, kind: u8, count: u32, payload
+
+A frame holds a run of consecutive events of one kind: count packed
+structs, or one json array of count records. The crc covers kind, count
+and payload, so a frame torn by a crash is detected and cut off when the
+log is opened again.
+
+Appends are buffered and written with one write and one fsync per batch
+(group commit), see EventLog. Replay yields a frame at a time, with the
+records as plain tuples (or lists), so consumers can aggregate runs of
+events with C level helpers (Counter, itemgetter) instead of handling
+them one by one.
+
+Snapshots of state built from the log are json files named after the
+sequence number they were taken at: replaying the events after it on top
+of the snapshot gives the current state.
+"""
+import os
+import struct
+import threading
+import time
+import zlib
+from itertools import chain, groupby
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from shared.domain.interfaces import EventLogInterface
+from shared.domain.models import json_dumps, json_loads
+from shared.infrastructure.files import sync_directory
+
+FRAME_HEADER = struct.Struct('<IIBI')
+# The part of the header covered by the crc: kind and count
+_CHECKED_HEADER = struct.Struct('<BI')
+SEGMENT_SUFFIX = '.log'
+SNAPSHOT_PREFIX = 'snapshot-'
+SNAPSHOT_SUFFIX = '.json'
+
+
+class EventLogCorruptedException(Exception):
+	pass
+
+
+class Frame(NamedTuple):
+	"""
+	A run of events of one type, as yielded by EventLog.replay.
+
+	sequence: the sequence number of the first record
+	event_type: the NamedTuple class of the events
+	records: one tuple (or list, for json events) of field values per event
+	"""
+	sequence: int
+	event_type: type
+	records: list
+
+
+class _Segment(NamedTuple):
+	first_sequence: int
+	path: str
+
+
+def _frame_crc(kind: int, count: int, payload) -> int:
+	return zlib.crc32(payload, zlib.crc32(_CHECKED_HEADER.pack(kind, count)))
+
+
+def _pack_many(codec: struct.Struct, records: list) -> bytes:
+	"""
+	Packs records with one struct.pack call for the whole run.
+	"""
+	event_format = codec.format
+	byte_order = event_format[0] if event_format[0] in '@=<>!' else ''
+	return struct.pack(byte_order + event_format[len(byte_order):] * len(records),
+		*chain.from_iterable(records))
+
+
+def _scan_frames(data) -> Iterator[Tuple[int, int, int, int]]:
+	"""
+	Yields (offset, kind, count, payload end) for every valid frame in
+	data, stopping at the first torn or corrupted one.
+	"""
+	offset, size, header_size = 0, len(data), FRAME_HEADER.size
+	while offset + header_size <= size:
+		length, crc, kind, count = FRAME_HEADER.unpack_from(data, offset)
+		end = offset + header_size + length
+		if end > size or _frame_crc(kind, count, data[offset + header_size:end]) != crc:
+			return
+		yield offset, kind, count, end
+		offset = end
+
+
+class EventLog(EventLogInterface):
+	"""
+	Append-only event log, see the module docstring for the format.
+
+	append() only buffers the event. Buffered events are written and
+	fsynced together once sync_every of them are waiting, when the oldest
+	has waited sync_interval seconds (checked on append), on flush() and
+	on close(). A crash can lose the events appended since the last
+	flush, never corrupt the ones before.
+
+	Usage:
+
+		with EventLog(directory, [PostSaved, CommentAdded, ViewRecorded]) as log:
+			log.append(ViewRecorded(post_pk, user_pk, time.time()))
+
+	Parameters
+	----------
+	directory: str
+		Where segments and snapshots are kept, created if missing
+	event_types: Iterable[type]
+		The NamedTuple event classes stored, each with a distinct KIND
+	segment_size: int, default to 64MB
+		A new segment is started once the current one reaches this size
+	sync_every: int, default to 1000
+	sync_interval: float, default to 0.05
+	"""
+	def __init__(self, directory: str, event_types: Iterable[type],
+		segment_size: int = 64 * 2 ** 20, sync_every: int = 1000, sync_interval: float = 0.05):
+		self.directory = directory
+		self.segment_size = segment_size
+		self.sync_every = sync_every
+		self.sync_interval = sync_interval
+
+		self._event_types = {}
+		self._codecs = {}
+		for event_type in event_types:
+			kind = event_type.KIND
+			if kind in self._event_types:
+				raise ValueError("Event types %s and %s share KIND %s" % (
+					self._event_types[kind].__name__, event_type.__name__, kind))
+			self._event_types[kind] = event_type
+			event_format = getattr(event_type, 'FORMAT', None)
+			self._codecs[event_type] = struct.Struct(event_format) if event_format else None
+
+		self._lock = threading.Lock()
+		self._buffer = []
+		self._buffered_since = None
+		self._file = None
+		os.makedirs(directory, exist_ok=True)
+		self._segments = self._list_segments()
+		self.sequence = self._recover()
+
+	def __enter__(self) -> 'EventLog':
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def append(self, event: NamedTuple) -> int:
+		"""
+		Buffers event, returning its sequence number.
+		"""
+		if type(event) not in self._codecs:
+			raise ValueError("Unknown event type %s" % type(event).__name__)
+		with self._lock:
+			if self._file is None:
+				raise RuntimeError("Cannot append to a closed EventLog.")
+			self._buffer.append(event)
+			self.sequence += 1
+			sequence = self.sequence
+			if self._buffered_since is None:
+				self._buffered_since = time.monotonic()
+			if len(self._buffer) >= self.sync_every \
+					or time.monotonic() - self._buffered_since >= self.sync_interval:
+				self._flush()
+		return sequence
+
+	def append_many(self, events: Iterable[NamedTuple]) -> int:
+		"""
+		Buffers events and flushes them, returning the last sequence number.
+		"""
+		events = list(events)
+		unknown = {type(event) for event in events} - self._codecs.keys()
+		if unknown:
+			raise ValueError("Unknown event types %s" % ", ".join(
+				sorted(event_type.__name__ for event_type in unknown)))
+		with self._lock:
+			if self._file is None:
+				raise RuntimeError("Cannot append to a closed EventLog.")
+			self._buffer.extend(events)
+			self.sequence += len(events)
+			self._flush()
+			return self.sequence
+
+	def flush(self):
+		"""
+		Writes and fsyncs the buffered events.
+		"""
+		with self._lock:
+			if self._file is not None:
+				self._flush()
+
+	def close(self):
+		with self._lock:
+			if self._file is not None:
+				self._flush()
+				self._file.close()
+				self._file = None
+
+	def replay(self, after: int = 0) -> Iterator[Frame]:
+		"""
+		Yields the stored events with a sequence number above after, one
+		Frame per run of same type events. Events still buffered are not
+		included, flush() first to see them.
+		"""
+		segments = self._segments
+		for index, segment in enumerate(segments):
+			if index + 1 < len(segments) and segments[index + 1].first_sequence <= after + 1:
+				continue
+			with open(segment.path, 'rb') as segment_file:
+				data = memoryview(segment_file.read())
+			sequence, offset = segment.first_sequence, 0
+			for offset, kind, count, end in _scan_frames(data):
+				if sequence + count > after + 1:
+					frame = self._decode(sequence, kind, count,
+						data[offset + FRAME_HEADER.size:end])
+					skip = after + 1 - sequence
+					if skip > 0:
+						frame = Frame(after + 1, frame.event_type, frame.records[skip:])
+					yield frame
+				sequence += count
+				offset = end
+			if offset != len(data) and index + 1 < len(segments):
+				raise EventLogCorruptedException(
+					"Corrupted frame in %s at byte %d" % (segment.path, offset))
+
+	def events(self, after: int = 0) -> Iterator[Tuple[int, NamedTuple]]:
+		"""
+		(sequence number, event) for every stored event above after, see
+		replay, which is much faster for large logs.
+		"""
+		for frame in self.replay(after):
+			make = frame.event_type._make
+			for sequence, record in enumerate(frame.records, frame.sequence):
+				yield sequence, make(record)
+
+	def save_snapshot(self, sequence: int, state, keep: int = 2) -> str:
+		"""
+		Stores state (anything json can encode) as of sequence number
+		sequence, keeping only the latest keep snapshots. The file is
+		written aside and renamed, so a crash leaves the previous
+		snapshot in place.
+		"""
+		path = os.path.join(self.directory, "%s%020d%s" % (SNAPSHOT_PREFIX, sequence, SNAPSHOT_SUFFIX))
+		temporary_path = path + '.tmp'
+		with open(temporary_path, 'w') as snapshot_file:
+			snapshot_file.write(json_dumps({"sequence": sequence, "state": state}))
+			snapshot_file.flush()
+			os.fsync(snapshot_file.fileno())
+		os.replace(temporary_path, path)
+		sync_directory(self.directory)
+		for old_path in self._snapshot_paths()[:-keep]:
+			os.remove(old_path)
+		return path
+
+	def load_snapshot(self) -> Optional[Tuple[int, object]]:
+		"""
+		(sequence, state) from the latest snapshot, None when there is none.
+		"""
+		paths = self._snapshot_paths()
+		if not paths:
+			return None
+		with open(paths[-1], 'rb') as snapshot_file:
+			snapshot = json_loads(snapshot_file.read())
+		return snapshot["sequence"], snapshot["state"]
+
+	#########
+	# Helpers
+	def _flush(self):
+		if not self._buffer:
+			return
+		first_sequence = self.sequence - len(self._buffer) + 1
+		if self._file.tell() >= self.segment_size:
+			self._start_segment(first_sequence)
+		chunks = []
+		for event_type, run in groupby(self._buffer, type):
+			codec = self._codecs[event_type]
+			if codec is None:
+				records = [list(event) for event in run]
+				payload = json_dumps(records).encode()
+			else:
+				records = list(run)
+				payload = _pack_many(codec, records)
+			kind, count = event_type.KIND, len(records)
+			chunks.append(FRAME_HEADER.pack(len(payload), _frame_crc(kind, count, payload), kind, count))
+			chunks.append(payload)
+		self._file.write(b''.join(chunks))
+		self._file.flush()
+		os.fsync(self._file.fileno())
+		self._buffer = []
+		self._buffered_since = None
+
+	def _decode(self, sequence: int, kind: int, count: int, payload) -> Frame:
+		event_type = self._event_types.get(kind)
+		if event_type is None:
+			raise EventLogCorruptedException("Unknown event kind %s at sequence %d" % (kind, sequence))
+		codec = self._codecs[event_type]
+		if codec is None:
+			records = json_loads(bytes(payload))
+		else:
+			records = list(codec.iter_unpack(payload))
+		return Frame(sequence, event_type, records)
+
+	def _list_segments(self) -> List[_Segment]:
+		return sorted(_Segment(int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(self.directory, name))
+			for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+
+	def _recover(self) -> int:
+		"""
+		Opens the last segment for appending, after cutting off a torn
+		tail, and returns the last sequence number written.
+		"""
+		if not self._segments:
+			self._start_segment(1)
+			return 0
+		segment = self._segments[-1]
+		with open(segment.path, 'rb') as segment_file:
+			data = memoryview(segment_file.read())
+		sequence, valid_end = segment.first_sequence - 1, 0
+		for _, _, count, end in _scan_frames(data):
+			sequence += count
+			valid_end = end
+		self._file = open(segment.path, 'ab')
+		if valid_end != len(data):
+			self._file.truncate(valid_end)
+			os.fsync(self._file.fileno())
+		return sequence
+
+	def _start_segment(self, first_sequence: int):
+		if self._file is not None:
+			self._file.close()
+		path = os.path.join(self.directory, "%020d%s" % (first_sequence, SEGMENT_SUFFIX))
+		self._file = open(path, 'ab')
+		self._segments.append(_Segment(first_sequence, path))
+		sync_directory(self.directory)
+
+	def _snapshot_paths(self) -> List[str]:
+		return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+			if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX))
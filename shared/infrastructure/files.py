@@ -0,0 +1,18 @@
+import os
+
+
+def sync_directory(path: str):
+	"""
+	fsyncs the directory at path so new file names in it survive a crash,
+	where the platform allows it.
+	"""
+	try:
+		directory = os.open(path, os.O_RDONLY)
+	except OSError:
+		return
+	try:
+		os.fsync(directory)
+	except OSError:
+		pass
+	finally:
+		os.close(directory)
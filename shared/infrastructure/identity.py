@@ -0,0 +1,178 @@
+"""
+Per-request identity map and unit of work.
+
+While an IdentityMap is current (see IdentityMap.__enter__), repositories
+hand out one shared instance per (model class, pk): every comment by the
+same user holds the same User, every view of a post the same Post, and
+objects already loaded are not queried again. Memory and construction
+time then scale with the number of distinct entities in the request,
+not the number of references to them.
+
+The map is held in a contextvar, so each thread (or asyncio task) has its
+own current map.
+"""
+import contextvars
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+from shared.domain.models import BaseDomainModel
+
+_current_identity_map = contextvars.ContextVar('identity_map', default=None)
+
+
+def current_identity_map() -> Optional['IdentityMap']:
+	return _current_identity_map.get()
+
+
+def identities(model_cls: type) -> Dict[int, BaseDomainModel]:
+	"""
+	The current identity map's pk -> instance dict for model_cls, or a
+	new empty dict when there is no current map (so instances are still
+	shared within one result).
+	"""
+	identity_map = _current_identity_map.get()
+	return identity_map.models(model_cls) if identity_map is not None else {}
+
+
+class IdentityMap:
+	"""
+	One shared instance per (model class, pk) for the length of a request.
+
+	Usage:
+
+		with IdentityMap():
+			detail = service.get_post_by_pk(1)
+	"""
+	def __init__(self):
+		self._models = {}
+		self._tokens = []
+
+	def __enter__(self) -> 'IdentityMap':
+		self._tokens.append(_current_identity_map.set(self))
+		return self
+
+	def __exit__(self, *exc_info):
+		_current_identity_map.reset(self._tokens.pop())
+
+	def __len__(self):
+		return sum(len(models) for models in self._models.values())
+
+	def __iter__(self) -> Iterator[BaseDomainModel]:
+		for models in self._models.values():
+			yield from models.values()
+
+	def models(self, model_cls: type) -> Dict[int, BaseDomainModel]:
+		"""
+		The pk -> instance dict for model_cls.
+		"""
+		models = self._models.get(model_cls)
+		if models is None:
+			models = self._models[model_cls] = {}
+		return models
+
+	def get(self, model_cls: type, pk: int) -> Optional[BaseDomainModel]:
+		models = self._models.get(model_cls)
+		return models.get(pk) if models is not None else None
+
+	def add(self, model: BaseDomainModel) -> BaseDomainModel:
+		"""
+		Returns the instance already mapped for model's class and pk, or
+		maps model and returns it.
+		"""
+		if model.pk is None:
+			raise ValueError("Only stored objects (with a pk) can be mapped, got %s" % model)
+		models = self.models(type(model))
+		mapped = models.get(model.pk)
+		if mapped is None:
+			models[model.pk] = mapped = model
+		return mapped
+
+
+class UnitOfWork:
+	"""
+	Collects the writes of a request and flushes them together on commit:
+	new objects through each repository's add_many, and only the mapped
+	objects that actually changed (see BaseDomainModel.changed_fields)
+	through update_many (or update), which write just their changed
+	fields. Nothing is written if commit isn't called.
+
+	Usage:
+
+		with UnitOfWork({Post: post_repository, Comment: comment_repository}) as uow:
+			post = post_repository.get(1)
+			post.update(updated_by=moderator, status='a')
+			uow.add(Comment(post=post, user=moderator, body="Archived, see #12"))
+			uow.commit()
+
+	Parameters
+	----------
+	repositories: Mapping[type, Repository]
+		model class -> the repository storing it. Flushed in this order,
+		so list referenced models (eg. User) before the ones holding them.
+	identity_map: IdentityMap, optional
+		Made current while the unit of work is entered, a new one by default
+	"""
+	def __init__(self, repositories: Mapping[type, object], identity_map: IdentityMap = None):
+		self._repositories = dict(repositories)
+		self.identity_map = identity_map if identity_map is not None else IdentityMap()
+		self._new = []
+
+	def __enter__(self) -> 'UnitOfWork':
+		self.identity_map.__enter__()
+		return self
+
+	def __exit__(self, *exc_info):
+		self.identity_map.__exit__(*exc_info)
+
+	def add(self, model: BaseDomainModel) -> BaseDomainModel:
+		"""
+		Registers a new object to be stored on commit.
+		"""
+		if type(model) not in self._repositories:
+			raise ValueError("No repository registered for %s" % type(model).__name__)
+		self._new.append(model)
+		return model
+
+	def dirty(self) -> List[Tuple[BaseDomainModel, List[str]]]:
+		"""
+		(model, changed field names) for every mapped model that changed.
+		"""
+		dirty = []
+		for model in self.identity_map:
+			changed_fields = model.changed_fields()
+			if changed_fields:
+				dirty.append((model, changed_fields))
+		return dirty
+
+	def commit(self) -> Dict[str, int]:
+		"""
+		Flushes new and changed objects, one batch per model class.
+		Returns {"added": <count>, "updated": <count>}.
+		"""
+		dirty = [model for model, _ in self.dirty()]
+		unregistered = {type(model).__name__ for model in dirty} \
+			- {model_cls.__name__ for model_cls in self._repositories}
+		if unregistered:
+			raise ValueError("Changed objects with no repository registered: %s"
+				% ", ".join(sorted(unregistered)))
+
+		added = updated = 0
+		for model_cls, repository in self._repositories.items():
+			new = [model for model in self._new if type(model) is model_cls]
+			if new:
+				repository.add_many(new)
+				for model in new:
+					self.identity_map.add(model)
+				added += len(new)
+
+			changed = [model for model in dirty if type(model) is model_cls]
+			if changed:
+				update_many = getattr(repository, 'update_many', None)
+				if update_many is not None:
+					update_many(changed)
+				else:
+					for model in changed:
+						repository.update(model)
+				updated += len(changed)
+
+		self._new = []
+		return {"added": added, "updated": updated}
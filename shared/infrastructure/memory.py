@@ -0,0 +1,161 @@
+import asyncio
+import itertools
+from typing import Callable, Iterable, List, Union
+
+from shared.application.locks import StripedLock
+from shared.domain.models import BaseDomainModel, DomainModelNotFoundException
+from shared.infrastructure.identity import current_identity_map
+
+
+class InMemoryRepository:
+	"""
+	Dict backed storage for domain objects keyed by pk. New objects
+	without a pk are given the next free one.
+
+	Meant to be mixed in ahead of a RepositoryInterface, eg.
+
+		class InMemoryPostRepository(InMemoryRepository, PostRepositoryInterface):
+			...
+
+	Objects got while an IdentityMap is current are added to it, so a
+	UnitOfWork can find the ones that changed.
+	"""
+	# Subclasses set this
+	model = None
+
+	def __init__(self):
+		self._objects = {}
+		self._next_pk = 1
+
+	def __len__(self):
+		return len(self._objects)
+
+	def add(self, model: BaseDomainModel) -> BaseDomainModel:
+		if model.pk is None:
+			model.pk = self._next_pk
+		elif model.pk in self._objects:
+			raise ValueError("%s with pk %s already exists." % (model.__class__.__name__, model.pk))
+		self._next_pk = max(self._next_pk, model.pk + 1)
+		self._objects[model.pk] = model
+		model.mark_clean()
+		return model
+
+	def add_many(self, models: Iterable[BaseDomainModel]) -> List[BaseDomainModel]:
+		return [self.add(model) for model in models]
+
+	def get(self, pk: int) -> BaseDomainModel:
+		try:
+			model = self._objects[pk]
+		except KeyError:
+			raise DomainModelNotFoundException(
+				"%s with pk %s does not exist." % (self.model.__name__, pk)) from None
+		model = self._hand_out([model])[0]
+		identity_map = current_identity_map()
+		if identity_map is not None:
+			model = identity_map.add(model)
+		return model
+
+	def get_many(self, pks: Iterable[int]) -> List[BaseDomainModel]:
+		"""
+		The stored objects with these pks, missing ones are left out.
+		"""
+		models = self._hand_out([self._objects[pk] for pk in dict.fromkeys(pks) if pk in self._objects])
+		identity_map = current_identity_map()
+		if identity_map is not None:
+			models = [identity_map.add(model) for model in models]
+		return models
+
+	def _hand_out(self, models: List[BaseDomainModel]) -> List[BaseDomainModel]:
+		"""
+		What callers get for stored models: the stored ones themselves,
+		unless overridden (eg. to hand out copies).
+		"""
+		return models
+
+
+class ConcurrentInMemoryRepository(InMemoryRepository):
+	"""
+	InMemoryRepository safe to share between threads, eg. the workers of
+	a threaded server, without one lock around every call.
+
+	add takes no lock: pks come from an itertools.count and an object is
+	only stored by dict.setdefault, both atomic in CPython, so threads
+	adding at once never get the same pk. Gets are single dict lookups
+	and need no lock either. Writes that read then modify one object
+	(eg. update) lock its pk's stripe of a StripedLock, so only writes to
+	pks sharing a stripe wait on each other.
+
+	Meant to be mixed in behind a concrete in-memory repository, whose
+	own index upkeep then runs on top of the lock-free add, eg.
+
+		class ConcurrentInMemoryUserRepository(InMemoryUserRepository, ConcurrentInMemoryRepository):
+			...
+
+	Parameters
+	----------
+	stripes: int, default to 64
+		Number of locks the pks are spread over
+	"""
+	def __init__(self, stripes: int = 64):
+		super().__init__()
+		self._pks = itertools.count(1)
+		self._stripes = StripedLock(stripes)
+
+	def add(self, model: BaseDomainModel) -> BaseDomainModel:
+		objects = self._objects
+		if model.pk is not None:
+			if model.pk in objects or objects.setdefault(model.pk, model) is not model:
+				raise ValueError("%s with pk %s already exists." % (model.__class__.__name__, model.pk))
+		else:
+			# Skips pks that were given explicitly
+			while True:
+				model.pk = next(self._pks)
+				if objects.setdefault(model.pk, model) is model:
+					break
+		model.mark_clean()
+		return model
+
+
+class AsyncInMemoryRepository:
+	"""
+	Serves an async repository interface from a synchronous in-memory
+	repository, sleeping latency seconds (asyncio.sleep, so other tasks
+	run meanwhile) before every call to stand in for a network round
+	trip. Lets the concurrency of async callers be tested and
+	benchmarked locally.
+
+	Meant to be mixed in ahead of an AsyncRepositoryInterface, eg.
+
+		class AsyncInMemoryPostRepository(AsyncInMemoryRepository, AsyncPostRepositoryInterface):
+			async def get(self, pk: int) -> Post:
+				return await self._call(self.repository.get, pk)
+
+	Parameters
+	----------
+	repository: InMemoryRepository, optional
+		The store the calls are served from, a new one of repository_class
+		when not passed
+	latency: Union[float, Callable[[], float]], default to 0
+		Seconds each call takes, or a function returning them per call
+		(eg. lambda: random.uniform(0.001, 0.005) for jitter)
+	"""
+	repository_class = None
+
+	def __init__(self, repository: InMemoryRepository = None,
+		latency: Union[float, Callable[[], float]] = 0):
+		self.repository = repository if repository is not None else self.repository_class()
+		self.latency = latency
+		# Number of calls made, eg. to count round trips in tests
+		self.calls = 0
+
+	async def add(self, model: BaseDomainModel) -> BaseDomainModel:
+		return await self._call(self.repository.add, model)
+
+	async def get(self, pk: int) -> BaseDomainModel:
+		return await self._call(self.repository.get, pk)
+
+	async def _call(self, method, *args):
+		self.calls += 1
+		latency = self.latency() if callable(self.latency) else self.latency
+		await asyncio.sleep(latency)
+		return method(*args)
@@ -0,0 +1,121 @@
+import datetime
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional
+
+from shared.domain.models import BaseDomainModel, DomainModelNotFoundException
+from shared.domain.references import is_reference, load_reference
+from shared.infrastructure.identity import identities
+
+
+# table -> lock held while its new pks are reserved and inserted
+_INSERT_LOCKS = {}
+
+
+def connect(database: str = ':memory:', **kwargs) -> sqlite3.Connection:
+	"""
+	Opens a connection configured for the sqlite repositories: WAL
+	journaling (for file databases) so readers don't block the writer,
+	foreign keys enforced and a statement cache large enough to keep
+	every repository query prepared.
+	"""
+	kwargs.setdefault('cached_statements', 256)
+	connection = sqlite3.connect(database, **kwargs)
+	connection.execute("PRAGMA journal_mode = WAL")
+	connection.execute("PRAGMA synchronous = NORMAL")
+	connection.execute("PRAGMA foreign_keys = ON")
+	return connection
+
+
+def to_datetime(value: Optional[str]) -> Optional[datetime.datetime]:
+	"""
+	Datetimes are stored as isoformat text.
+	"""
+	return datetime.datetime.fromisoformat(value) if value is not None else None
+
+
+def from_datetime(value: Optional[datetime.datetime]) -> Optional[str]:
+	return value.isoformat() if value is not None else None
+
+
+def to_bool(value: Optional[int]) -> Optional[bool]:
+	return bool(value) if value is not None else None
+
+
+def hydrate_rows(model_cls: type, rows: Iterable[tuple]) -> list:
+	"""
+	model_cls.hydrate_many(rows) through the current identity map: rows
+	whose pk (first value) is already mapped give the mapped instance,
+	the rest are hydrated and mapped. Mapped references (see
+	post_references) are loaded from their row.
+	"""
+	models = identities(model_cls)
+	result, new_rows, new_positions = [], [], []
+	for row in rows:
+		model = models.get(row[0])
+		if model is None or is_reference(model):
+			new_positions.append(len(result))
+			new_rows.append(row)
+		result.append(model)
+	for position, model in zip(new_positions, model_cls.hydrate_many(new_rows)):
+		# A pk repeated within rows maps to its first instance
+		mapped = models.get(model.pk)
+		if mapped is None:
+			models[model.pk] = mapped = model
+		elif is_reference(mapped):
+			# A mapped reference is loaded in place, staying the one instance
+			load_reference(mapped, model)
+		result[position] = mapped
+	return result
+
+
+class SqliteRepository:
+	"""
+	Shared plumbing for sqlite backed repositories.
+
+	Every query is a module level constant so that sqlite3's per
+	connection statement cache keeps it prepared between calls.
+	"""
+	# Subclasses set these
+	table = None
+	model = None
+
+	def __init__(self, connection: sqlite3.Connection):
+		self._connection = connection
+
+	@contextmanager
+	def _inserting(self) -> Iterator[None]:
+		"""
+		The transaction inserts with pks from _assign_pks run in. It starts
+		with BEGIN IMMEDIATE, taking sqlite's write lock before the next
+		free pk is read, so no other connection can insert until the rows
+		are written. Threads sharing a connection share its transaction,
+		so a per table lock keeps them from reserving the same pks.
+		"""
+		with _INSERT_LOCKS.setdefault(self.table, threading.Lock()):
+			with self._connection:
+				if not self._connection.in_transaction:
+					self._connection.execute("BEGIN IMMEDIATE")
+				yield
+
+	def _next_pks(self, count: int) -> Iterable[int]:
+		(max_pk,) = self._connection.execute(
+			"SELECT COALESCE(MAX(pk), 0) FROM %s" % self.table).fetchone()
+		return range(max_pk + 1, max_pk + 1 + count)
+
+	def _assign_pks(self, models: List[BaseDomainModel]):
+		"""
+		Gives pk-less models the next free pks, so bulk inserts can go
+		through executemany (which does not report lastrowid). Only call
+		within _inserting.
+		"""
+		new_models = [model for model in models if model.pk is None]
+		for model, pk in zip(new_models, self._next_pks(len(new_models))):
+			model.pk = pk
+
+	def _one(self, models: list, pk: int) -> BaseDomainModel:
+		if not models:
+			raise DomainModelNotFoundException(
+				"%s with pk %s does not exist." % (self.model.__name__, pk))
+		return models[0]
@@ -0,0 +1,185 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from typing import NamedTuple
+
+from shared.application.locks import ReadWriteLock, StripedLock
+from shared.infrastructure.cache import ResponseCache
+from shared.infrastructure.event_log import EventLog
+
+
+class ResponseCacheTests(unittest.TestCase):
+
+	def test_lru_and_ttl(self):
+		now = [0]
+		cache = ResponseCache(max_entries=2, ttl=10, clock=lambda: now[0])
+		self.assertEqual(cache.get_or_compute('a', lambda: 1), 1)
+		self.assertEqual(cache.get_or_compute('a', lambda: 2), 1)
+		cache.get_or_compute('b', lambda: 2)
+		cache.get_or_compute('a', lambda: None)
+		# b is least recently used
+		cache.get_or_compute('c', lambda: 3)
+		self.assertEqual(cache.get_or_compute('b', lambda: 4), 4)
+
+		now[0] = 10
+		self.assertEqual(cache.get_or_compute('b', lambda: 5), 5)
+		self.assertEqual(cache.stats(), {
+			"entries": 2, "hits": 2, "misses": 5, "evictions": 2, "expirations": 1})
+
+	def test_errors_are_not_cached(self):
+		cache = ResponseCache()
+
+		def fail():
+			raise KeyError('a')
+		with self.assertRaises(KeyError):
+			cache.get_or_compute('a', fail)
+		self.assertEqual(cache.get_or_compute('a', lambda: 1), 1)
+
+	def test_single_flight(self):
+		cache = ResponseCache()
+		computing = threading.Event()
+		release = threading.Event()
+		calls = []
+
+		def compute():
+			calls.append(1)
+			computing.set()
+			release.wait(5)
+			return 'value'
+
+		results = []
+		threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('a', compute)))
+			for _ in range(8)]
+		threads[0].start()
+		computing.wait(5)
+		for thread in threads[1:]:
+			thread.start()
+		release.set()
+		for thread in threads:
+			thread.join(5)
+
+		self.assertEqual(calls, [1])
+		self.assertEqual(results, ['value'] * 8)
+
+
+class Moved(NamedTuple):
+	KIND = 1
+	FORMAT = '<qd'
+
+	pk: int
+	at: float
+
+
+class Renamed(NamedTuple):
+	KIND = 2
+
+	pk: int
+	name: str
+
+
+class EventLogTests(unittest.TestCase):
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.directory = directory.name
+
+	def open_log(self, **kwargs) -> EventLog:
+		event_log = EventLog(self.directory, [Moved, Renamed], **kwargs)
+		self.addCleanup(event_log.close)
+		return event_log
+
+	def test_append_and_replay(self):
+		events = [Moved(1, 0.5), Moved(2, 1.5), Renamed(1, "one"), Moved(3, 2.5)]
+		with self.open_log(sync_every=2, segment_size=1) as event_log:
+			self.assertEqual([event_log.append(event) for event in events], [1, 2, 3, 4])
+		self.assertEqual(len(os.listdir(self.directory)), 2)
+
+		event_log = self.open_log()
+		self.assertEqual(event_log.sequence, 4)
+		self.assertEqual(event_log.append_many([Renamed(3, "three")]), 5)
+		self.assertEqual([(frame.event_type, frame.records) for frame in event_log.replay()], [
+			(Moved, [(1, 0.5), (2, 1.5)]),
+			(Renamed, [[1, "one"]]),
+			(Moved, [(3, 2.5)]),
+			(Renamed, [[3, "three"]]),
+		])
+		self.assertEqual(list(event_log.events(after=3)), [(4, Moved(3, 2.5)), (5, Renamed(3, "three"))])
+		self.assertEqual(list(event_log.events(after=1))[0], (2, Moved(2, 1.5)))
+
+	def test_torn_tail_is_cut_off(self):
+		with self.open_log() as event_log:
+			event_log.append_many([Moved(1, 0.5), Moved(2, 1.5)])
+			event_log.append_many([Renamed(1, "one")])
+		(segment,) = os.listdir(self.directory)
+		path = os.path.join(self.directory, segment)
+		size = os.path.getsize(path)
+		with open(path, 'r+b') as segment_file:
+			segment_file.truncate(size - 3)
+
+		event_log = self.open_log()
+		self.assertEqual(event_log.sequence, 2)
+		event_log.append_many([Renamed(2, "two")])
+		self.assertEqual(list(event_log.events()),
+			[(1, Moved(1, 0.5)), (2, Moved(2, 1.5)), (3, Renamed(2, "two"))])
+
+	def test_snapshots(self):
+		event_log = self.open_log()
+		self.assertIsNone(event_log.load_snapshot())
+		for sequence in (10, 20, 30):
+			event_log.save_snapshot(sequence, {"counts": [[1, sequence]]})
+		self.assertEqual(event_log.load_snapshot(), (30, {"counts": [[1, 30]]}))
+		self.assertEqual(len([name for name in os.listdir(self.directory)
+			if name.startswith("snapshot-")]), 2)
+
+
+class LockTests(unittest.TestCase):
+
+	def test_read_write_lock(self):
+		lock = ReadWriteLock()
+		events = []
+		reading, writer_waiting, release = threading.Event(), threading.Event(), threading.Event()
+
+		def read(name: str, started: threading.Event = None):
+			with lock.read():
+				events.append(name)
+				if started is not None:
+					started.set()
+					release.wait(5)
+
+		def write():
+			writer_waiting.set()
+			with lock.write():
+				events.append("write")
+
+		first = threading.Thread(target=read, args=("read 1", reading))
+		first.start()
+		reading.wait(5)
+		# Readers share the lock
+		read("read 2")
+		writer = threading.Thread(target=write)
+		writer.start()
+		writer_waiting.wait(5)
+		deadline = time.monotonic() + 5
+		while not lock._waiting_writers and time.monotonic() < deadline:
+			time.sleep(0.001)
+		self.assertTrue(lock._waiting_writers)
+		# Once a writer waits, new readers queue behind it
+		late = threading.Thread(target=read, args=("read 3",))
+		late.start()
+		release.set()
+		for thread in (first, writer, late):
+			thread.join(5)
+		self.assertEqual(events, ["read 1", "read 2", "write", "read 3"])
+
+	def test_striped_lock(self):
+		stripes = StripedLock(stripes=4)
+		self.assertIs(stripes.lock_for(5), stripes.lock_for(1))
+		self.assertIsNot(stripes.lock_for(1), stripes.lock_for(2))
+		with stripes.locks_for([1, 5, 2]):
+			self.assertTrue(stripes.lock_for(1).locked())
+			self.assertTrue(stripes.lock_for(2).locked())
+			self.assertFalse(stripes.lock_for(3).locked())
+		self.assertFalse(stripes.lock_for(1).locked())
@@ -1,8 +1,14 @@
 import unittest
 
+from analytics.infrastructure.test import (LastSeenIndexTests, PopularPostsIndexTests,
+	ViewArchiveTests, ViewIngestionPipelineTests, ViewRollupsTests)
 from auth.domain.test import AuthDomainTests
+from blog.application.test import AsyncBlogServiceTests, BlogServiceTests
 from blog.domain.test import BlogDomainTests
+from blog.infrastructure.test import (CachedBlogServiceTests, ConcurrentBlogServiceTests,
+	EventLogBlogServiceTests, ProjectedBlogServiceTests, RollupBlogServiceTests,
+	SearchBlogServiceTests, SqliteBlogServiceTests)
+from shared.infrastructure.test import EventLogTests, LockTests, ResponseCacheTests
 
 if __name__ == "__main__":
 	unittest.main()
-